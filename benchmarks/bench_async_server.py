@@ -0,0 +1,105 @@
+"""Requests/sec of the Flask /chat path versus the async ASGI path, against the stub model.
+
+    python benchmarks/bench_async_server.py --concurrency 32 --requests 400 --latency 0.2
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import statistics
+import threading
+import time
+from collections import Counter
+
+import aiohttp
+
+from stub_llm import install_stub_models
+
+QUESTIONS = ["hello", "give me a cat fact", "tell me about dogs", "I love chimpanzees", "what can you do"]
+
+
+def start_flask(port: int):
+    from werkzeug.serving import make_server
+    import app
+
+    server = make_server("127.0.0.1", port, app.flask_app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.shutdown
+
+
+def start_asgi(port: int, max_concurrent: int):
+    import uvicorn
+    import asgi
+
+    application = asgi.ChatASGIApp(max_concurrent=max_concurrent, queue_timeout=30.0)
+    server = uvicorn.Server(uvicorn.Config(application, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    def stop():
+        server.should_exit = True
+        thread.join()
+    return stop
+
+
+async def drive(url: str, total: int, concurrency: int) -> dict:
+    counter = itertools.count()
+    latencies = []
+    statuses = Counter()
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=120)) as client:
+        async def virtual_user(user_id: int):
+            while (n := next(counter)) < total:
+                started = time.perf_counter()
+                try:
+                    payload = {"userquestion": QUESTIONS[n % len(QUESTIONS)]}
+                    async with client.post(url, json=payload, headers={"X-Session-ID": f"bench-{user_id}"}) as response:
+                        await response.read()
+                        statuses[response.status] += 1
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    statuses[type(e).__name__] += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(virtual_user(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "rps": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "statuses": dict(statuses),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.2, help="stub model latency per call, in seconds")
+    parser.add_argument("--port", type=int, default=5099)
+    args = parser.parse_args()
+
+    install_stub_models(latency=args.latency)
+    logging.disable(logging.INFO)
+
+    results = {}
+    for name, start in (("flask (threaded dev server)", lambda: start_flask(args.port)),
+                        ("asgi (uvicorn, ainvoke)", lambda: start_asgi(args.port + 1, args.concurrency))):
+        stop = start()
+        port = args.port if name.startswith("flask") else args.port + 1
+        try:
+            results[name] = asyncio.run(drive(f"http://127.0.0.1:{port}/chat", args.requests, args.concurrency))
+        finally:
+            stop()
+
+    print(f"{args.requests} requests, {args.concurrency} concurrent clients, stub latency {args.latency * 1000:.0f} ms")
+    for name, result in results.items():
+        print(f"{name:30} {result['rps']:8.1f} req/s  p50 {result['p50_ms']:7.1f} ms  p95 {result['p95_ms']:7.1f} ms  {result['statuses']}")
+
+
+if __name__ == "__main__":
+    main()
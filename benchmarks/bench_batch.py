@@ -0,0 +1,63 @@
+"""Throughput of a sequential query_chat_api loop versus query_chat_api_batch, against the stub model.
+
+    python benchmarks/bench_batch.py --items 200 --latency 0.05 --workers 8
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+
+from stub_llm import install_stub_models
+
+QUESTIONS = ["hello", "give me a cat fact", "tell me about dogs", "I love chimpanzees", "what can you do"]
+
+
+def start_flask(port: int):
+    from werkzeug.serving import make_server
+    import app
+
+    server = make_server("127.0.0.1", port, app.flask_app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.shutdown
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05, help="stub model latency per call, in seconds")
+    parser.add_argument("--workers", type=int, default=8, help="BATCH_WORKERS on the server")
+    parser.add_argument("--batch-size", type=int, default=100, help="items per /chat/batch call")
+    parser.add_argument("--port", type=int, default=5097)
+    args = parser.parse_args()
+
+    install_stub_models(latency=args.latency)
+    os.environ["BATCH_WORKERS"] = str(args.workers)
+    os.environ["API_URL"] = f"http://127.0.0.1:{args.port}/chat"
+    logging.disable(logging.INFO)
+    stop = start_flask(args.port)
+
+    import api_client
+
+    # Distinct questions so neither run is helped by the routing cache
+    questions = [f"{QUESTIONS[n % len(QUESTIONS)]} (item {n})" for n in range(args.items)]
+    try:
+        started = time.perf_counter()
+        sequential = [api_client.query_chat_api(question) for question in questions]
+        sequential_elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        batched = api_client.query_chat_api_batch(questions, batch_size=args.batch_size)
+        batch_elapsed = time.perf_counter() - started
+    finally:
+        stop()
+
+    sequential_errors = sum(1 for result in sequential if "error" in result)
+    batch_errors = sum(1 for result in batched if "error" in result)
+    print(f"{args.items} questions, stub latency {args.latency * 1000:.0f} ms, {args.workers} batch workers, {args.batch_size} items per call")
+    print(f"{'sequential /chat loop':24} {args.items / sequential_elapsed:8.1f} questions/s  {sequential_elapsed:7.2f} s  {sequential_errors} errors")
+    print(f"{'/chat/batch':24} {args.items / batch_elapsed:8.1f} questions/s  {batch_elapsed:7.2f} s  {batch_errors} errors")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Bytes written per turn and resume latency of the conversation checkpointer, against rewriting the whole state.
+
+    python benchmarks/bench_checkpoints.py --messages 10,100,200
+
+Runs one conversation per length through the compiled graph of src/app.py, checkpointed to a SQLite file in a
+temporary directory (SESSION_BACKEND=sqlite). For the turn that brings the conversation to each length it reports:
+  bytes/turn    row payload bytes the turn wrote; "full state" is what the previous session backend wrote,
+                the whole state as one JSON row
+  resume cold   loading the thread with nothing cached, as a freshly started process does
+  resume warm   loading it again in the process that wrote it, as the next turn does
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+from stub_llm import install_stub_models
+
+QUESTIONS = [
+    "Tell me something about cats.",
+    "What do dogs like to eat?",
+    "How long do monkeys live?",
+    "Hello, how are you today?",
+]
+
+
+def median_ms(call, repeats: int) -> float:
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", default="10,100,200", help="conversation lengths to measure")
+    parser.add_argument("--reply-words", type=int, default=60, help="words in each stub reply")
+    parser.add_argument("--repeats", type=int, default=20, help="resumes per length; the median is reported")
+    args = parser.parse_args()
+    lengths = [int(length) for length in args.messages.split(",")]
+
+    workdir = tempfile.mkdtemp(prefix="bench_checkpoints_")
+    path = os.path.join(workdir, "sessions.db")
+    os.environ.update({"SESSION_BACKEND": "sqlite", "SESSION_DB_PATH": path, "SESSION_MAX_MESSAGES": str(max(lengths))})
+    install_stub_models(latency=0.0, reply_words=args.reply_words)
+    logging.disable(logging.WARNING)
+    from langchain.schema import HumanMessage, messages_from_dict, messages_to_dict
+    from orchestrator.checkpoints import SQLiteDeltaSaver
+    import app
+
+    saver = app.session_store.checkpointer
+    print(f"{args.reply_words}-word replies, checkpoints in {path}")
+    print(f"{'messages':>8}  {'bytes/turn':>10}  {'full state':>10}  {'resume cold':>11}  {'warm':>8}  {'full state':>10}")
+    for length in lengths:
+        config = {"configurable": {"thread_id": f"bench-{length}"}}
+        for turn in range(length // 2):
+            written = saver.stats()["bytes_written"]
+            app.app.invoke({"messages": [HumanMessage(content=f"{QUESTIONS[turn % len(QUESTIONS)]} ({turn})")]}, config)
+        delta_bytes = saver.stats()["bytes_written"] - written
+
+        state = app.app.get_state(config).values
+        full_row = json.dumps({**state, "messages": messages_to_dict(state["messages"])})
+        cold = median_ms(lambda: SQLiteDeltaSaver(path).get_tuple(config), args.repeats)
+        # Opening the file is part of a cold start but not of a resume; take it out of the cold figure
+        cold -= median_ms(lambda: SQLiteDeltaSaver(path), args.repeats)
+        warm = median_ms(lambda: saver.get_tuple(config), args.repeats)
+        full_load = median_ms(lambda: messages_from_dict(json.loads(full_row)["messages"]), args.repeats)
+        print(f"{len(state['messages']):8d}  {delta_bytes:10d}  {len(full_row.encode()):10d}  {cold:8.2f} ms  {warm:5.2f} ms  {full_load:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
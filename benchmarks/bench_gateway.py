@@ -0,0 +1,123 @@
+"""Burst of model calls against an upstream that enforces a rate limit, with and without the model gateway.
+
+    python benchmarks/bench_gateway.py --calls 100 --distinct 70 --rpm 60
+
+The simulated upstream admits `--rpm` requests per minute (a full minute's worth may come at once) and answers
+anything beyond that with a 429, as Groq does. `--calls` concurrent callers send `--distinct` different
+prompts, so identical prompts overlap the way retries, double submits and popular questions do. Without
+the gateway every call goes upstream and the excess fails; with it, identical calls share one upstream
+request and the rest queue for their turn.
+"""
+import argparse
+import statistics
+import threading
+import time
+
+from stub_llm import STUB_SETTINGS, StubChatModel, install_stub_models
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+class StrictUpstream(StubChatModel):
+    """Stub model that rejects requests above its rate, like a provider's API would."""
+
+    def __init__(self, rpm: float, **kwargs):
+        super().__init__(**kwargs)
+        self.rate = rpm / 60.0
+        self.capacity = float(rpm)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def invoke(self, prompt, config=None, **kwargs):
+        with self.lock:
+            now = time.monotonic()
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.level < 1:
+                self.rejected += 1
+                raise RateLimited("429 Too Many Requests")
+            self.level -= 1
+        return super().invoke(prompt, config, **kwargs)
+
+
+def run(args, gateway: bool) -> dict:
+    from config.gateway import ModelGateway
+    from config.models import ModelRegistry
+
+    upstream = StrictUpstream(args.rpm, model_name="strict")
+    limits = {"default": {"requests_per_minute": args.rpm * args.headroom}}
+    registry = ModelRegistry(
+        {"defaults": {"model_name": "strict"}, "models": {"cat": {}}},
+        factory=lambda http_client, http_async_client, **settings: upstream,
+        gateway=ModelGateway(limits, max_wait=args.max_wait) if gateway else ModelGateway(coalesce=False),
+    )
+    model = registry.get("cat")
+    latencies, failures = [], []
+    lock = threading.Lock()
+    start = threading.Barrier(args.calls)
+
+    def caller(n: int) -> None:
+        start.wait()
+        started = time.perf_counter()
+        try:
+            model.invoke(f"Tell me a fact about cats, number {n % args.distinct}")
+        except Exception as e:
+            with lock:
+                failures.append(type(e).__name__)
+            return
+        with lock:
+            latencies.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=caller, args=(n,)) for n in range(args.calls)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "answered": len(latencies),
+        "failed": len(failures),
+        "upstream_calls": upstream.calls + upstream.rejected,
+        "upstream_429s": upstream.rejected,
+        "p50": statistics.median(latencies) if latencies else 0.0,
+        "p95": latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0,
+        "elapsed": elapsed,
+        "gateway": registry.gateway.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=100, help="concurrent callers")
+    parser.add_argument("--distinct", type=int, default=70, help="distinct prompts among them")
+    parser.add_argument("--rpm", type=float, default=60, help="upstream requests per minute")
+    parser.add_argument("--latency", type=float, default=0.2, help="upstream seconds per call")
+    parser.add_argument("--headroom", type=float, default=0.95,
+                        help="fraction of the upstream limit the gateway is configured with; requests reach the upstream a little after the gateway admits them")
+    parser.add_argument("--max-wait", type=float, default=30.0, help="longest a call may queue for the rate limit")
+    args = parser.parse_args()
+
+    install_stub_models(latency=args.latency)
+    STUB_SETTINGS["latency"] = args.latency
+    print(f"{args.calls} concurrent calls, {args.distinct} distinct prompts, upstream limit {args.rpm:g} requests/min, {args.latency}s per call")
+    for gateway in (False, True):
+        result = run(args, gateway)
+        print(
+            f"gateway {'on ' if gateway else 'off'}  answered {result['answered']:4d}  failed {result['failed']:4d}  "
+            f"upstream calls {result['upstream_calls']:4d} ({result['upstream_429s']} got 429)  "
+            f"p50 {result['p50'] * 1000:7.0f} ms  p95 {result['p95'] * 1000:7.0f} ms  wall {result['elapsed']:.2f}s"
+        )
+        if gateway:
+            stats = result["gateway"]
+            model = stats["models"].get("strict", {})
+            print(f"             coalesced {stats['coalesced']}, queued {model.get('delayed', 0)} for {model.get('wait_seconds', 0):.2f}s in total, rejected {model.get('rejected', 0)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Per-request cost of logging in the Flask /chat route of src/app.py, with long questions and answers.
+
+    python benchmarks/bench_logging.py --requests 400 --threads 8
+    python benchmarks/bench_logging.py --src /path/to/other/checkout/src   # compare another version
+
+Each configuration runs in its own process, with stderr sent to a file as it would be under a process
+manager: once with logging as the app configures it and once with logging disabled. Besides the
+end-to-end difference, the time request threads spend inside logger calls is measured directly, which
+is far less noisy on a busy host.
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_child(args) -> None:
+    from stub_llm import install_stub_models
+
+    install_stub_models(latency=0.0, reply_words=args.reply_words)
+    sys.path.insert(0, args.src)
+    os.environ["SESSION_BACKEND"] = "memory"
+    import app
+
+    if args.mode == "off":
+        logging.disable(logging.CRITICAL)
+    # Time spent in logger calls on the request threads (formatting, filters, and any synchronous writes)
+    in_logging = [0.0]
+    log_call = logging.Logger._log
+
+    def timed_log(self, *log_args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return log_call(self, *log_args, **kwargs)
+        finally:
+            in_logging[0] += time.perf_counter() - started
+
+    logging.Logger._log = timed_log
+    client = app.flask_app.test_client()
+    question = "tell me about cats " + "and their whiskers " * (args.question_chars // 19)
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(n: int) -> None:
+        for i in range(args.requests // args.threads):
+            started = time.perf_counter()
+            client.post("/chat", json={"userquestion": question}, headers={"X-Session-ID": f"bench-{n}-{i % 4}"})
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+
+    worker(0)  # warm-up
+    latencies.clear()
+    in_logging[0] = 0.0
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    logging.shutdown()
+    log_bytes = sum(os.path.getsize(name) for name in os.listdir(".") if name.startswith("multi_agent_orchestrator.log"))
+    print(json.dumps({"mean_ms": statistics.mean(latencies) * 1000, "p50_ms": statistics.median(latencies) * 1000,
+                      "in_logging_ms": in_logging[0] / len(latencies) * 1000, "throughput": len(latencies) / elapsed,
+                      "log_bytes": log_bytes}))
+
+
+def measure(args, mode: str) -> dict:
+    with tempfile.TemporaryDirectory() as workdir, open(os.path.join(workdir, "stderr.log"), "w") as stderr:
+        command = [sys.executable, os.path.abspath(__file__), "--child", "--mode", mode, "--src", args.src,
+                   "--requests", str(args.requests), "--threads", str(args.threads),
+                   "--question-chars", str(args.question_chars), "--reply-words", str(args.reply_words)]
+        env = {**os.environ, "PYTHONPATH": BENCH_DIR}
+        output = subprocess.run(command, cwd=workdir, stdout=subprocess.PIPE, stderr=stderr, env=env, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        result["stderr_bytes"] = os.path.getsize(stderr.name)
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--src", default=os.path.join(os.path.dirname(BENCH_DIR), "src"))
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--question-chars", type=int, default=2000, help="length of each question")
+    parser.add_argument("--reply-words", type=int, default=600, help="filler words in each stub answer")
+    parser.add_argument("--repeats", type=int, default=3, help="runs per configuration; the best one is kept")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--mode", default="on", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.src = os.path.abspath(args.src)
+    if args.child:
+        run_child(args)
+        return
+
+    print(f"{args.src}: {args.requests} requests on {args.threads} threads, {args.question_chars}-char questions, {args.reply_words}-word answers")
+    results = {}
+    for mode in ("off", "on"):
+        runs = [measure(args, mode) for _ in range(args.repeats)]
+        results[mode] = min(runs, key=lambda run: run["mean_ms"])
+        run = results[mode]
+        print(f"logging {mode:3}  mean {run['mean_ms']:7.2f} ms  p50 {run['p50_ms']:7.2f} ms  {run['throughput']:7.1f} req/s  "
+              f"in logger calls {run['in_logging_ms']:6.3f} ms/request  "
+              f"log file {run['log_bytes'] / 1024:8.1f} KB  stderr {run['stderr_bytes'] / 1024:8.1f} KB")
+    overhead = results["on"]["mean_ms"] - results["off"]["mean_ms"]
+    print(f"logging overhead: {overhead:.2f} ms per request end to end, {results['on']['in_logging_ms']:.3f} ms of it in logger calls on the request thread")
+
+
+if __name__ == "__main__":
+    main()
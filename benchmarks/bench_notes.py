@@ -0,0 +1,100 @@
+"""Build, cold-start and query times of the notes index over a generated vault.
+
+    python benchmarks/bench_notes.py --notes 20000 --queries 200
+
+Notes are written to a temporary directory (or --vault) with tags, wikilinks and a vocabulary
+skewed like natural text, so some query terms are rare and others appear in most notes.
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from minions.notes_index import NotesIndex
+
+TOPICS = ["python", "gardening", "meeting", "recipe", "travel", "budget", "reading", "fitness", "project", "music"]
+
+
+def write_vault(vault: str, notes: int, seed: int = 7) -> None:
+    rng = random.Random(seed)
+    vocabulary = [f"word{n}" for n in range(20000)]
+    # Zipf-like weights: a few words are everywhere, most are rare
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    for n in range(notes):
+        folder = os.path.join(vault, TOPICS[n % len(TOPICS)])
+        os.makedirs(folder, exist_ok=True)
+        words = rng.choices(vocabulary, weights, k=rng.randint(80, 400))
+        topic = TOPICS[n % len(TOPICS)]
+        links = " ".join(f"[[{TOPICS[rng.randrange(len(TOPICS))]}/note {rng.randrange(notes)}]]" for _ in range(3))
+        body = f"# {topic} note {n}\n\n#{topic} #{rng.choice(TOPICS)}\n\n{' '.join(words)}\n\nSee also {links}\n"
+        with open(os.path.join(folder, f"note {n}.md"), "w", encoding="utf-8") as f:
+            f.write(body)
+
+
+def percentile(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--vault", help="existing vault to index instead of a generated one")
+    args = parser.parse_args()
+
+    vault = args.vault or tempfile.mkdtemp(prefix="notes-vault-")
+    index_path = os.path.join(tempfile.mkdtemp(prefix="notes-index-"), "index.db")
+    try:
+        if not args.vault:
+            started = time.perf_counter()
+            write_vault(vault, args.notes)
+            print(f"Generated {args.notes} notes in {time.perf_counter() - started:.1f}s")
+
+        index = NotesIndex(vault, index_path=index_path, refresh_interval=3600)
+        started = time.perf_counter()
+        index.search("python")
+        print(f"cold build             {time.perf_counter() - started:8.2f} s  ({os.path.getsize(index_path) / 1e6:.1f} MB index)")
+
+        # A restarted server answers from the persisted index while it rescans the vault in the background
+        index = NotesIndex(vault, index_path=index_path, refresh_interval=3600)
+        started = time.perf_counter()
+        index.search("python")
+        print(f"first query on restart {(time.perf_counter() - started) * 1000:8.1f} ms")
+        started = time.perf_counter()
+        index.refresh()
+        print(f"rescan, nothing changed {time.perf_counter() - started:7.2f} s")
+
+        rng = random.Random(11)
+        queries = [f"{rng.choice(TOPICS)} word{rng.randrange(2000)} word{rng.randrange(20)}" for _ in range(args.queries)]
+        latencies = []
+        for query in queries:
+            started = time.perf_counter()
+            index.search(query, k=5)
+            latencies.append(time.perf_counter() - started)
+        print(f"search (k=5)           p50 {percentile(latencies, 0.5) * 1000:6.1f} ms  p99 {percentile(latencies, 0.99) * 1000:6.1f} ms")
+
+        started = time.perf_counter()
+        links = index.backlinks(f"{TOPICS[0]}/note 0")
+        print(f"backlinks              {(time.perf_counter() - started) * 1000:8.3f} ms  ({len(links)} notes)")
+
+        title = f"{TOPICS[1]}/note 1"
+        with open(index.path_for(title), "a", encoding="utf-8") as f:
+            f.write("\nfreshly added zebracorn paragraph\n")
+        started = time.perf_counter()
+        index.update(title)
+        print(f"update after save      {(time.perf_counter() - started) * 1000:8.3f} ms  (found: {index.search('zebracorn')[0].title})")
+        print(f"stats: {index.stats()}")
+    finally:
+        if not args.vault:
+            shutil.rmtree(vault, ignore_errors=True)
+        shutil.rmtree(os.path.dirname(index_path), ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Prompt build time as the chat history grows: the compiled ChatPrompt against formatting a ChatPromptTemplate.
+
+    python benchmarks/bench_prompts.py --messages 0,10,50,200,1000
+
+Builds the input of one minion call (system prompt, chat history, question) for histories of alternating
+questions and ~60-word answers. For each length it reports:
+  template.format    what the minions used to send: the template rendered into one string, which the
+                     model then wraps as a single human message
+  messages_for       the compiled prompt's message list: the shared system message, the history
+                     messages, and a new message for the question
+  chars rendered     characters built for the call, which is everything with format() and only the
+                     question with messages_for()
+  prefix stable      whether the first message sent is byte-identical to the previous turn's
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from langchain.schema import AIMessage, HumanMessage, SystemMessage
+from langchain_core.prompts import ChatPromptTemplate, HumanMessagePromptTemplate, MessagesPlaceholder
+
+from minions.prompts import ChatPrompt
+
+SYSTEM_PROMPT = "You are a friendly AI assistant who loves to talk about cats."
+ANSWER = " ".join(["Cats are crepuscular, so they are most active around dawn and dusk."] * 5)
+
+
+def history(length: int) -> list:
+    return [
+        HumanMessage(content=f"Question {n} about cats?") if n % 2 == 0 else AIMessage(content=f"{ANSWER} ({n})")
+        for n in range(length)
+    ]
+
+
+def per_call_us(call, calls: int, repeats: int) -> float:
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(calls):
+            call()
+        samples.append((time.perf_counter() - started) / calls)
+    return statistics.median(samples) * 1e6
+
+
+def first_message(prompt_input) -> str:
+    return prompt_input if isinstance(prompt_input, str) else prompt_input[0].content
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", default="0,10,50,200,1000", help="history lengths to measure")
+    parser.add_argument("--calls", type=int, default=200, help="prompt builds per timing sample")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    template = ChatPromptTemplate.from_messages([
+        SystemMessage(content=SYSTEM_PROMPT),
+        MessagesPlaceholder(variable_name="chat_history"),
+        HumanMessagePromptTemplate.from_template("{input}")
+    ])
+    compiled = ChatPrompt(SYSTEM_PROMPT)
+    question = "And how long do they sleep?"
+
+    print(f"{'messages':>8}  {'template.format':>15}  {'messages_for':>12}  {'chars rendered':>21}  {'prefix stable':>13}")
+    for length in [int(length) for length in args.messages.split(",")]:
+        chat_history = history(length)
+        format_us = per_call_us(lambda: template.format(chat_history=chat_history, input=question), args.calls, args.repeats)
+        messages_us = per_call_us(lambda: compiled.messages_for(chat_history, question), args.calls, args.repeats)
+
+        formatted = template.format(chat_history=chat_history, input=question)
+        messages = compiled.messages_for(chat_history, question)
+        rendered = f"{len(formatted)} -> {len(messages[-1].content)}"
+
+        # The next turn: the question and an answer join the history
+        next_history = chat_history + [HumanMessage(content=question), AIMessage(content=ANSWER)]
+        template_stable = first_message(formatted) == first_message(template.format(chat_history=next_history, input="Why?"))
+        compiled_stable = first_message(messages) == first_message(compiled.messages_for(next_history, "Why?"))
+        stable = f"{'yes' if template_stable else 'no'} -> {'yes' if compiled_stable else 'no'}"
+        print(f"{length:8d}  {format_us:12.1f} us  {messages_us:9.1f} us  {rendered:>21}  {stable:>13}")
+
+
+if __name__ == "__main__":
+    main()
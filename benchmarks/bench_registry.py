@@ -0,0 +1,97 @@
+"""Routing cost as the minion registry grows: orchestrator prompt size, local routing time and shortlist recall.
+
+    python benchmarks/bench_registry.py --minions 10,100,500,1000 --k 8
+
+Generates a registry of N minions, each about its own made-up topic with two related terms, plus a
+shared vocabulary ("tips", "fact", "help") that every minion's examples use. For each size it reports:
+  prompt tokens  estimated tokens of the orchestrator prompt listing every minion, against the
+                 prompt listing only the shortlist the router picks for a question
+  classify       the local fast-path decision made for every question
+  shortlist      picking the k candidates for the orchestrator LLM
+  recall         held-out questions (no keyword, one related term) whose minion is on the shortlist
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from minions.history import count_tokens
+from orchestrator.registry import MinionRegistry
+from orchestrator.router import FastPathRouter
+
+SYLLABLES = ["ba", "ko", "ri", "zu", "te", "mo", "la", "ne", "pi", "gu", "sa", "do", "vi", "ke", "ro", "fa"]
+
+
+def made_up_words(count: int, rng: random.Random) -> list[str]:
+    words = set()
+    while len(words) < count:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(3)))
+    return sorted(words)
+
+
+def generate_config(minions: int, seed: int = 11) -> tuple[dict, list[tuple[str, str]]]:
+    rng = random.Random(seed)
+    words = made_up_words(minions * 3, rng)
+    rng.shuffle(words)
+    config = {"fallback": "receptionist", "minions": {}}
+    held_out = []
+    for n in range(minions):
+        topic, related, other = words[3 * n:3 * n + 3]
+        name = f"{topic} minion"
+        config["minions"][name] = {
+            "description": f"handles all queries related to {topic}s, {related}s or {other} care.",
+            "prompt": f"You are a friendly AI assistant who loves to talk about {topic}s.",
+            "keywords": [rf"\b{topic}s?\b"],
+            "examples": [f"tell me about {topic}s", f"{topic} fact", f"{related} care tips", f"help with my {other}"],
+        }
+        held_out.append((f"what should I know before buying a {related if n % 2 else other}", name))
+    config["minions"]["receptionist"] = {
+        "description": "handles any general questions, or when the intent is unclear.",
+        "prompt": "You are a friendly AI receptionist.",
+        "keywords": [r"^\s*(hi|hello|hey|thanks|thank you)\b"],
+        "examples": ["hello", "how are you", "what can you do", "thank you"],
+    }
+    return config, held_out
+
+
+def per_call_us(call, questions: list[str], repeats: int) -> float:
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for question in questions:
+            call(question)
+        samples.append((time.perf_counter() - started) / len(questions))
+    return statistics.median(samples) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minions", default="10,100,500,1000", help="registry sizes to measure")
+    parser.add_argument("--k", type=int, default=8, help="shortlist size offered to the orchestrator LLM")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'minions':>7}  {'prompt tokens all':>17}  {'shortlist':>9}  {'classify':>10}  {'shortlist':>10}  {'recall':>6}")
+    for size in [int(size) for size in args.minions.split(",")]:
+        config, held_out = generate_config(size)
+        registry = MinionRegistry(config)
+        router = FastPathRouter(registry.route_specs(), fallback=registry.fallback)
+        questions = [question for question, _ in held_out] + [example for example, _ in registry.examples()[:len(held_out)]]
+
+        full_tokens = count_tokens(registry.orchestrator_instructions(registry.minions))
+        shortlists = [router.candidates(question, args.k) for question, _ in held_out]
+        shortlist_tokens = statistics.mean(count_tokens(registry.orchestrator_instructions(names)) for names in shortlists)
+        recall = sum(name in shortlist for (_, name), shortlist in zip(held_out, shortlists)) / len(held_out)
+
+        router.classify(questions[0])  # fit the indexes before timing
+        classify_us = per_call_us(router.classify, questions, args.repeats)
+        shortlist_us = per_call_us(lambda question: router.candidates(question, args.k), questions, args.repeats)
+        print(f"{size:7d}  {full_tokens:17d}  {shortlist_tokens:9.0f}  {classify_us:7.1f} us  {shortlist_us:7.1f} us  {recall:6.0%}")
+
+
+if __name__ == "__main__":
+    main()
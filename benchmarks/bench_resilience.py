@@ -0,0 +1,110 @@
+"""Model calls against a fault-injecting stub, with and without the resilience policy.
+
+    python benchmarks/bench_resilience.py --calls 400
+    python benchmarks/bench_resilience.py --scenarios tail --slow-latency 2
+
+Scenarios, each run first with bare calls and then through a ResiliencePolicy:
+  flaky   a fraction of calls fail with a 503; retries with backoff should hide almost all of them
+  tail    a fraction of calls are slow; hedging after the p95 should cut the tail
+  hang    a fraction of calls hang; the per-attempt timeout should abandon and retry them
+  outage  every call fails; the circuit breaker should stop calling upstream and fail fast
+"""
+import argparse
+import logging
+import statistics
+import threading
+import time
+
+from stub_llm import STUB_SETTINGS, StubChatModel, install_stub_models
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def run(args, faults: dict, policy) -> dict:
+    from config.gateway import ModelGateway
+    from config.models import ModelRegistry
+
+    STUB_SETTINGS.update({"error_rate": 0.0, "slow_rate": 0.0, **faults})
+    upstream = StubChatModel(model_name="stub")
+    registry = ModelRegistry(
+        {"defaults": {"model_name": "stub", "timeout": args.timeout}, "models": {"cat": {}}},
+        factory=lambda http_client, http_async_client, **settings: upstream,
+        gateway=ModelGateway(coalesce=False, resilience=policy),
+    )
+    model = registry.get("cat")
+    latencies, failures = [], {}
+    lock = threading.Lock()
+
+    def caller(n: int) -> None:
+        for i in range(n, args.calls, args.threads):
+            started = time.perf_counter()
+            try:
+                model.invoke(f"Tell me a fact about cats, number {i}")
+                error = None
+            except Exception as e:
+                error = type(e).__name__
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if error:
+                    failures[error] = failures.get(error, 0) + 1
+
+    threads = [threading.Thread(target=caller, args=(n,)) for n in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        "ok": args.calls - sum(failures.values()),
+        "failures": failures,
+        "upstream": upstream.calls,
+        "p50": statistics.median(latencies),
+        "p99": percentile(latencies, 0.99),
+        "mean": statistics.mean(latencies),
+        "stats": policy.stats()["models"].get("stub", {}) if policy else {},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default="flaky,tail,hang,outage")
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.05, help="normal upstream seconds per call")
+    parser.add_argument("--error-rate", type=float, default=0.2, help="failing fraction in the flaky scenario")
+    parser.add_argument("--slow-rate", type=float, default=0.03, help="slow fraction in the tail and hang scenarios")
+    parser.add_argument("--slow-latency", type=float, default=1.0, help="extra seconds for a slow call")
+    parser.add_argument("--hang-latency", type=float, default=3.0, help="extra seconds for a hanging call")
+    parser.add_argument("--timeout", type=float, default=0.5, help="per-attempt timeout (the model's timeout setting)")
+    args = parser.parse_args()
+
+    install_stub_models(latency=args.latency)
+    logging.disable(logging.ERROR)  # retries and circuit changes are counted below instead
+    from config.resilience import ResiliencePolicy
+
+    scenarios = {
+        "flaky": ({"error_rate": args.error_rate}, lambda: ResiliencePolicy(backoff=0.05, max_backoff=0.2)),
+        "tail": ({"slow_rate": args.slow_rate, "slow_latency": args.slow_latency},
+                 lambda: ResiliencePolicy(hedge=True, hedge_min_samples=10)),
+        "hang": ({"slow_rate": args.slow_rate, "slow_latency": args.hang_latency}, lambda: ResiliencePolicy(backoff=0.05, max_backoff=0.2)),
+        "outage": ({"error_rate": 1.0}, lambda: ResiliencePolicy(backoff=0.05, max_backoff=0.2, reset_after=60)),
+    }
+    print(f"{args.calls} calls on {args.threads} threads, {args.latency * 1000:.0f} ms per upstream call")
+    for name in args.scenarios.split(","):
+        faults, make_policy = scenarios[name]
+        for policy in (None, make_policy()):
+            result = run(args, faults, policy)
+            failures = ", ".join(f"{count} {error}" for error, count in sorted(result["failures"].items())) or "none"
+            print(f"{name:7} {'resilient' if policy else 'bare     '}  ok {result['ok']:4d}/{args.calls}  upstream calls {result['upstream']:4d}  "
+                  f"p50 {result['p50'] * 1000:7.1f} ms  p99 {result['p99'] * 1000:7.1f} ms  mean {result['mean'] * 1000:7.1f} ms  failures: {failures}")
+            if policy:
+                stats = result["stats"]
+                print(f"{'':17}retries {stats['retries']} ({stats['timeouts']} after a timeout), hedges {stats['hedges']} ({stats['hedge_wins']} won), "
+                      f"fast failures {stats['fast_failures']}, circuit opened {stats['circuit_opened']}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Rerun time of the Streamlit UI (src/main.py) as the conversation grows, measured headlessly with AppTest.
+
+    python benchmarks/bench_streamlit.py --messages 10,100,1000
+    python benchmarks/bench_streamlit.py --script /path/to/other/main.py   # compare another version of the UI
+
+Each rerun is what a keystroke-and-enter or a button click costs: the script runs top to bottom against
+the existing session state. The first run, which imports modules and builds cached resources, is
+reported separately.
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+
+from stub_llm import SRC_DIR, install_stub_models
+
+
+def conversation(length: int) -> list:
+    from langchain.schema import AIMessage, HumanMessage
+
+    messages = []
+    for n in range(length):
+        if n % 2 == 0:
+            messages.append(HumanMessage(content=f"Question {n // 2}: tell me something about cats, dogs or monkeys."))
+        else:
+            messages.append(AIMessage(content=f"Answer {n // 2}: " + "Cats sleep for most of the day. " * 8))
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--script", default=os.path.join(SRC_DIR, "main.py"))
+    parser.add_argument("--messages", default="10,100,1000", help="conversation lengths to measure")
+    parser.add_argument("--reruns", type=int, default=5, help="reruns per length; the median is reported")
+    args = parser.parse_args()
+
+    install_stub_models(latency=0.0)
+    logging.disable(logging.WARNING)
+    from streamlit.testing.v1 import AppTest
+
+    print(f"{args.script}")
+    for length in [int(n) for n in args.messages.split(",")]:
+        at = AppTest.from_file(args.script, default_timeout=120)
+        started = time.perf_counter()
+        at.run()
+        first_run = time.perf_counter() - started
+        at.session_state["messages"] = conversation(length)
+        timings = []
+        for _ in range(args.reruns):
+            started = time.perf_counter()
+            at.run()
+            timings.append(time.perf_counter() - started)
+        if at.exception:
+            sys.exit(f"The script raised: {at.exception[0].message}")
+        print(
+            f"{length:5d} messages  rerun p50 {statistics.median(timings) * 1000:8.1f} ms  "
+            f"max {max(timings) * 1000:8.1f} ms  ({len(at.markdown)} markdown elements; first run {first_run * 1000:.0f} ms)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""Offline benchmark suite: the orchestrator's own overhead, per stage, against the stub model.
+
+Drives the compiled graph and the Flask /chat route of src/app.py and src/develop.py through
+scripted conversations of several lengths, reports per-stage latency and memory growth over a
+long session, and compares the numbers with a stored baseline.
+
+    python benchmarks/bench_suite.py                    # run and check against benchmarks/baseline.json
+    python benchmarks/bench_suite.py --update-baseline  # store this run as the new baseline
+    python benchmarks/bench_suite.py --targets app.flask --turns 1,10 --latency 0.05
+
+Exits with status 1 when a metric is worse than the baseline by more than --tolerance (and by more
+than the absolute noise floor). Timings depend on the machine, so refresh the baseline when the
+benchmark host changes.
+"""
+import argparse
+import functools
+import gc
+import json
+import logging
+import math
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+from stub_llm import StubChatModel, install_stub_models
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Scripted conversations; they cycle when a conversation is longer than the script
+SCRIPTS = {
+    "app": [
+        "hello", "give me a cat fact", "and what about their whiskers?", "tell me about dogs",
+        "which breed is the calmest", "I love chimpanzees", "what do they eat", "thanks!",
+    ],
+    "develop": [
+        "hi there", "what's the weather today", "save a note about the project", "find my notes on python",
+        "check my inbox", "add a meeting to my calendar", "what can you do", "thank you",
+    ],
+}
+
+# Absolute differences below these are treated as noise when checking for regressions
+NOISE_FLOORS = {"_ms": 0.5, "_kb_per_turn": 3.0}
+# Turns in the memory session before growth is measured: enough for the 200 messages SESSION_MAX_MESSAGES keeps by default
+MEMORY_WARMUP_TURNS = 150
+# Tail latencies from a handful of samples are too noisy to fail on; they are reported only
+UNGATED_SUFFIXES = ("_p95_ms",)
+
+
+class StageTimer:
+    """Accumulates the time spent in wrapped functions, per stage and per turn."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self._turn = defaultdict(float)
+
+    def wrap(self, owner, attr: str, stage: str) -> None:
+        original = getattr(owner, attr)
+
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self._turn[stage] += time.perf_counter() - started
+
+        setattr(owner, attr, timed)
+
+    def end_turn(self, total: float) -> None:
+        self._turn["total"] = total
+        self._turn["overhead"] = total - self._turn.get("model", 0.0)
+        for stage, seconds in self._turn.items():
+            self.samples[stage].append(seconds)
+        self._turn = defaultdict(float)
+
+    def reset(self) -> None:
+        self.samples = defaultdict(list)
+        self._turn = defaultdict(float)
+
+
+def load_module(name: str, timer: StageTimer):
+    module = __import__(name)
+    timer.wrap(module, "route_question", "routing")
+    timer.wrap(module.history_manager, "for_turn", "history")
+    # /chat and the graph load and save the conversation through the graph's checkpointer
+    for attr in ("get_tuple", "put", "put_writes"):
+        timer.wrap(module.session_store.checkpointer, attr, "session")
+    return module
+
+
+# One conversation of `turns` questions through the compiled graph, in its own checkpointed thread
+def run_graph_conversation(module, script: list[str], turns: int, timer: StageTimer, session_id: str) -> None:
+    from langchain.schema import HumanMessage
+
+    config = {"configurable": {"thread_id": session_id}}
+    for turn in range(turns):
+        question = script[turn % len(script)]
+        started = time.perf_counter()
+        module.app.invoke({"messages": [HumanMessage(content=question)]}, config)
+        timer.end_turn(time.perf_counter() - started)
+
+# One conversation of `turns` questions through Flask's /chat, in its own session
+def run_flask_conversation(module, script: list[str], turns: int, timer: StageTimer, session_id: str) -> None:
+    client = module.flask_app.test_client()
+    for turn in range(turns):
+        question = script[turn % len(script)]
+        started = time.perf_counter()
+        response = client.post("/chat", json={"userquestion": question}, headers={"X-Session-ID": session_id})
+        timer.end_turn(time.perf_counter() - started)
+        if response.status_code != 200:
+            raise RuntimeError(f"/chat answered {response.status_code}: {response.get_data(as_text=True)}")
+
+def run_conversation(target: str, module, turns: int, timer: StageTimer, session_id: str) -> None:
+    script = SCRIPTS[module.__name__]
+    if target.endswith(".graph"):
+        run_graph_conversation(module, script, turns, timer, session_id)
+    else:
+        run_flask_conversation(module, script, turns, timer, session_id)
+
+
+# Traced memory growth per turn over one long session: the median of several consecutive windows, after a
+# warm-up long enough to fill the session up to its message cap. A one-off allocation (a cache or dict
+# resizing, a lazily built client) lands in a single window and does not move the median.
+def measure_memory(target: str, module, turns: int, warmup: int, windows: int, timer: StageTimer) -> float:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run_conversation(target, module, warmup, timer, f"memory-{target}")
+        growth = []
+        for _ in range(windows):
+            gc.collect()
+            before = tracemalloc.get_traced_memory()[0]
+            run_conversation(target, module, turns, timer, f"memory-{target}")
+            gc.collect()
+            growth.append((tracemalloc.get_traced_memory()[0] - before) / 1024 / turns)
+    finally:
+        tracemalloc.stop()
+    return statistics.median(growth)
+
+
+def run_suite(targets: list[str], turn_counts: list[int], conversations: int, repeats: int, memory_turns: int, memory_windows: int) -> dict:
+    timer = StageTimer()
+    timer.wrap(StubChatModel, "invoke", "model")
+    modules = {}
+    metrics = {}
+    for target in targets:
+        name = target.split(".")[0]
+        if name not in modules:
+            modules[name] = load_module(name, timer)
+        module = modules[name]
+
+        # Warm imports, caches and lazily built clients before measuring
+        run_conversation(target, module, len(SCRIPTS[name]), timer, f"warmup-{target}")
+        for turns in turn_counts:
+            # The best of several repeats, so a busy moment on the host does not read as a regression
+            for repeat in range(repeats):
+                timer.reset()
+                for n in range(conversations):
+                    run_conversation(target, module, turns, timer, f"{target}-{turns}-{repeat}-{n}")
+                overhead = sorted(timer.samples["overhead"])
+                measured = {f"{stage}_p50_ms": statistics.median(samples) for stage, samples in timer.samples.items()}
+                measured["overhead_p95_ms"] = overhead[math.ceil(len(overhead) * 0.95) - 1]
+                for metric, seconds in measured.items():
+                    key = f"{target}/turns={turns}/{metric}"
+                    metrics[key] = min(metrics.get(key, float("inf")), round(seconds * 1000, 3))
+        if memory_turns:
+            timer.reset()
+            metrics[f"{target}/memory_kb_per_turn"] = round(measure_memory(target, module, memory_turns, MEMORY_WARMUP_TURNS, memory_windows, timer), 3)
+    return metrics
+
+
+def print_metrics(metrics: dict, baseline: dict) -> None:
+    width = max(len(key) for key in metrics)
+    for key, value in metrics.items():
+        previous = baseline.get(key)
+        change = f"  (baseline {previous}, {((value - previous) / previous * 100) if previous else 0:+.0f}%)" if previous is not None else ""
+        print(f"{key:{width}}  {value:10.3f}{change}")
+
+
+# Metrics worse than the baseline by more than the relative tolerance and the absolute noise floor
+def regressions(metrics: dict, baseline: dict, tolerance: float) -> list[str]:
+    failures = []
+    for key, value in metrics.items():
+        previous = baseline.get(key)
+        if previous is None or key.endswith(UNGATED_SUFFIXES):
+            continue
+        floor = next((floor for suffix, floor in NOISE_FLOORS.items() if key.endswith(suffix)), 0.0)
+        if value > previous * (1 + tolerance) and value - previous > floor:
+            failures.append(f"{key}: {value:.3f} vs baseline {previous:.3f}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", default="app.graph,app.flask,develop.graph,develop.flask")
+    parser.add_argument("--turns", default="1,10,50", help="conversation lengths to measure")
+    parser.add_argument("--conversations", type=int, default=5, help="conversations per length")
+    parser.add_argument("--repeats", type=int, default=3, help="repeats per length; the best one is kept")
+    parser.add_argument("--memory-turns", type=int, default=200, help="turns per memory growth window (0 skips)")
+    parser.add_argument("--memory-windows", type=int, default=5, help="memory growth windows; the median is kept")
+    parser.add_argument("--latency", type=float, default=0.0, help="stub model latency per call, in seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed relative slowdown before failing")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--with-logging", action="store_true", help="keep INFO logging on (it is part of the real overhead)")
+    args = parser.parse_args()
+
+    install_stub_models(latency=args.latency, tokens_per_second=args.tokens_per_second)
+    # Offline stand-ins for develop.py's Google and weather integrations, and fresh in-memory sessions
+    os.environ["INTEGRATIONS_OFFLINE"] = "1"
+    os.environ["SESSION_BACKEND"] = "memory"
+    os.environ.pop("SPECULATIVE_ROUTING", None)
+    os.environ.pop("RESPONSE_CACHE", None)
+    if not args.with_logging:
+        logging.disable(logging.INFO)
+
+    targets = [target.strip() for target in args.targets.split(",") if target.strip()]
+    turn_counts = [int(turns) for turns in args.turns.split(",")]
+    metrics = run_suite(targets, turn_counts, args.conversations, max(1, args.repeats), args.memory_turns, max(1, args.memory_windows))
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["metrics"]
+
+    print(f"stub latency {args.latency * 1000:.0f} ms, {args.conversations} conversations per length, best of {args.repeats}")
+    print_metrics(metrics, baseline)
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "latency": args.latency, "metrics": metrics}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    failures = regressions(metrics, baseline, args.tolerance)
+    if failures:
+        print("\nRegressions against the baseline:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("\nNo regressions against the baseline." if baseline else "\nNo baseline yet; run with --update-baseline to store one.")
+
+
+if __name__ == "__main__":
+    main()
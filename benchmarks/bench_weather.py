@@ -0,0 +1,119 @@
+"""Weather lookups through WeatherProvider versus one uncached request per question, against a local stand-in API.
+
+    python benchmarks/bench_weather.py --lookups 200 --threads 16 --upstream-latency 0.1
+
+The stand-in answers like the OpenWeatherMap current-weather endpoint after --upstream-latency seconds,
+and hangs on ZIP code 00000 so the read timeout can be checked.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from integrations.weather import WeatherLookupError, WeatherProvider, weather_session
+
+ZIP_CODES = ["94103", "10001", "60601", "73301", "98101"]
+
+
+def start_stand_in(port: int, latency: float):
+    requests_served = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            zip_code = parse_qs(urlparse(self.path).query).get("zip", [""])[0]
+            requests_served.append(zip_code)
+            time.sleep(3600 if zip_code == "00000" else latency)
+            body = json.dumps({"weather": [{"description": "clear sky"}], "main": {"temp": 293.15}, "zip": zip_code}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, requests_served
+
+
+def run(lookup, questions: list[str], threads: int) -> tuple[float, list[float]]:
+    latencies = []
+
+    def timed(zip_code: str) -> None:
+        started = time.perf_counter()
+        lookup(zip_code)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(timed, questions))
+    return time.perf_counter() - started, sorted(latencies)
+
+
+def report(label: str, elapsed: float, latencies: list[float], upstream: int) -> None:
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    print(f"{label:28} {elapsed:6.2f} s  p50 {p50:7.1f} ms  p99 {p99:7.1f} ms  {upstream:4d} upstream requests")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--upstream-latency", type=float, default=0.1, help="seconds the stand-in takes per request")
+    parser.add_argument("--read-timeout", type=float, default=1.0)
+    parser.add_argument("--port", type=int, default=5098)
+    args = parser.parse_args()
+
+    os.environ["WEATHER_API_KEY"] = "stand-in"
+    server, served = start_stand_in(args.port, args.upstream_latency)
+    url = f"http://127.0.0.1:{args.port}/data/2.5/weather"
+    questions = [ZIP_CODES[n % len(ZIP_CODES)] for n in range(args.lookups)]
+    session = weather_session()
+
+    def uncached(zip_code: str) -> dict:
+        return session.get(url, params={"zip": zip_code, "appid": "stand-in"}, timeout=(3.05, args.read_timeout)).json()
+
+    print(f"{args.lookups} lookups over {len(ZIP_CODES)} ZIP codes, {args.threads} threads, upstream latency {args.upstream_latency * 1000:.0f} ms")
+    try:
+        elapsed, latencies = run(uncached, questions, args.threads)
+        report("uncached request per lookup", elapsed, latencies, len(served))
+
+        served.clear()
+        provider = WeatherProvider(lambda: session, api_key="stand-in", url=url, ttl=600, read_timeout=args.read_timeout)
+        elapsed, latencies = run(provider.get, questions, args.threads)
+        report("WeatherProvider (cold)", elapsed, latencies, len(served))
+
+        # Every entry is now stale: lookups are answered from the cache while one refresh per ZIP code runs
+        served.clear()
+        provider.ttl = 0
+        elapsed, latencies = run(provider.get, questions, args.threads)
+        provider.ttl = 600
+        time.sleep(args.upstream_latency * len(ZIP_CODES))
+        report("WeatherProvider (stale)", elapsed, latencies, len(served))
+        print(f"stats: {provider.stats()}")
+
+        started = time.perf_counter()
+        try:
+            provider.get("00000")
+            outcome = "answered"
+        except WeatherLookupError as e:
+            outcome = str(e)
+        print(f"hung upstream: gave up after {time.perf_counter() - started:.2f} s ({outcome})")
+        provider.close()
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
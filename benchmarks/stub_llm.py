@@ -0,0 +1,122 @@
+"""Deterministic stand-in for ChatGroq so the servers can be exercised offline.
+
+Call install_stub_models() before importing app/develop/main; their
+`from langchain_groq import ChatGroq` then picks up StubChatModel.
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+
+from langchain.schema import AIMessage
+from langchain_core.messages import AIMessageChunk
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+# Shared knobs; ChatGroq is constructed with fixed arguments in the entry modules
+STUB_SETTINGS = {
+    "latency": 0.05,  # seconds before the first token
+    "tokens_per_second": 0.0,  # generation speed; 0 means the whole reply arrives at once
+    "reply_words": 0,  # filler words appended to each reply, to simulate long answers
+    "error_rate": 0.0,  # fraction of calls that fail with a 503, as an overloaded or failing upstream would
+    "slow_rate": 0.0,  # fraction of calls that take slow_latency seconds longer, for tail latency
+    "slow_latency": 2.0,
+}
+_faults = random.Random(0)
+
+
+class StubUpstreamError(Exception):
+    """What the stub raises for an injected fault; status_code mirrors the SDK's APIStatusError."""
+
+    def __init__(self, status_code: int = 503):
+        super().__init__(f"Error code: {status_code} - injected by the stub")
+        self.status_code = status_code
+
+
+class StubChatModel:
+    def __init__(self, temperature: float = 0.7, model_name: str = "stub", **kwargs):
+        self.temperature = temperature
+        self.model_name = model_name
+        self.calls = 0
+
+    @staticmethod
+    def _prompt_text(prompt) -> str:
+        if isinstance(prompt, str):
+            return prompt
+        if hasattr(prompt, "to_messages"):
+            prompt = prompt.to_messages()
+        return "\n".join(str(message.content) for message in prompt)
+
+    # Deterministic reply derived from the last line of the prompt
+    def _reply(self, prompt) -> str:
+        last_line = self._prompt_text(prompt).strip().splitlines()[-1]
+        filler = " lorem" * STUB_SETTINGS["reply_words"]
+        return f"Stub answer from {self.model_name}: {last_line[-80:]}{filler}"
+
+    # Injected faults: raises for a failing call, otherwise returns the extra latency of a slow one
+    @staticmethod
+    def _fault() -> float:
+        if STUB_SETTINGS["error_rate"] and _faults.random() < STUB_SETTINGS["error_rate"]:
+            raise StubUpstreamError(503)
+        if STUB_SETTINGS["slow_rate"] and _faults.random() < STUB_SETTINGS["slow_rate"]:
+            return STUB_SETTINGS["slow_latency"]
+        return 0.0
+
+    def _delay(self, reply: str) -> float:
+        rate = STUB_SETTINGS["tokens_per_second"]
+        return STUB_SETTINGS["latency"] + self._fault() + (len(reply.split()) / rate if rate else 0.0)
+
+    def invoke(self, prompt, config=None, **kwargs) -> AIMessage:
+        self.calls += 1
+        reply = self._reply(prompt)
+        time.sleep(self._delay(reply))
+        return AIMessage(content=reply)
+
+    async def ainvoke(self, prompt, config=None, **kwargs) -> AIMessage:
+        self.calls += 1
+        reply = self._reply(prompt)
+        await asyncio.sleep(self._delay(reply))
+        return AIMessage(content=reply)
+
+    # Word-by-word chunks, paced by tokens_per_second after the initial latency
+    def _chunks(self, reply: str) -> list[str]:
+        words = reply.split(" ")
+        return [word if i == 0 else f" {word}" for i, word in enumerate(words)]
+
+    def stream(self, prompt, config=None, **kwargs):
+        self.calls += 1
+        rate = STUB_SETTINGS["tokens_per_second"]
+        time.sleep(STUB_SETTINGS["latency"] + self._fault())
+        for chunk in self._chunks(self._reply(prompt)):
+            if rate:
+                time.sleep(1 / rate)
+            yield AIMessageChunk(content=chunk)
+
+    async def astream(self, prompt, config=None, **kwargs):
+        self.calls += 1
+        rate = STUB_SETTINGS["tokens_per_second"]
+        await asyncio.sleep(STUB_SETTINGS["latency"] + self._fault())
+        for chunk in self._chunks(self._reply(prompt)):
+            if rate:
+                await asyncio.sleep(1 / rate)
+            yield AIMessageChunk(content=chunk)
+
+
+def install_stub_models(latency: float = None, tokens_per_second: float = None, reply_words: int = None) -> None:
+    import langchain_groq
+
+    if latency is not None:
+        STUB_SETTINGS["latency"] = latency
+    if tokens_per_second is not None:
+        STUB_SETTINGS["tokens_per_second"] = tokens_per_second
+    if reply_words is not None:
+        STUB_SETTINGS["reply_words"] = reply_words
+    os.environ.setdefault("GROQ_API_KEY", "stub")
+    # Keep benchmark runs offline; load_dotenv() does not override variables that are already set
+    os.environ["LANGCHAIN_TRACING_V2"] = "false"
+    # The stub has no rate limits to respect; bench_gateway.py turns them back on when it measures them
+    os.environ.setdefault("MODEL_RATE_LIMITS", "0")
+    langchain_groq.ChatGroq = StubChatModel
+    if SRC_DIR not in sys.path:
+        sys.path.insert(0, SRC_DIR)
@@ -1,96 +1,434 @@
-import os
-import logging
-import requests
-from dotenv import load_dotenv
-
-# Load environment variables from .env file
-# This allows you to store configuration data (like API URLs and timeouts) in a separate file,
-# making it easy to change without altering the codebase.
-load_dotenv()
-
-# Configure logging for the client script
-# Logging is important for tracking the flow of execution and capturing errors for debugging purposes.
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-logger = logging.getLogger(__name__)
-
-# Constants
-# API_URL and TIMEOUT are constants used to configure the API client.
-# API_URL is the endpoint that the script will communicate with.
-# TIMEOUT defines how long the script should wait for a response before timing out.
-API_URL = os.getenv('API_URL', 'http://127.0.0.1:5000/chat')  # Default to local server if not specified
-TIMEOUT = int(os.getenv('TIMEOUT', 30))  # Set a timeout of 30 seconds by default
-
-# Function to query the chat API
-# This function sends the user's question to the chat API and waits for a response.
-def query_chat_api(user_question: str):
-    # Prepare the payload to be sent to the API
-    payload = {'userquestion': user_question}
-    
-    try:
-        # Send a POST request to the API
-        # We use requests.post() to interact with the API and pass the question as JSON data.
-        response = requests.post(API_URL, json=payload, timeout=TIMEOUT)
-
-        # If the response contains an error status code (like 4xx or 5xx), raise an exception
-        response.raise_for_status()
-
-        # Return the response from the API in JSON format
-        return response.json()
-    
-    # Handle any errors that occur during the request
-    # This includes connectivity issues, server errors, or timeouts.
-    except requests.RequestException as e:
-        # Log the error details for troubleshooting
-        logger.error(f"Error querying the chat API: {e}")
-
-        # Return an error message to the caller function
-        return {"error": str(e)}
-
-# Function to add contextual emojis based on agent response
-def add_emojis_to_response(response: str) -> str:
-    # Determine the appropriate emoji based on the agent type in the response
-    if "cat" in response.lower():
-        return f"🐱 Cat Minion: {response}"
-    elif "dog" in response.lower():
-        return f"🐶 Dog Minion: {response}"
-    elif "monkey" in response.lower():
-        return f"🐵 Monkey Minion: {response}"
-    elif "receptionist" in response.lower():
-        return f"📞 Receptionist Minion: {response}"
-    else:
-        return f"🤖 Orchestrator Minion: {response}"  # Default emoji for general or unspecified responses
-
-# Main function to run the client application
-# This function provides an interactive loop where the user can repeatedly ask questions.
-def main():
-    # Log that the chat client has started
-    logger.info("Starting the Echo chat client...")
-
-    # Infinite loop to keep the chat client running until the user decides to quit
-    while True:
-        # Prompt the user for input
-        user_question = input("Please enter your query (or 'exit' to quit): ")
-        
-        # Check if the user wants to exit the chat
-        if user_question.lower() == 'exit':
-            # Log that the user has decided to exit and break the loop
-            logger.info("Exiting chat...")
-            break
-
-        # Query the chat API with the user's input
-        response = query_chat_api(user_question)
-
-        # Check if the response contains an error
-        if "error" in response:
-            # Print the error message if something went wrong
-            print(f"❌ Error: {response['error']}")
-        else:
-            # Print the response from the Chat Assistant, adding contextual emojis
-            raw_response = response.get('response', 'No response received')
-            emoji_response = add_emojis_to_response(raw_response)
-            print(emoji_response)
-
-# Entry point for the script
-# When this script is run directly, it calls the main function.
-if __name__ == "__main__":
-    main()
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import logging
+import uuid
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+# This allows you to store configuration data (like API URLs and timeouts) in a separate file,
+# making it easy to change without altering the codebase.
+load_dotenv()
+
+# Configure logging for the client script
+# Logging is important for tracking the flow of execution and capturing errors for debugging purposes.
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Constants
+# API_URL and TIMEOUT are constants used to configure the API client.
+# API_URL is the endpoint that the script will communicate with.
+# TIMEOUT defines how long the script should wait for a response before timing out.
+API_URL = os.getenv('API_URL', 'http://127.0.0.1:5000/chat')  # Default to local server if not specified
+TIMEOUT = int(os.getenv('TIMEOUT', 30))  # Set a timeout of 30 seconds by default
+# STREAM_API_URL is the streaming variant of the endpoint; STREAM=0 switches the client back to single JSON responses.
+STREAM_API_URL = os.getenv('STREAM_API_URL', API_URL.rstrip('/') + '/stream')
+STREAM = os.getenv('STREAM', '1') != '0'
+# BATCH_API_URL accepts many questions per request; BATCH_SIZE caps how many are sent in one call.
+BATCH_API_URL = os.getenv('BATCH_API_URL', API_URL.rstrip('/') + '/batch')
+BATCH_SIZE = int(os.getenv('BATCH_SIZE', 100))
+# SESSION_ID identifies this client's conversation so the server keeps its history separate from other users.
+SESSION_ID = os.getenv('SESSION_ID') or uuid.uuid4().hex
+# RETRIES is how many times a failed request is retried; the wait between attempts grows from BACKOFF seconds
+# up to MAX_BACKOFF, with random jitter so many clients do not retry in lockstep.
+RETRIES = int(os.getenv('RETRIES', 3))
+BACKOFF = float(os.getenv('BACKOFF', 0.5))
+MAX_BACKOFF = float(os.getenv('MAX_BACKOFF', 8))
+# POOL_SIZE is how many keep-alive connections the client holds open to the server.
+POOL_SIZE = int(os.getenv('POOL_SIZE', 10))
+
+# Responses worth retrying: the server turned the request away before answering it (429 load shedding, 503 not ready).
+# A 502/504 from a proxy, a dropped connection or a read timeout are not retried, because the server may already
+# have answered and a retry would add the question to the conversation twice. Failing to connect at all is retried.
+RETRY_STATUSES = {429, 503}
+# Header carrying one key per question, the same on every retry, so a server that honors it runs side effects once
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+# Function to tell whether a requests error happened before the request reached the server
+def never_connected(error: requests.ConnectionError) -> bool:
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(error, requests.ConnectTimeout) or isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+# Function to compute how long to wait before the next attempt
+# "Full jitter": a random wait between zero and an exponentially growing cap.
+# A Retry-After header from the server takes precedence.
+def backoff_delay(attempt: int, backoff: float = BACKOFF, max_backoff: float = MAX_BACKOFF, retry_after=None) -> float:
+    if retry_after is not None:
+        try:
+            return min(max_backoff, float(retry_after))
+        except ValueError:
+            pass
+    return random.uniform(0, min(max_backoff, backoff * 2 ** attempt))
+
+# Function to turn (session_id, question) pairs or bare questions into batch request items
+def batch_payload_items(items: list) -> list[dict]:
+    payload_items = []
+    for item in items:
+        if isinstance(item, str):
+            payload_items.append({'userquestion': item})
+        else:
+            session_id, question = item
+            payload_items.append({'userquestion': question, 'session_id': session_id})
+    return payload_items
+
+
+# Reusable client for the chat API
+# One requests.Session keeps connections alive between questions, so only the first turn pays for TCP setup.
+# The client is safe to share between threads.
+class ChatClient:
+    def __init__(self, api_url: str = API_URL, stream_url: str = None, batch_url: str = None, session_id: str = None,
+                 timeout: float = TIMEOUT, retries: int = RETRIES, backoff: float = BACKOFF, max_backoff: float = MAX_BACKOFF,
+                 pool_size: int = POOL_SIZE):
+        self.api_url = api_url
+        self.stream_url = stream_url or api_url.rstrip('/') + '/stream'
+        self.batch_url = batch_url or api_url.rstrip('/') + '/batch'
+        self.session_id = session_id or uuid.uuid4().hex
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.http.mount('http://', adapter)
+        self.http.mount('https://', adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.http.close()
+
+    # POST with retries; returns the successful response or raises the last error
+    def _post(self, url: str, payload: dict, session_id: str = None, timeout: float = None, stream: bool = False) -> requests.Response:
+        headers = {'X-Session-ID': session_id or self.session_id, IDEMPOTENCY_HEADER: uuid.uuid4().hex}
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.http.post(url, json=payload, headers=headers, timeout=timeout or self.timeout, stream=stream)
+            except requests.ConnectionError as e:
+                if attempt == self.retries or not never_connected(e):
+                    raise
+                delay = backoff_delay(attempt, self.backoff, self.max_backoff)
+                logger.warning(f"Connection to the chat API failed ({e}); retrying in {delay:.2f}s")
+                time.sleep(delay)
+                continue
+
+            if response.status_code in RETRY_STATUSES and attempt < self.retries:
+                delay = backoff_delay(attempt, self.backoff, self.max_backoff, response.headers.get('Retry-After'))
+                logger.warning(f"Chat API answered {response.status_code}; retrying in {delay:.2f}s")
+                response.close()
+                time.sleep(delay)
+                continue
+
+            response.raise_for_status()
+            return response
+
+    # Ask one question; returns the API's JSON, or {"error": ...} once the retries are used up
+    def chat(self, user_question: str, session_id: str = None) -> dict:
+        try:
+            return self._post(self.api_url, {'userquestion': user_question}, session_id).json()
+        except requests.RequestException as e:
+            logger.error(f"Error querying the chat API: {e}")
+            return {"error": str(e)}
+
+    # Stream one answer as server-sent event dictionaries (see query_chat_api_stream)
+    def stream(self, user_question: str, session_id: str = None):
+        try:
+            with self._post(self.stream_url, {'userquestion': user_question}, session_id, stream=True) as response:
+                for line in response.iter_lines(decode_unicode=True):
+                    # Each event is a "data: {...}" line followed by a blank line
+                    if line and line.startswith('data: '):
+                        yield json.loads(line[len('data: '):])
+        except requests.RequestException as e:
+            logger.error(f"Error streaming from the chat API: {e}")
+            yield {"error": str(e)}
+
+    # Answer many questions with the batch endpoint (see query_chat_api_batch)
+    def batch(self, items: list, batch_size: int = BATCH_SIZE) -> list[dict]:
+        payload_items = batch_payload_items(items)
+        results = []
+        for start in range(0, len(payload_items), batch_size):
+            chunk = payload_items[start:start + batch_size]
+            try:
+                # A batch takes as long as its slowest items, so the timeout scales with the chunk size
+                response = self._post(self.batch_url, {'items': chunk}, timeout=self.timeout * max(1, len(chunk) // 10))
+                for result in response.json()['results']:
+                    result['index'] += start
+                    results.append(result)
+
+            # A failed call marks every item of that chunk as failed so the results stay aligned with the input
+            except requests.RequestException as e:
+                logger.error(f"Error querying the batch chat API: {e}")
+                results.extend({'index': start + offset, 'error': str(e)} for offset in range(len(chunk)))
+        return results
+
+
+# Asyncio client for callers that keep many questions in flight at once (load tests, fan-out jobs)
+# It uses aiohttp with one connection pool of up to `limit` keep-alive connections.
+# log_errors=False leaves error reporting to the caller, which keeps a load test from flooding the log.
+class AsyncChatClient:
+    def __init__(self, api_url: str = API_URL, session_id: str = None, timeout: float = TIMEOUT, retries: int = RETRIES,
+                 backoff: float = BACKOFF, max_backoff: float = MAX_BACKOFF, limit: int = 100, log_errors: bool = True):
+        self.api_url = api_url
+        self.session_id = session_id or uuid.uuid4().hex
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.limit = limit
+        self.log_errors = log_errors
+        self._http = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    # The aiohttp session is created on first use so it belongs to the running event loop
+    def _session(self):
+        import aiohttp
+
+        if self._http is None:
+            self._http = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.limit),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._http
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.close()
+            self._http = None
+
+    # Ask one question; returns the API's JSON, or {"error": ...} once the retries are used up
+    async def chat(self, user_question: str, session_id: str = None) -> dict:
+        import aiohttp
+
+        headers = {'X-Session-ID': session_id or self.session_id, IDEMPOTENCY_HEADER: uuid.uuid4().hex}
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._session().post(self.api_url, json={'userquestion': user_question}, headers=headers) as response:
+                    if response.status in RETRY_STATUSES and attempt < self.retries:
+                        delay = backoff_delay(attempt, self.backoff, self.max_backoff, response.headers.get('Retry-After'))
+                        if self.log_errors:
+                            logger.warning(f"Chat API answered {response.status}; retrying in {delay:.2f}s")
+                        await asyncio.sleep(delay)
+                        continue
+                    response.raise_for_status()
+                    return await response.json()
+            except aiohttp.ClientConnectionError as e:
+                # Only failing to connect is retried; a dropped connection or read timeout is not, as with ChatClient
+                if attempt < self.retries and isinstance(e, aiohttp.ClientConnectorError):
+                    delay = backoff_delay(attempt, self.backoff, self.max_backoff)
+                    if self.log_errors:
+                        logger.warning(f"Connection to the chat API failed ({e}); retrying in {delay:.2f}s")
+                    await asyncio.sleep(delay)
+                    continue
+                if self.log_errors:
+                    logger.error(f"Error querying the chat API: {e}")
+                return {"error": str(e) or type(e).__name__}
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if self.log_errors:
+                    logger.error(f"Error querying the chat API: {e}")
+                return {"error": str(e) or type(e).__name__}
+
+
+# Shared client behind the module-level functions, created on first use
+_default_client = None
+
+def default_client() -> ChatClient:
+    global _default_client
+    if _default_client is None:
+        _default_client = ChatClient(API_URL, stream_url=STREAM_API_URL, batch_url=BATCH_API_URL, session_id=SESSION_ID)
+    return _default_client
+
+# Function to query the chat API
+# This function sends the user's question to the chat API and waits for a response.
+# The X-Session-ID header keeps every turn of this client in the same server-side conversation,
+# and the shared client reuses its connection between questions.
+def query_chat_api(user_question: str):
+    return default_client().chat(user_question)
+
+# Function to answer many independent questions with the batch endpoint
+# Items are questions, or (session_id, question) pairs to continue specific conversations; a question on its own
+# starts a fresh session. The results come back in the same order, each with a "response" or an "error".
+def query_chat_api_batch(items: list, batch_size: int = BATCH_SIZE) -> list[dict]:
+    return default_client().batch(items, batch_size)
+
+# Function to stream the answer from the chat API
+# The server sends server-sent events: {"agent": ...} once, {"token": ...} per chunk, then {"done": true, "response": ...}.
+# Each event is yielded as a dictionary as soon as it arrives, so the caller can render tokens incrementally.
+# Connection problems and HTTP errors are reported as a single error event.
+def query_chat_api_stream(user_question: str):
+    return default_client().stream(user_question)
+
+# Function to pick the contextual emoji prefix for a response or agent name
+def emoji_prefix(text: str) -> str:
+    # Determine the appropriate emoji based on the agent type in the text
+    if "cat" in text.lower():
+        return "🐱 Cat Minion:"
+    elif "dog" in text.lower():
+        return "🐶 Dog Minion:"
+    elif "monkey" in text.lower():
+        return "🐵 Monkey Minion:"
+    elif "receptionist" in text.lower():
+        return "📞 Receptionist Minion:"
+    else:
+        return "🤖 Orchestrator Minion:"  # Default emoji for general or unspecified responses
+
+# Function to add contextual emojis based on agent response
+def add_emojis_to_response(response: str) -> str:
+    return f"{emoji_prefix(response)} {response}"
+
+# Function to print a streamed answer token by token
+# Time to first token and total latency are logged so slow responses can be told apart from slow starts.
+def print_streamed_response(user_question: str):
+    started = time.perf_counter()
+    first_token_at = None
+    for event in query_chat_api_stream(user_question):
+        if "error" in event:
+            print(f"❌ Error: {event['error']}")
+            return
+        if "agent" in event:
+            print(emoji_prefix(event['agent']), end=" ", flush=True)
+        elif "token" in event:
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            print(event['token'], end="", flush=True)
+        elif event.get("done"):
+            print()
+            total = time.perf_counter() - started
+            logger.info(f"Time to first token: {(first_token_at or time.perf_counter()) - started:.3f}s, total: {total:.3f}s")
+
+# Questions the load generator cycles through when no corpus file is given
+DEFAULT_CORPUS = [
+    "hello",
+    "give me a cat fact",
+    "tell me about dogs",
+    "I love chimpanzees",
+    "what can you do",
+    "why do cats purr",
+    "what is the best breed of dog",
+]
+
+# Nearest-rank percentile of an already sorted list
+def percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+# Load generator: `users` virtual users, each in its own session, ask questions back to back for `duration` seconds
+# Returns throughput, latency percentiles and the outcome of every request.
+async def run_load(api_url: str, users: int, duration: float, questions: list[str], retries: int = 0) -> dict:
+    latencies = []
+    errors = {}
+    run_id = uuid.uuid4().hex[:8]
+
+    async with AsyncChatClient(api_url, retries=retries, limit=users, log_errors=False) as client:
+        deadline = time.perf_counter() + duration
+
+        async def virtual_user(user_id: int):
+            n = user_id
+            while time.perf_counter() < deadline:
+                question = questions[n % len(questions)]
+                n += 1
+                started = time.perf_counter()
+                result = await client.chat(question, session_id=f"load-{run_id}-{user_id}")
+                if "error" in result:
+                    errors[result['error']] = errors.get(result['error'], 0) + 1
+                else:
+                    latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(virtual_user(i) for i in range(users)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "users": users,
+        "duration": round(elapsed, 2),
+        "requests": len(latencies) + sum(errors.values()),
+        "succeeded": len(latencies),
+        "throughput": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "errors": errors,
+    }
+
+# Function to print a load test report
+def print_load_report(report: dict):
+    print(f"{report['users']} virtual users for {report['duration']}s: {report['requests']} requests, {report['succeeded']} succeeded")
+    print(f"Throughput: {report['throughput']} req/s")
+    print(f"Latency: p50 {report['p50_ms']} ms, p95 {report['p95_ms']} ms, p99 {report['p99_ms']} ms")
+    for error, count in report['errors'].items():
+        print(f"❌ {count} x {error}")
+
+# Main function to run the client application
+# Without arguments this provides an interactive loop where the user can repeatedly ask questions.
+# With --load it runs the load generator instead, e.g.:
+#   python api_client.py --load --users 50 --duration 30 --corpus questions.txt
+def main():
+    parser = argparse.ArgumentParser(description="Chat client for the Project Minion API.")
+    parser.add_argument('--load', action='store_true', help="run the load generator instead of the interactive chat")
+    parser.add_argument('--users', type=int, default=10, help="concurrent virtual users (load mode)")
+    parser.add_argument('--duration', type=float, default=30, help="seconds to generate load for (load mode)")
+    parser.add_argument('--corpus', help="file with one question per line (load mode)")
+    parser.add_argument('--retries', type=int, default=0, help="retries per request (load mode)")
+    args = parser.parse_args()
+
+    if args.load:
+        questions = DEFAULT_CORPUS
+        if args.corpus:
+            with open(args.corpus, encoding='utf-8') as corpus_file:
+                questions = [line.strip() for line in corpus_file if line.strip()]
+        logger.info(f"Generating load on {API_URL} with {args.users} virtual users for {args.duration}s...")
+        print_load_report(asyncio.run(run_load(API_URL, args.users, args.duration, questions, args.retries)))
+        return
+
+    # Log that the chat client has started
+    logger.info("Starting the Echo chat client...")
+
+    # Infinite loop to keep the chat client running until the user decides to quit
+    while True:
+        # Prompt the user for input
+        user_question = input("Please enter your query (or 'exit' to quit): ")
+
+        # Check if the user wants to exit the chat
+        if user_question.lower() == 'exit':
+            # Log that the user has decided to exit and break the loop
+            logger.info("Exiting chat...")
+            break
+
+        # Stream the answer as it is generated, unless streaming is turned off
+        if STREAM:
+            print_streamed_response(user_question)
+            continue
+
+        # Query the chat API with the user's input
+        response = query_chat_api(user_question)
+
+        # Check if the response contains an error
+        if "error" in response:
+            # Print the error message if something went wrong
+            print(f"❌ Error: {response['error']}")
+        else:
+            # Print the response from the Chat Assistant, adding contextual emojis
+            raw_response = response.get('response', 'No response received')
+            emoji_response = add_emojis_to_response(raw_response)
+            print(emoji_response)
+
+# Entry point for the script
+# When this script is run directly, it calls the main function.
+if __name__ == "__main__":
+    main()
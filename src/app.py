@@ -1,211 +1,497 @@
-from flask import Flask, request, jsonify
-import os
-from typing import TypedDict, Union, Callable
-from langchain.schema import SystemMessage, HumanMessage, AIMessage
-from langchain_groq import ChatGroq
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder, HumanMessagePromptTemplate
-from langgraph.graph import StateGraph, END
-import logging
-from langsmith import trace
-import random
-from dotenv import load_dotenv
-# Load environment variables from .env file
-load_dotenv()
-
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('multi_agent_orchestrator.log')
-    ]
-)
-logger = logging.getLogger(__name__)
-
-
-# Access environment variables
-groq_api_key = os.getenv("GROQ_API_KEY")
-langchain_tracing_v2 = os.getenv("LANGCHAIN_TRACING_V2")
-langchain_endpoint = os.getenv("LANGCHAIN_ENDPOINT")
-langchain_api_key = os.getenv("LANGCHAIN_API_KEY")
-langchain_project = os.getenv("LANGCHAIN_PROJECT")
-
-
-# Define chatbot state
-class State(TypedDict):
-    messages: list[Union[HumanMessage, AIMessage]]
-
-# Initialize models for each agent
-cat_model = ChatGroq(temperature=0.7, model_name="llama3-groq-70b-8192-tool-use-preview")
-dog_model = ChatGroq(temperature=0.7, model_name="llama3-groq-70b-8192-tool-use-preview")
-monkey_model = ChatGroq(temperature=0.7, model_name="llama3-groq-70b-8192-tool-use-preview")
-receptionist_model = ChatGroq(temperature=0.7, model_name="llama3-groq-70b-8192-tool-use-preview")
-orchestrator_model = ChatGroq(temperature=0.7, model_name="llama3-groq-70b-8192-tool-use-preview")
-
-# Prompt templates
-cat_minion_prompt = ChatPromptTemplate.from_messages([
-    SystemMessage(content="You are a friendly AI assistant who loves to talk about cats."),
-    MessagesPlaceholder(variable_name="chat_history"),
-    HumanMessagePromptTemplate.from_template("{input}")
-])
-
-dog_minion_prompt = ChatPromptTemplate.from_messages([
-    SystemMessage(content="You are a friendly AI assistant who loves to talk about dogs."),
-    MessagesPlaceholder(variable_name="chat_history"),
-    HumanMessagePromptTemplate.from_template("{input}")
-])
-
-monkey_minion_prompt = ChatPromptTemplate.from_messages([
-    SystemMessage(content="You are a friendly AI assistant who loves to talk about monkeys."),
-    MessagesPlaceholder(variable_name="chat_history"),
-    HumanMessagePromptTemplate.from_template("{input}")
-])
-
-chat_minion_prompt = ChatPromptTemplate.from_messages([
-    SystemMessage(content="You are a friendly AI receptionist, providing general help and directing users appropriately."),
-    MessagesPlaceholder(variable_name="chat_history"),
-    HumanMessagePromptTemplate.from_template("{input}")
-])
-
-# Define orchestrator prompt with more explicit instructions
-orchestrator_prompt = ChatPromptTemplate.from_messages([
-    SystemMessage(content="""You are an orchestrator assistant. You need to determine which specialized agent should handle each user query. Here are the rules:
-    - The 'cat agent' handles all queries related to cats, kittens, or feline-related information. Example queries include: 'I love cats', 'Tell me about Siamese cats', 'Give me a cat fact'.
-    - The 'dog agent' handles all queries related to dogs, puppies, or canine-related information. Example queries include: 'I love dogs', 'What is the best breed of dog?', 'Give me a dog fact'.
-    - The 'monkey agent' handles all queries related to monkeys, apes, or primate-related information. Example queries include: 'Tell me about monkeys', 'I love chimpanzees', 'Give me a monkey fact'.
-    - The 'receptionist agent' handles any general questions that are not specifically related to cats, dogs, or monkeys, or when the intent is unclear.
-    Based on the user query, output the name of the agent that should handle the query: 'cat', 'dog', 'monkey', or 'receptionist'."""),
-    HumanMessagePromptTemplate.from_template("{input}")
-])
-
-# Function to determine which agent to use
-def agent_orchestrator(user_question: str) -> Callable[[State], dict]:
-    # Invoke orchestrator LLM to determine routing
-    response = orchestrator_model.invoke(orchestrator_prompt.format(input=user_question))
-    agent_name = response.content.strip().lower()
-
-    if agent_name == "cat minion":
-        logger.info("Routing to cat minion.")
-        return cat_agent
-    elif agent_name == "dog minion":
-        logger.info("Routing to dog minion.")
-        return dog_agent
-    elif agent_name == "monkey minion":
-        logger.info("Routing to monkey minion.")
-        return monkey_agent
-    else:
-        logger.info("Routing to chat minion.")
-        return receptionist_agent
-
-# Functions representing each agent
-def cat_agent(state: State) -> dict:
-    return invoke_agent(state, cat_model, cat_minion_prompt, "cat minion")
-
-def dog_agent(state: State) -> dict:
-    return invoke_agent(state, dog_model, dog_minion_prompt, "dog minion")
-
-def monkey_agent(state: State) -> dict:
-    return invoke_agent(state, monkey_model, monkey_minion_prompt, "monkey minion")
-
-def receptionist_agent(state: State) -> dict:
-    return invoke_agent(state, receptionist_model, chat_minion_prompt, "chat minion")
-
-# Function to invoke a specific agent
-def invoke_agent(state: State, model: ChatGroq, prompt: ChatPromptTemplate, agent_name: str) -> dict:
-    messages = state['messages']
-    human_input = messages[-1].content if isinstance(messages[-1], HumanMessage) else ""
-    
-    logger.info(f"\033[94m[{agent_name} agent] Received input: {human_input}\033[0m")
-    
-    try:
-        with trace("agent_response"):
-            response = model.invoke(prompt.format(chat_history=messages[:-1], input=human_input))
-        
-        logger.info(f"\033[92m[{agent_name} agent] Response: {response.content}\033[0m")
-        
-        if response.content.strip():
-            return {"messages": state['messages'] + [AIMessage(content=response.content)]}
-        else:
-            logger.warning(f"\033[93m[{agent_name} agent] Empty response from agent\033[0m")
-            return {"messages": state['messages'] + [AIMessage(content="I'm sorry, I couldn't generate a response. Could you try asking something else?")]}    
-    except Exception as e:
-        logger.error(f"\033[91m[{agent_name} agent] Error in invoke_agent function: {str(e)}\033[0m", exc_info=True)
-        return {"messages": state['messages'] + [AIMessage(content="I apologize, but I encountered an error. Can we try again?")]}    
-
-# Tool/helper function for agents to perform basic tasks
-def basic_task_tool(task: str) -> str:
-    if task == "fetch_random_fact":
-        facts = [
-            "Cats sleep for 12-16 hours a day.",
-            "Dogs have a sense of time and can predict future events.",
-            "Monkeys are highly social animals and live in troops.",
-            "The receptionist is here to help direct your query."]
-        return random.choice(facts)
-    return "I cannot perform this task."
-
-# Update each agent to perform a basic task
-def invoke_agent_with_task(state: State, model: ChatGroq, prompt: ChatPromptTemplate, agent_name: str) -> dict:
-    messages = state['messages']
-    human_input = messages[-1].content if isinstance(messages[-1], HumanMessage) else ""
-    
-    logger.info(f"\033[94m[{agent_name} agent] Received input: {human_input}\033[0m")
-    
-    # Example of invoking a basic tool/helper function
-    if "random fact" in human_input.lower():
-        fact = basic_task_tool("fetch_random_fact")
-        logger.info(f"\033[96m[{agent_name} agent] Providing random fact: {fact}\033[0m")
-        return {"messages": state['messages'] + [AIMessage(content=fact)]}
-    
-    try:
-        with trace("agent_response"):
-            response = model.invoke(prompt.format(chat_history=messages[:-1], input=human_input))
-        
-        logger.info(f"\033[92m[{agent_name} agent] Response: {response.content}\033[0m")
-        
-        if response.content.strip():
-            return {"messages": state['messages'] + [AIMessage(content=response.content)]}
-        else:
-            logger.warning(f"\033[93m[{agent_name} agent] Empty response from agent\033[0m")
-            return {"messages": state['messages'] + [AIMessage(content="I'm sorry, I couldn't generate a response. Could you try asking something else?")]}    
-    except Exception as e:
-        logger.error(f"\033[91m[{agent_name} agent] Error in invoke_agent function: {str(e)}\033[0m", exc_info=True)
-        return {"messages": state['messages'] + [AIMessage(content="I apologize, but I encountered an error. Can we try again?")]}    
-
-# Create the state graph and add nodes
-graph = StateGraph(State)
-graph.add_node("orchestrator", lambda state: agent_orchestrator(state['messages'][-1].content)(state))
-graph.set_entry_point("orchestrator")
-graph.add_edge("orchestrator", END)
-
-# Compile the graph
-app = graph.compile()
-
-# Initialize Flask app
-flask_app = Flask(__name__)
-
-# Global state to maintain conversation history
-global_state = {"messages": []}
-
-@flask_app.route('/chat', methods=['POST'])
-def chat():
-    global global_state
-    
-    data = request.json
-    user_question = data.get('userquestion', '')
-    
-    try:
-        with trace("user_interaction"):
-            global_state = app.invoke({"messages": global_state["messages"] + [HumanMessage(content=user_question)]})
-            ai_message = global_state['messages'][-1].content
-        
-        logger.info(f"\nUser: {user_question}\nAI: {ai_message}\n{'-'*50}")
-        return jsonify({"response": ai_message})
-    
-    except Exception as e:
-        logger.error(f"\033[91mError in chat endpoint: {str(e)}\033[0m", exc_info=True)
-        return jsonify({"error": "An error occurred while processing your request."}), 500
-
-if __name__ == '__main__':
-    print("Multi-Agent Chat Server is running. Press Ctrl+C to quit.")
+from flask import Flask, Response, request, jsonify, stream_with_context
+import os
+import json
+import time
+from typing import Annotated, TypedDict, Union, Callable, Iterator, Optional
+from langchain.schema import HumanMessage, AIMessage
+from langchain_groq import ChatGroq
+from langchain_core.runnables import RunnableLambda
+from langgraph.graph import StateGraph, END
+from langgraph.graph.message import add_messages
+import logging
+from langsmith import trace
+import random
+from dotenv import load_dotenv
+from config.gateway import RateLimitExceeded
+from config.models import model_registry_from_env
+from config.resilience import ModelUnavailable
+from minions.history import history_manager_from_env
+from minions.prompts import ChatPrompt
+from minions.response_cache import response_cache_from_env
+from minions.turns import MinionTurns
+from orchestrator.batch import parse_batch_items, run_batch
+from orchestrator.logs import REQUEST_ID_HEADER, bind_log_context, clip, log_context, logging_from_env, request_id_from
+from orchestrator.metrics import METRICS_CONTENT_TYPE, MetricsRegistry, Timer
+from orchestrator.registry import minion_registry_from_env
+from orchestrator.router import DegradedRoute, FastPathRouter
+from orchestrator.routing_cache import RoutingCache
+from orchestrator.sessions import SESSION_COOKIE, SESSION_HEADER, resolve_session_id, session_store_from_env
+from orchestrator.speculation import Speculator
+from orchestrator.workers import worker_health_from_env
+# Load environment variables from .env file
+load_dotenv()
+
+# Set up logging: JSON lines to a size-rotated file and colored text to stderr, written by a background thread
+logging_from_env('multi_agent_orchestrator.log')
+logger = logging.getLogger(__name__)
+
+
+# Access environment variables
+groq_api_key = os.getenv("GROQ_API_KEY")
+langchain_tracing_v2 = os.getenv("LANGCHAIN_TRACING_V2")
+langchain_endpoint = os.getenv("LANGCHAIN_ENDPOINT")
+langchain_api_key = os.getenv("LANGCHAIN_API_KEY")
+langchain_project = os.getenv("LANGCHAIN_PROJECT")
+
+
+# Define chatbot state
+class State(TypedDict):
+    messages: Annotated[list[Union[HumanMessage, AIMessage]], add_messages]  # merged by message id, so a turn adds only its new messages
+    summary: str  # rolling summary of the messages folded out of the history window
+    summarized: int  # number of leading messages covered by the summary
+    route: str  # route that answered the previous turn
+
+# Chat models are declared in src/config/models.json and built on first use over one shared connection pool
+model_registry = model_registry_from_env()
+
+# Minions are declared in src/config/app_minions.json: what each handles, example questions, keywords, prompt and
+# model. The router, the orchestrator prompt and the agents below are all built from it.
+minion_registry = minion_registry_from_env("app_minions.json")
+
+# Model of each minion, by minion name, and of the orchestrator
+minion_models = {name: model_registry.get(minion.model) for name, minion in minion_registry.minions.items()}
+orchestrator_model = model_registry.get(minion_registry.orchestrator_model)
+
+# Latency histograms for routing, model calls and whole requests, exported at /metrics
+metrics_registry = MetricsRegistry()
+routing_seconds = metrics_registry.histogram("minion_routing_seconds", "Time to choose the minion for a question.", ["minion", "outcome"])
+model_seconds = metrics_registry.histogram("minion_model_seconds", "Time spent in a minion's model call.", ["minion", "outcome"])
+request_seconds = metrics_registry.histogram("minion_request_seconds", "Time to answer a chat request end to end.", ["endpoint", "minion", "outcome"])
+
+# Calls waiting for an upstream model's rate limit: how many are queued now, and how long each waited
+model_queue_seconds = metrics_registry.histogram("minion_model_queue_seconds", "Time model calls waited for their model's rate limit.", ["model"])
+model_registry.gateway.on_wait = lambda model_name, seconds: model_queue_seconds.observe(seconds, model=model_name)
+metrics_registry.gauge("minion_model_queue_depth", "Model calls waiting for their model's rate limit.", ["model"],
+                       lambda: {(model_name,): depth for model_name, depth in model_registry.gateway.queue_depth().items()})
+# 1 while a model's circuit breaker is open (failing fast) or half-open (letting a trial call through)
+metrics_registry.gauge("minion_model_circuit_open", "1 while the model's circuit breaker is open or half-open.", ["model"],
+                       lambda: {(model_name,): int(state != "closed") for model_name, state in model_registry.gateway.resilience.circuit_states().items()})
+
+# Local fast-path router; the orchestrator LLM is only consulted when it is not confident
+fast_router = FastPathRouter(
+    routes=minion_registry.route_specs(),
+    fallback=minion_registry.fallback,
+    threshold=float(os.getenv("FAST_ROUTER_THRESHOLD", 0.8)),
+)
+
+# Check the local router against the minions' example questions; a misroute means two minions' keywords overlap
+router_report = fast_router.evaluate(minion_registry.examples())
+logger.info(f"Fast-path router: {router_report['accuracy']:.0%} accuracy, {router_report['coverage']:.0%} coverage on minion examples.")
+
+# Routing decisions for repeated questions, shared by all request threads
+routing_cache = RoutingCache(maxsize=int(os.getenv("ROUTING_CACHE_SIZE", 1024)), ttl=float(os.getenv("ROUTING_CACHE_TTL", 3600)))
+
+# Without the orchestrator LLM (down or rate limited), go with the local router's best guess, however unsure it is. The guess is marked as
+# degraded so it is not cached past the outage.
+def degraded_route(user_question: str, error: Exception) -> DegradedRoute:
+    decision = fast_router.classify(user_question)
+    logger.warning(f"\033[93mOrchestrator model unavailable or rate limited ({error}); routing to {decision.route} (confidence {decision.confidence:.2f}).\033[0m")
+    return DegradedRoute(decision.route)
+
+# Ask the orchestrator LLM which agent should handle the question. Its prompt lists only the minions most likely to
+# fit, so it does not grow with the registry; when none but the fallback resembles the question, there is no choice to ask about.
+def llm_route(user_question: str) -> str:
+    candidates = fast_router.candidates(user_question, minion_registry.candidate_count)
+    if len(candidates) == 1:
+        return candidates[0]
+    try:
+        response = orchestrator_model.invoke(minion_registry.orchestrator_prompt(candidates).messages_for((), user_question))
+    except (ModelUnavailable, RateLimitExceeded) as e:
+        return degraded_route(user_question, e)
+    return minion_registry.resolve(response.content, candidates)
+
+# Ask the orchestrator LLM asynchronously
+async def allm_route(user_question: str) -> str:
+    candidates = fast_router.candidates(user_question, minion_registry.candidate_count)
+    if len(candidates) == 1:
+        return candidates[0]
+    try:
+        response = await orchestrator_model.ainvoke(minion_registry.orchestrator_prompt(candidates).messages_for((), user_question))
+    except (ModelUnavailable, RateLimitExceeded) as e:
+        return degraded_route(user_question, e)
+    return minion_registry.resolve(response.content, candidates)
+
+# Shared by route_question and aroute_question once the agent is chosen: cache a fresh decision (not a degraded
+# guess), label the routing timing and tag the request's log lines with the minion
+def routed(user_question: str, agent_name: str, cached: bool, timing: Timer) -> str:
+    if cached:
+        timing.labels["outcome"] = "cached"
+    elif not isinstance(agent_name, DegradedRoute):
+        routing_cache.put(user_question, agent_name)
+    timing.labels["minion"] = agent_name if agent_name in route_agents else "other"
+    bind_log_context(minion=agent_name)
+    return agent_name
+
+# Reuse a cached decision, route locally when confident, otherwise invoke orchestrator LLM to determine routing.
+# before_llm runs only when the orchestrator LLM is about to be called.
+def route_question(user_question: str, before_llm: Callable[[], None] = lambda: None) -> str:
+    with routing_seconds.time() as timing:
+        agent_name = routing_cache.get(user_question)
+        if agent_name is not None:
+            return routed(user_question, agent_name, True, timing)
+        def ask_llm(question: str) -> str:
+            before_llm()
+            return llm_route(question)
+        return routed(user_question, fast_router.route(user_question, ask_llm), False, timing)
+
+async def aroute_question(user_question: str, before_llm: Callable[[], None] = lambda: None) -> str:
+    with routing_seconds.time() as timing:
+        agent_name = routing_cache.get(user_question)
+        if agent_name is not None:
+            return routed(user_question, agent_name, True, timing)
+        async def ask_llm(question: str) -> str:
+            before_llm()
+            return await allm_route(question)
+        return routed(user_question, await fast_router.aroute(user_question, ask_llm), False, timing)
+
+# Map a routing decision to the agent that handles it; an unknown name goes to the fallback minion
+def select_agent(agent_name: str) -> Callable[[State], dict]:
+    agent = route_agents.get(agent_name) or route_agents[minion_registry.fallback]
+    logger.info(f"Routing to {agent_routes[agent]}.")
+    return agent
+
+# Function to determine which agent to use
+def agent_orchestrator(user_question: str) -> Callable[[State], dict]:
+    return select_agent(route_question(user_question))
+
+# One agent per minion, running the minion's prompt on its model
+def minion_agent(name: str) -> Callable[[State], dict]:
+    def agent(state: State) -> dict:
+        return invoke_agent(state, minion_models[name], minion_registry.prompt(name), name)
+    agent.__name__ = f"{name.replace(' ', '_')}_agent"
+    return agent
+
+# Routes the local router can name, and the agent behind each
+route_agents = {name: minion_agent(name) for name in minion_registry.minions}
+agent_routes = {agent: route for route, agent in route_agents.items()}
+
+# Async counterparts of each agent, keyed by the sync agent that select_agent returns
+async_agents = {
+    agent: lambda state, name=name: ainvoke_agent(state, minion_models[name], minion_registry.prompt(name), name)
+    for name, agent in route_agents.items()
+}
+
+# Streaming counterparts of each agent; they yield text chunks and fill `result` with the state update
+streaming_agents = {
+    agent: lambda state, result, name=name: stream_agent(state, minion_models[name], minion_registry.prompt(name), name, result)
+    for name, agent in route_agents.items()
+}
+
+astreaming_agents = {
+    agent: lambda state, result, name=name: astream_agent(state, minion_models[name], minion_registry.prompt(name), name, result)
+    for name, agent in route_agents.items()
+}
+
+# Token-budgeted chat history: recent turns verbatim, older turns folded into a rolling summary
+history_manager = history_manager_from_env()
+
+# Opt-in cache of minion answers for repeated and near-duplicate questions
+response_cache = response_cache_from_env()
+
+# The work around each model call that the sync, async and streaming agents share: the response cache, the
+# history window, logging, fallbacks for empty answers and errors, and the model call metrics
+minion_turns = MinionTurns(history_manager, response_cache, model_seconds=model_seconds, trace_name="agent_response")
+
+# Function to invoke a specific agent
+def invoke_agent(state: State, model: ChatGroq, prompt: ChatPrompt, agent_name: str) -> dict:
+    turn = minion_turns.begin(state, model, prompt, agent_name)
+    hit = turn.cached()
+    if hit is not None:
+        return turn.update(hit.content)
+    model_input = turn.model_input()
+    try:
+        with turn.timed():
+            response = model.invoke(model_input)
+        return turn.update(turn.answered(response.content))
+    except Exception as e:
+        return turn.update(turn.failed(e, "invoke_agent"))
+
+# Async variant of invoke_agent, used by the ASGI server
+async def ainvoke_agent(state: State, model: ChatGroq, prompt: ChatPrompt, agent_name: str) -> dict:
+    turn = minion_turns.begin(state, model, prompt, agent_name)
+    hit = turn.cached()
+    if hit is not None:
+        return turn.update(hit.content)
+    model_input = turn.model_input()
+    try:
+        with turn.timed():
+            response = await model.ainvoke(model_input)
+        return turn.update(turn.answered(response.content))
+    except Exception as e:
+        return turn.update(turn.failed(e, "ainvoke_agent"))
+
+# Streaming variant of invoke_agent: yields text chunks as the model produces them
+def stream_agent(state: State, model: ChatGroq, prompt: ChatPrompt, agent_name: str, result: dict) -> Iterator[str]:
+    result["agent"] = agent_name
+    turn = minion_turns.begin(state, model, prompt, agent_name)
+    hit = turn.cached()
+    if hit is not None:
+        yield hit.content
+        result.update(turn.update(hit.content))
+        return
+    model_input = turn.model_input()
+    chunks = []
+    try:
+        with turn.timed():
+            for chunk in model.stream(model_input):
+                if chunk.content:
+                    chunks.append(chunk.content)
+                    yield chunk.content
+        streamed = "".join(chunks)
+        content = turn.answered(streamed)
+        if content != streamed:
+            yield content
+    except Exception as e:
+        content = turn.failed(e, "stream_agent")
+        yield content if not chunks else f"\n\n{content}"
+        content = "".join(chunks) + (f"\n\n{content}" if chunks else content)
+    result.update(turn.update(content))
+
+# Async streaming variant of invoke_agent, used by the ASGI server
+async def astream_agent(state: State, model: ChatGroq, prompt: ChatPrompt, agent_name: str, result: dict):
+    result["agent"] = agent_name
+    turn = minion_turns.begin(state, model, prompt, agent_name)
+    hit = turn.cached()
+    if hit is not None:
+        yield hit.content
+        result.update(turn.update(hit.content))
+        return
+    model_input = turn.model_input()
+    chunks = []
+    try:
+        with turn.timed():
+            async for chunk in model.astream(model_input):
+                if chunk.content:
+                    chunks.append(chunk.content)
+                    yield chunk.content
+        streamed = "".join(chunks)
+        content = turn.answered(streamed)
+        if content != streamed:
+            yield content
+    except Exception as e:
+        content = turn.failed(e, "astream_agent")
+        yield content if not chunks else f"\n\n{content}"
+        content = "".join(chunks) + (f"\n\n{content}" if chunks else content)
+    result.update(turn.update(content))
+
+# Tool/helper function for agents to perform basic tasks
+def basic_task_tool(task: str) -> str:
+    if task == "fetch_random_fact":
+        facts = [
+            "Cats sleep for 12-16 hours a day.",
+            "Dogs have a sense of time and can predict future events.",
+            "Monkeys are highly social animals and live in troops.",
+            "The receptionist is here to help direct your query."]
+        return random.choice(facts)
+    return "I cannot perform this task."
+
+# Update each agent to perform a basic task
+def invoke_agent_with_task(state: State, model: ChatGroq, prompt: ChatPrompt, agent_name: str) -> dict:
+    turn = minion_turns.begin(state, model, prompt, agent_name)
+    
+    # Example of invoking a basic tool/helper function
+    if "random fact" in turn.human_input.lower():
+        fact = basic_task_tool("fetch_random_fact")
+        logger.info(f"\033[96m[{agent_name} agent] Providing random fact: {fact}\033[0m")
+        return turn.update(fact)
+    
+    model_input = turn.model_input()
+    try:
+        with turn.timed():
+            response = model.invoke(model_input)
+        return turn.update(turn.answered(response.content, cache=False))
+    except Exception as e:
+        return turn.update(turn.failed(e, "invoke_agent_with_task"))
+
+# Opt-in speculative routing: while the orchestrator LLM decides, the likely agent already starts answering
+speculator = Speculator(
+    enabled=os.getenv("SPECULATIVE_ROUTING", "0") == "1",
+    max_workers=int(os.getenv("SPECULATION_WORKERS", 8)),
+)
+
+# Cheap guess at the agent for this turn: the local router's best guess, else the agent that answered last
+def predict_agent(state: State) -> Optional[Callable[[State], dict]]:
+    decision = fast_router.classify(state['messages'][-1].content)
+    if decision.confidence > 0:
+        return route_agents.get(decision.route)
+    return route_agents.get(state.get('route'))
+
+# Create the state graph and add nodes
+# Orchestrator node: route the question, then answer with the chosen agent (or the speculative answer)
+def orchestrate(state: State) -> dict:
+    speculation = speculator.begin(predict_agent(state) if speculator.enabled else None, lambda agent: agent(state))
+    agent = select_agent(route_question(state['messages'][-1].content, before_llm=speculation.start))
+    return session_store.turn_update(state, {**speculation.finish(agent), "route": agent_routes[agent]})
+
+# Async orchestrator node: route and answer with the models' async APIs
+async def aorchestrate(state: State) -> dict:
+    speculation = speculator.abegin(predict_agent(state) if speculator.enabled else None, lambda agent: async_agents[agent](state))
+    agent = select_agent(await aroute_question(state['messages'][-1].content, before_llm=speculation.start))
+    return session_store.turn_update(state, {**await speculation.finish(agent), "route": agent_routes[agent]})
+
+graph = StateGraph(State)
+graph.add_node("orchestrator", RunnableLambda(orchestrate, afunc=aorchestrate))
+graph.set_entry_point("orchestrator")
+graph.add_edge("orchestrator", END)
+
+# Per-session conversation state, keyed by the X-Session-ID header or session_id cookie
+session_store = session_store_from_env()
+
+# Compile the graph; each session is a checkpointed thread, so a turn sends only its new message
+app = graph.compile(checkpointer=session_store.checkpointer)
+
+# Initialize Flask app
+flask_app = Flask(__name__)
+
+# Requests handled and in flight in this worker, reported with the other workers' at /health; under the pre-fork
+# server its metric series are shared too, so /metrics exports every worker's
+worker_health = worker_health_from_env(metrics=metrics_registry.snapshot)
+flask_app.wsgi_app = worker_health.wsgi(flask_app.wsgi_app)
+
+@flask_app.route('/chat', methods=['POST'])
+def chat():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object."}), 400
+    user_question = data.get('userquestion', '')
+    session_id, is_new_session = resolve_session_id(request.headers.get(SESSION_HEADER), request.cookies.get(SESSION_COOKIE))
+    request_id = request_id_from(request.headers.get(REQUEST_ID_HEADER))
+    
+    with log_context(request_id=request_id):
+        try:
+            with request_seconds.time(endpoint="/chat") as timing, trace("user_interaction"), session_store.thread(session_id) as config:
+                state = app.invoke({"messages": [HumanMessage(content=user_question)]}, config)
+                ai_message = state['messages'][-1].content
+                timing.labels["minion"] = state.get("route", "")
+            
+            logger.info(f"\nUser: {clip(user_question)}\nAI: {clip(ai_message)}\n{'-'*50}")
+            response = jsonify({"response": ai_message, "session_id": session_id})
+            response.headers[REQUEST_ID_HEADER] = request_id
+            if is_new_session:
+                response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite="Lax")
+            return response
+        
+        except Exception as e:
+            logger.error(f"\033[91mError in chat endpoint: {str(e)}\033[0m", exc_info=True)
+            return jsonify({"error": "An error occurred while processing your request."}), 500, {REQUEST_ID_HEADER: request_id}
+
+# Batch limits: items accepted per request, and how many routing/minion calls run at once
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 1000))
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", 8))
+
+# Answer one batch item in its session with an already-routed agent
+def answer_batch_item(item: dict, agent: Callable[[State], dict]) -> str:
+    with session_store.session(item["session_id"]) as state:
+        turn = {**state, "messages": state["messages"] + [HumanMessage(content=item["question"])]}
+        state.update({**turn, **agent(turn), "route": agent_routes[agent]})
+        return state['messages'][-1].content
+
+# Many independent questions in one call: {"items": [{"userquestion": ..., "session_id": ...}, ...]}.
+# Results come back in request order, with an "error" instead of a "response" for items that failed.
+@flask_app.route('/chat/batch', methods=['POST'])
+def chat_batch():
+    items, error = parse_batch_items(request.get_json(silent=True), BATCH_MAX_ITEMS)
+    if error:
+        return jsonify({"error": error}), 400
+    
+    started = time.perf_counter()
+    request_id = request_id_from(request.headers.get(REQUEST_ID_HEADER))
+    with log_context(request_id=request_id), request_seconds.time(endpoint="/chat/batch"), trace("batch_interaction"):
+        results, groups = run_batch(items, lambda question: select_agent(route_question(question)), answer_batch_item, agent_routes.get, BATCH_WORKERS)
+        
+        elapsed = time.perf_counter() - started
+        failed = sum(1 for result in results if "error" in result)
+        logger.info(f"Batch of {len(items)} items answered in {elapsed:.3f}s ({failed} failed); routes: {groups}")
+    return jsonify({"results": results, "groups": groups}), 200, {REQUEST_ID_HEADER: request_id}
+
+# Server-sent event carrying one JSON payload
+def sse_event(payload: dict) -> str:
+    return f"data: {json.dumps(payload)}\n\n"
+
+# Streaming variant of /chat: an "agent" event, then "token" events as the model produces them,
+# then a final event with the full response; time to first token is logged with the total latency
+@flask_app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object."}), 400
+    user_question = data.get('userquestion', '')
+    session_id, is_new_session = resolve_session_id(request.headers.get(SESSION_HEADER), request.cookies.get(SESSION_COOKIE))
+    request_id = request_id_from(request.headers.get(REQUEST_ID_HEADER))
+    
+    def generate():
+        with log_context(request_id=request_id):
+            yield from answer_stream()
+    
+    def answer_stream():
+        started = time.perf_counter()
+        first_token_at = None
+        try:
+            with request_seconds.time(endpoint="/chat/stream") as timing, trace("user_interaction"), session_store.session(session_id) as state:
+                turn = {**state, "messages": state["messages"] + [HumanMessage(content=user_question)]}
+                result = {}
+                agent = agent_orchestrator(user_question)
+                timing.labels["minion"] = agent_routes[agent]
+                for token in streaming_agents[agent](turn, result):
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        yield sse_event({"agent": result["agent"]})
+                    yield sse_event({"token": token})
+                result.pop("agent", None)
+                state.update({**turn, **result})
+                ai_message = state['messages'][-1].content
+            
+            total = time.perf_counter() - started
+            ttft = (first_token_at or time.perf_counter()) - started
+            logger.info(f"\nUser: {clip(user_question)}\nAI: {clip(ai_message)}\nTime to first token: {ttft:.3f}s, total: {total:.3f}s\n{'-'*50}")
+            yield sse_event({"done": True, "response": ai_message, "session_id": session_id})
+        
+        except Exception as e:
+            logger.error(f"\033[91mError in chat stream endpoint: {str(e)}\033[0m", exc_info=True)
+            yield sse_event({"error": "An error occurred while processing your request."})
+    
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    response.headers[REQUEST_ID_HEADER] = request_id
+    if is_new_session:
+        response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite="Lax")
+    return response
+
+@flask_app.route('/routing/stats', methods=['GET'])
+def routing_stats():
+    return jsonify({"router": fast_router.stats(), "cache": routing_cache.stats(), "speculation": speculator.stats()})
+
+@flask_app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(response_cache.stats())
+
+# Latency histograms in Prometheus text format; under the pre-fork server, every live worker's with a "worker" label
+@flask_app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(metrics_registry.render(worker_health.worker_metrics()), content_type=METRICS_CONTENT_TYPE)
+
+# Liveness and per-worker health: this worker's counters and model circuits, and every worker's last heartbeat
+@flask_app.route('/health', methods=['GET'])
+def health():
+    return jsonify({
+        "status": "ok",
+        "worker": worker_health.snapshot(),
+        "workers": worker_health.workers(),
+        "circuits": model_registry.gateway.resilience.circuit_states(),
+        "sessions": session_store.stats(),
+    })
+
+if __name__ == '__main__':
+    print("Multi-Agent Chat Server is running. Press Ctrl+C to quit.")
     flask_app.run(debug=True, port=5000, use_reloader=False)
\ No newline at end of file
@@ -0,0 +1,254 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from http.cookies import SimpleCookie
+from typing import Optional
+
+from langchain.schema import HumanMessage
+from langsmith import trace
+
+from app import BATCH_MAX_ITEMS, BATCH_WORKERS, agent_routes, app, aroute_question, astreaming_agents, async_agents, metrics_registry, model_registry, request_seconds, select_agent, session_store
+from orchestrator.batch import arun_batch, parse_batch_items
+from orchestrator.logs import REQUEST_ID_HEADER, clip, log_context, request_id_from
+from orchestrator.metrics import METRICS_CONTENT_TYPE
+from orchestrator.sessions import SESSION_COOKIE, SESSION_HEADER, resolve_session_id
+
+logger = logging.getLogger(__name__)
+
+# Concurrency limits for the async server
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", 64))  # requests running the graph at once
+QUEUE_TIMEOUT = float(os.getenv("QUEUE_TIMEOUT", 2.0))  # seconds a request may wait for a slot before a 429
+RETRY_AFTER = int(os.getenv("RETRY_AFTER", 1))  # seconds suggested to clients in the Retry-After header
+
+
+class ChatASGIApp:
+    """ASGI application serving the same /chat contract as the Flask app, using the models' async APIs."""
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_REQUESTS, queue_timeout: float = QUEUE_TIMEOUT, retry_after: int = RETRY_AFTER):
+        self.max_concurrent = max_concurrent
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.rejected = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            request_id = request_id_from(dict(scope["headers"]).get(REQUEST_ID_HEADER.lower().encode(), b"").decode("latin-1"))
+            with log_context(request_id=request_id):
+                await self._dispatch(scope, receive, self._tag_response(send, request_id))
+
+    async def _dispatch(self, scope, receive, send):
+        if scope["path"] == "/chat" and scope["method"] == "POST":
+            await self._chat(scope, receive, send)
+        elif scope["path"] == "/chat/stream" and scope["method"] == "POST":
+            await self._chat_stream(scope, receive, send)
+        elif scope["path"] == "/chat/batch" and scope["method"] == "POST":
+            await self._chat_batch(receive, send)
+        elif scope["path"] == "/metrics" and scope["method"] == "GET":
+            await self._metrics(send)
+        elif scope["path"] in ("/chat", "/chat/stream", "/chat/batch", "/metrics"):
+            await self._send_json(send, 405, {"error": "Method not allowed."})
+        else:
+            await self._send_json(send, 404, {"error": "Not found."})
+
+    # Echo the request id on every response, so a client can find its request in the logs
+    @staticmethod
+    def _tag_response(send, request_id: str):
+        async def tagged(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"x-request-id", request_id.encode())]}
+            await send(message)
+        return tagged
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                logger.info(f"Async chat server started (max {self.max_concurrent} concurrent requests).")
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await model_registry.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    # Created lazily so it binds to the server's event loop
+    @property
+    def slots(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+        return self._slots
+
+    # Question and session of a /chat request; None after answering a malformed request with a 400
+    async def _parse_request(self, scope, receive, send) -> Optional[tuple[str, str, bool]]:
+        try:
+            data = json.loads(await self._read_body(receive) or b"{}")
+        except ValueError:
+            await self._send_json(send, 400, {"error": "Request body must be JSON."})
+            return None
+        if not isinstance(data, dict):
+            await self._send_json(send, 400, {"error": "Request body must be a JSON object."})
+            return None
+        user_question = data.get('userquestion', '')
+
+        headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]}
+        cookies = SimpleCookie(headers.get("cookie", ""))
+        session_id, is_new_session = resolve_session_id(
+            headers.get(SESSION_HEADER.lower()),
+            cookies[SESSION_COOKIE].value if SESSION_COOKIE in cookies else None,
+        )
+        return user_question, session_id, is_new_session
+
+    # Backpressure: wait briefly for a free slot, then shed load with a 429 instead of queueing forever
+    async def _acquire_slot(self, send) -> bool:
+        try:
+            await asyncio.wait_for(self.slots.acquire(), timeout=self.queue_timeout)
+            return True
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            logger.warning(f"Rejecting request: {self.max_concurrent} requests already in flight.")
+            await self._send_json(send, 429, {"error": "Server is busy, please retry shortly."}, [(b"retry-after", str(self.retry_after).encode())])
+            return False
+
+    @staticmethod
+    def _session_cookie(session_id: str) -> tuple[bytes, bytes]:
+        return (b"set-cookie", f"{SESSION_COOKIE}={session_id}; HttpOnly; Path=/; SameSite=Lax".encode())
+
+    async def _chat(self, scope, receive, send):
+        parsed = await self._parse_request(scope, receive, send)
+        if parsed is None or not await self._acquire_slot(send):
+            return
+        user_question, session_id, is_new_session = parsed
+
+        try:
+            with request_seconds.time(endpoint="/chat") as timing, trace("user_interaction"):
+                async with session_store.athread(session_id) as config:
+                    state = await app.ainvoke({"messages": [HumanMessage(content=user_question)]}, config)
+                    ai_message = state['messages'][-1].content
+                    timing.labels["minion"] = state.get("route", "")
+
+            logger.info(f"\nUser: {clip(user_question)}\nAI: {clip(ai_message)}\n{'-'*50}")
+            extra_headers = [self._session_cookie(session_id)] if is_new_session else []
+            await self._send_json(send, 200, {"response": ai_message, "session_id": session_id}, extra_headers)
+        except Exception as e:
+            logger.error(f"\033[91mError in async chat endpoint: {str(e)}\033[0m", exc_info=True)
+            await self._send_json(send, 500, {"error": "An error occurred while processing your request."})
+        finally:
+            self.slots.release()
+
+    # Same server-sent event stream as the Flask /chat/stream route
+    async def _chat_stream(self, scope, receive, send):
+        parsed = await self._parse_request(scope, receive, send)
+        if parsed is None or not await self._acquire_slot(send):
+            return
+        user_question, session_id, is_new_session = parsed
+
+        try:
+            headers = [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache")]
+            if is_new_session:
+                headers.append(self._session_cookie(session_id))
+            await send({"type": "http.response.start", "status": 200, "headers": headers})
+
+            started = time.perf_counter()
+            first_token_at = None
+            try:
+                with request_seconds.time(endpoint="/chat/stream") as timing, trace("user_interaction"):
+                    async with session_store.asession(session_id) as state:
+                        turn = {**state, "messages": state["messages"] + [HumanMessage(content=user_question)]}
+                        result = {}
+                        agent = select_agent(await aroute_question(user_question))
+                        timing.labels["minion"] = agent_routes[agent]
+                        async for token in astreaming_agents[agent](turn, result):
+                            if first_token_at is None:
+                                first_token_at = time.perf_counter()
+                                await self._send_event(send, {"agent": result["agent"]})
+                            await self._send_event(send, {"token": token})
+                        result.pop("agent", None)
+                        state.update({**turn, **result})
+                        ai_message = state['messages'][-1].content
+
+                total = time.perf_counter() - started
+                ttft = (first_token_at or time.perf_counter()) - started
+                logger.info(f"\nUser: {clip(user_question)}\nAI: {clip(ai_message)}\nTime to first token: {ttft:.3f}s, total: {total:.3f}s\n{'-'*50}")
+                await self._send_event(send, {"done": True, "response": ai_message, "session_id": session_id})
+            except Exception as e:
+                logger.error(f"\033[91mError in async chat stream endpoint: {str(e)}\033[0m", exc_info=True)
+                await self._send_event(send, {"error": "An error occurred while processing your request."})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            self.slots.release()
+
+    # Same contract as the Flask /chat/batch route; the whole batch holds one slot and fans out
+    # to at most BATCH_WORKERS concurrent model calls
+    async def _chat_batch(self, receive, send):
+        try:
+            data = json.loads(await self._read_body(receive) or b"{}")
+        except ValueError:
+            data = None
+        items, error = parse_batch_items(data, BATCH_MAX_ITEMS)
+        if error:
+            await self._send_json(send, 400, {"error": error})
+            return
+        if not await self._acquire_slot(send):
+            return
+
+        async def answer(item: dict, agent) -> str:
+            async with session_store.asession(item["session_id"]) as state:
+                turn = {**state, "messages": state["messages"] + [HumanMessage(content=item["question"])]}
+                state.update({**turn, **await async_agents[agent](turn), "route": agent_routes[agent]})
+                return state['messages'][-1].content
+
+        async def route(question: str):
+            return select_agent(await aroute_question(question))
+
+        try:
+            started = time.perf_counter()
+            with request_seconds.time(endpoint="/chat/batch"), trace("batch_interaction"):
+                results, groups = await arun_batch(items, route, answer, agent_routes.get, BATCH_WORKERS)
+            failed = sum(1 for result in results if "error" in result)
+            logger.info(f"Batch of {len(items)} items answered in {time.perf_counter() - started:.3f}s ({failed} failed); routes: {groups}")
+            await self._send_json(send, 200, {"results": results, "groups": groups})
+        except Exception as e:
+            logger.error(f"\033[91mError in async chat batch endpoint: {str(e)}\033[0m", exc_info=True)
+            await self._send_json(send, 500, {"error": "An error occurred while processing your request."})
+        finally:
+            self.slots.release()
+
+    # Latency histograms in Prometheus text format, shared with the Flask app in the same process
+    @staticmethod
+    async def _metrics(send):
+        body = metrics_registry.render().encode()
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", METRICS_CONTENT_TYPE.encode()), (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+
+    @staticmethod
+    async def _send_event(send, payload: dict):
+        await send({"type": "http.response.body", "body": f"data: {json.dumps(payload)}\n\n".encode(), "more_body": True})
+
+    @staticmethod
+    async def _read_body(receive) -> bytes:
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                return body
+
+    @staticmethod
+    async def _send_json(send, status: int, payload: dict, extra_headers: Optional[list] = None):
+        body = json.dumps(payload).encode()
+        headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        await send({"type": "http.response.start", "status": status, "headers": headers + (extra_headers or [])})
+        await send({"type": "http.response.body", "body": body})
+
+
+application = ChatASGIApp()
+
+if __name__ == '__main__':
+    import uvicorn
+
+    print("Async Multi-Agent Chat Server is running. Press Ctrl+C to quit.")
+    uvicorn.run(application, host=os.getenv("HOST", "127.0.0.1"), port=int(os.getenv("PORT", 5000)))
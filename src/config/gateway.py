@@ -0,0 +1,331 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Awaitable, Callable, Hashable, Iterator, Optional
+
+from .resilience import ResiliencePolicy
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitExceeded(RuntimeError):
+    """The model's request or token budget would not admit the call within the gateway's max_wait."""
+
+
+class TokenBucket:
+    """A per-minute budget that refills continuously, up to one minute's worth.
+
+    Callers reserve what they need straight away, even past zero, and then wait out the deficit, so
+    waiting callers are served in arrival order.
+    """
+
+    def __init__(self, per_minute: float, clock: Callable[[], float] = time.monotonic):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self._clock = clock
+        self._level = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    # Take `amount` from the budget; returns how long the caller must wait before spending it
+    def reserve(self, amount: float) -> float:
+        with self._lock:
+            self._refill()
+            self._level -= amount
+            return 0.0 if self._level >= 0 else -self._level / self.rate
+
+    def refund(self, amount: float) -> None:
+        with self._lock:
+            self._refill()
+            self._level = min(self.capacity, self._level + amount)
+
+    @property
+    def available(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._level
+
+
+class _ModelBudget:
+    def __init__(self, requests_per_minute: Optional[float], tokens_per_minute: Optional[float], clock: Callable[[], float]):
+        self.requests = TokenBucket(requests_per_minute, clock) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute, clock) if tokens_per_minute else None
+        self.waiting = 0
+        self.admitted = 0
+        self.delayed = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+
+
+# Rough token count for budgeting: about four characters per token, as the history manager assumes
+def estimate_tokens(prompt: Any) -> int:
+    return len(prompt_text(prompt)) // 4 + 1
+
+# Prompt as plain text, whichever form the caller passed it in (string, prompt value or message list)
+def prompt_text(prompt: Any) -> str:
+    if isinstance(prompt, str):
+        return prompt
+    if hasattr(prompt, "to_messages"):
+        prompt = prompt.to_messages()
+    if isinstance(prompt, (list, tuple)):
+        return "\n".join(f"{getattr(message, 'type', '')}: {getattr(message, 'content', message)}" for message in prompt)
+    return str(prompt)
+
+
+class ModelGateway:
+    """Every upstream model call passes through here.
+
+    Identical prompts already in flight to the same model share one call. Each upstream model has a
+    requests-per-minute and a tokens-per-minute budget; a call that would exceed it waits for the
+    budget to refill, and is rejected only if that would take longer than `max_wait` seconds.
+    With a ResiliencePolicy, the shared call gets its deadline, retries, circuit breaker and hedging
+    from it, and every attempt is budgeted. Streams are budgeted but never shared.
+    """
+
+    def __init__(
+        self,
+        limits: Optional[dict[str, dict]] = None,
+        max_wait: float = 30.0,
+        completion_tokens: int = 256,
+        coalesce: bool = True,
+        clock: Callable[[], float] = time.monotonic,
+        on_wait: Optional[Callable[[str, float], None]] = None,
+        resilience: Optional[ResiliencePolicy] = None,
+    ):
+        self.limits = dict(limits or {})
+        self._configured_limits = self.limits
+        self.max_wait = max_wait
+        self.completion_tokens = completion_tokens
+        self.coalesce = coalesce
+        self.on_wait = on_wait  # called with (model_name, seconds) whenever a call waited for its budget
+        self.resilience = resilience
+        self._clock = clock
+        self._budgets: dict[str, _ModelBudget] = {}
+        self._inflight: dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self._coalesced = 0
+
+    def _budget(self, model_name: str) -> _ModelBudget:
+        budget = self._budgets.get(model_name)
+        if budget is None:
+            with self._lock:
+                budget = self._budgets.get(model_name)
+                if budget is None:
+                    limit = self.limits.get(model_name, self.limits.get("default", {}))
+                    budget = self._budgets[model_name] = _ModelBudget(
+                        limit.get("requests_per_minute"), limit.get("tokens_per_minute"), self._clock
+                    )
+        return budget
+
+    # Keep this process to 1/shares of every configured budget, for a server that runs `shares` processes, each with
+    # its own gateway, against the same upstream account. Budgets already in use start over.
+    def split_limits(self, shares: int) -> None:
+        with self._lock:
+            self.limits = {
+                name: {setting: value / shares for setting, value in limit.items()}
+                for name, limit in self._configured_limits.items()
+            }
+            self._budgets.clear()
+
+    # Reserve one request and the estimated tokens; returns the wait, or raises if it is too long
+    def _reserve(self, model_name: str, tokens: int) -> tuple[_ModelBudget, float]:
+        budget = self._budget(model_name)
+        waits = []
+        if budget.requests is not None:
+            waits.append(budget.requests.reserve(1))
+        if budget.tokens is not None:
+            waits.append(budget.tokens.reserve(tokens))
+        wait = max(waits, default=0.0)
+        with self._lock:
+            if wait > self.max_wait:
+                budget.rejected += 1
+                rejected = True
+            else:
+                rejected = False
+                budget.admitted += 1
+                if wait > 0:
+                    budget.delayed += 1
+                    budget.wait_seconds += wait
+                    budget.waiting += 1
+        if rejected:
+            if budget.requests is not None:
+                budget.requests.refund(1)
+            if budget.tokens is not None:
+                budget.tokens.refund(tokens)
+            raise RateLimitExceeded(f"{model_name} is over its rate limit; the next slot is {wait:.1f}s away")
+        if wait > 0:
+            logger.info(f"\033[93mQueueing a {model_name} call for {wait:.2f}s to stay within its rate limit.\033[0m")
+        return budget, wait
+
+    def _waited(self, model_name: str, budget: _ModelBudget, wait: float) -> None:
+        with self._lock:
+            budget.waiting -= 1
+        if self.on_wait is not None:
+            self.on_wait(model_name, wait)
+
+    # Block until the model's budget admits a call of about `tokens` tokens
+    def admit(self, model_name: str, tokens: int) -> None:
+        budget, wait = self._reserve(model_name, tokens + self.completion_tokens)
+        if wait > 0:
+            try:
+                time.sleep(wait)
+            finally:
+                self._waited(model_name, budget, wait)
+
+    async def aadmit(self, model_name: str, tokens: int) -> None:
+        budget, wait = self._reserve(model_name, tokens + self.completion_tokens)
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._waited(model_name, budget, wait)
+
+    # Admit a call only if the budget has room for it right now, e.g. for a hedged request
+    def try_admit(self, model_name: str, tokens: int) -> bool:
+        budget = self._budget(model_name)
+        tokens += self.completion_tokens
+        if budget.requests is not None and budget.requests.available < 1:
+            return False
+        if budget.tokens is not None and budget.tokens.available < tokens:
+            return False
+        if budget.requests is not None:
+            budget.requests.reserve(1)
+        if budget.tokens is not None:
+            budget.tokens.reserve(tokens)
+        with self._lock:
+            budget.admitted += 1
+        return True
+
+    # Charge the difference between the estimate and the tokens the response reports it used
+    def settle(self, model_name: str, estimated: int, response: Any) -> None:
+        usage = getattr(response, "usage_metadata", None) or {}
+        actual = usage.get("total_tokens")
+        budget = self._budget(model_name)
+        if actual is None or budget.tokens is None:
+            return
+        difference = estimated + self.completion_tokens - actual
+        if difference > 0:
+            budget.tokens.refund(difference)
+        elif difference < 0:
+            budget.tokens.reserve(-difference)
+
+    # The in-flight call this key should wait on, or None when the caller is to make the call itself
+    def _join(self, key: Hashable) -> Optional[Future]:
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self._coalesced += 1
+                return future
+            self._inflight[key] = Future()
+            return None
+
+    def _publish(self, key: Hashable, result: Any = None, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            future = self._inflight.pop(key)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    # `timeout` bounds each attempt when there is a resilience policy; the policy's deadline bounds the whole call
+    def invoke(self, model_name: str, key: Hashable, prompt: Any, call: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        if self.coalesce:
+            future = self._join(key)
+            if future is not None:
+                return future.result()
+        try:
+            tokens = estimate_tokens(prompt)
+            if self.resilience is None:
+                self.admit(model_name, tokens)
+                result = call()
+            else:
+                result = self.resilience.call(
+                    model_name, call, timeout,
+                    admit=lambda: self.admit(model_name, tokens),
+                    try_admit=lambda: self.try_admit(model_name, tokens),
+                )
+            self.settle(model_name, tokens, result)
+        except BaseException as e:
+            if self.coalesce:
+                self._publish(key, error=e)
+            raise
+        if self.coalesce:
+            self._publish(key, result)
+        return result
+
+    async def ainvoke(self, model_name: str, key: Hashable, prompt: Any, call: Callable[[], Awaitable[Any]], timeout: Optional[float] = None) -> Any:
+        if self.coalesce:
+            future = self._join(key)
+            if future is not None:
+                return await asyncio.wrap_future(future)
+        try:
+            tokens = estimate_tokens(prompt)
+            if self.resilience is None:
+                await self.aadmit(model_name, tokens)
+                result = await call()
+            else:
+                result = await self.resilience.acall(
+                    model_name, call, timeout,
+                    admit=lambda: self.aadmit(model_name, tokens),
+                    try_admit=lambda: self.try_admit(model_name, tokens),
+                )
+            self.settle(model_name, tokens, result)
+        except BaseException as e:
+            if self.coalesce:
+                self._publish(key, error=e)
+            raise
+        if self.coalesce:
+            self._publish(key, result)
+        return result
+
+    def stream(self, model_name: str, prompt: Any, open_stream: Callable[[], Iterator]) -> Iterator:
+        tokens = estimate_tokens(prompt)
+        if self.resilience is None:
+            self.admit(model_name, tokens)
+            yield from open_stream()
+        else:
+            yield from self.resilience.stream(model_name, open_stream, admit=lambda: self.admit(model_name, tokens))
+
+    async def astream(self, model_name: str, prompt: Any, open_stream: Callable[[], AsyncIterator]) -> AsyncIterator:
+        tokens = estimate_tokens(prompt)
+        if self.resilience is None:
+            await self.aadmit(model_name, tokens)
+            chunks = open_stream()
+        else:
+            chunks = self.resilience.astream(model_name, open_stream, admit=lambda: self.aadmit(model_name, tokens))
+        async for chunk in chunks:
+            yield chunk
+
+    def queue_depth(self) -> dict[str, int]:
+        with self._lock:
+            return {model_name: budget.waiting for model_name, budget in self._budgets.items()}
+
+    def stats(self) -> dict:
+        with self._lock:
+            models = {
+                model_name: {
+                    "waiting": budget.waiting,
+                    "admitted": budget.admitted,
+                    "delayed": budget.delayed,
+                    "rejected": budget.rejected,
+                    "wait_seconds": round(budget.wait_seconds, 3),
+                }
+                for model_name, budget in self._budgets.items()
+            }
+            coalesced, inflight = self._coalesced, len(self._inflight)
+        for model_name, budget in list(self._budgets.items()):
+            if budget.requests is not None:
+                models[model_name]["requests_available"] = round(budget.requests.available, 1)
+            if budget.tokens is not None:
+                models[model_name]["tokens_available"] = round(budget.tokens.available)
+        stats = {"coalesced": coalesced, "inflight": inflight, "max_wait": self.max_wait, "models": models}
+        if self.resilience is not None:
+            stats["resilience"] = self.resilience.stats()
+        return stats
@@ -0,0 +1,238 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Optional
+
+import httpx
+
+from .gateway import ModelGateway, prompt_text
+from .resilience import ResiliencePolicy
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models.json")
+
+# Settings a minion may override in the "models" section of the config
+MODEL_SETTINGS = ("model_name", "temperature", "timeout", "max_retries")
+# Budgets an upstream model may set in the "gateway" section's "limits"
+LIMIT_SETTINGS = ("requests_per_minute", "tokens_per_minute")
+
+
+def load_model_config(path: str = DEFAULT_CONFIG_PATH) -> dict:
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    for name, overrides in config.get("models", {}).items():
+        unknown = set(overrides) - set(MODEL_SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown settings for model '{name}' in {path}: {', '.join(sorted(unknown))}")
+    for name, limit in config.get("gateway", {}).get("limits", {}).items():
+        unknown = set(limit) - set(LIMIT_SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown rate limit settings for '{name}' in {path}: {', '.join(sorted(unknown))}")
+    return config
+
+# Deadlines, retries, circuit breaking and hedging from the "resilience" section of the config, with
+# MODEL_DEADLINE, MODEL_MAX_ATTEMPTS and MODEL_HEDGE taking precedence
+def resilience_from_config(settings: dict) -> ResiliencePolicy:
+    breaker = settings.get("circuit_breaker", {})
+    hedging = settings.get("hedging", {})
+    return ResiliencePolicy(
+        deadline=float(os.getenv("MODEL_DEADLINE", settings.get("deadline", 60))),
+        max_attempts=int(os.getenv("MODEL_MAX_ATTEMPTS", settings.get("max_attempts", 3))),
+        backoff=settings.get("backoff", 0.5),
+        max_backoff=settings.get("max_backoff", 4),
+        failure_threshold=breaker.get("failure_threshold", 5),
+        reset_after=breaker.get("reset_after", 30),
+        hedge=os.getenv("MODEL_HEDGE", "1" if hedging.get("enabled", False) else "0") != "0",
+        hedge_quantile=hedging.get("quantile", 0.95),
+        hedge_min_samples=hedging.get("min_samples", 20),
+        workers=settings.get("workers", 32),
+    )
+
+# Rate limits per upstream model_name ("default" for the rest) come from the config; MODEL_RATE_LIMITS=0
+# turns them off, e.g. against a local stub, and MODEL_COALESCE=0 stops identical calls being shared
+def gateway_from_config(settings: dict, resilience: Optional[dict] = None) -> ModelGateway:
+    limits = settings.get("limits", {}) if os.getenv("MODEL_RATE_LIMITS", "1") != "0" else {}
+    return ModelGateway(
+        limits,
+        max_wait=float(os.getenv("MODEL_MAX_QUEUE_WAIT", settings.get("max_wait", 30))),
+        completion_tokens=settings.get("completion_tokens", 256),
+        coalesce=os.getenv("MODEL_COALESCE", "1" if settings.get("coalesce", True) else "0") != "0",
+        resilience=resilience_from_config(resilience or {}),
+    )
+
+# Build a ChatGroq client; looked up at call time so a patched langchain_groq.ChatGroq is honoured
+def chat_groq_factory(http_client: httpx.Client, http_async_client: httpx.AsyncClient, **settings):
+    import langchain_groq
+
+    timeout = settings.pop("timeout", None)
+    return langchain_groq.ChatGroq(
+        **settings,
+        request_timeout=timeout,
+        http_client=http_client,
+        http_async_client=http_async_client,
+    )
+
+
+class LazyModel:
+    """Stands in for a chat model and builds it on first use.
+
+    The model calls (invoke/ainvoke/stream/astream) go through this object, so it is also the
+    place to wrap them with cross-cutting behaviour: they pass through the registry's ModelGateway,
+    which coalesces identical calls, applies deadlines, retries and the circuit breaker, and keeps
+    each upstream model within its rate limits. Anything else is forwarded to the model.
+    """
+
+    def __init__(self, registry: "ModelRegistry", name: str, settings: dict):
+        self.name = name
+        self.model_name = settings["model_name"]
+        self.temperature = settings.get("temperature")
+        self._registry = registry
+        self._settings = settings
+        self._settings_key = tuple(sorted(settings.items()))
+
+    @property
+    def model(self):
+        return self._registry._build(self._settings)
+
+    # Calls are identical when they go to a model with the same settings with the same prompt and arguments
+    def _call_key(self, input, args: tuple, kwargs: dict) -> tuple:
+        return (self._settings_key, prompt_text(input), repr(args), repr(sorted(kwargs.items())))
+
+    def invoke(self, input, *args, **kwargs):
+        return self._registry.gateway.invoke(
+            self.model_name, self._call_key(input, args, kwargs), input,
+            lambda: self.model.invoke(input, *args, **kwargs), self._settings.get("timeout"),
+        )
+
+    async def ainvoke(self, input, *args, **kwargs):
+        return await self._registry.gateway.ainvoke(
+            self.model_name, self._call_key(input, args, kwargs), input,
+            lambda: self.model.ainvoke(input, *args, **kwargs), self._settings.get("timeout"),
+        )
+
+    def stream(self, input, *args, **kwargs):
+        return self._registry.gateway.stream(self.model_name, input, lambda: self.model.stream(input, *args, **kwargs))
+
+    def astream(self, input, *args, **kwargs):
+        return self._registry.gateway.astream(self.model_name, input, lambda: self.model.astream(input, *args, **kwargs))
+
+    def __getattr__(self, attr: str) -> Any:
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self.model, attr)
+
+    def __repr__(self) -> str:
+        return f"LazyModel({self.name!r}, model_name={self.model_name!r})"
+
+
+class ModelRegistry:
+    """Chat models declared in config, built lazily and sharing one keep-alive HTTP connection pool.
+
+    Minions whose settings are identical share a single client instance, and all calls go through
+    one ModelGateway built from the "gateway" section unless one is passed in.
+    """
+
+    def __init__(self, config: dict, factory: Callable[..., Any] = chat_groq_factory, gateway: Optional[ModelGateway] = None):
+        self.defaults = config.get("defaults", {})
+        self.overrides = config.get("models", {})
+        self.pool = config.get("pool", {})
+        self.gateway = gateway or gateway_from_config(config.get("gateway", {}), config.get("resilience", {}))
+        self._factory = factory
+        self._lazy: dict[str, LazyModel] = {}
+        self._built: dict[tuple, Any] = {}
+        self._http_client: Optional[httpx.Client] = None
+        self._http_async_client: Optional[httpx.AsyncClient] = None
+        self._lock = threading.Lock()
+        self._build_seconds = 0.0
+
+    # Defaults merged with the minion's overrides
+    def settings(self, name: str) -> dict:
+        if name not in self.overrides:
+            logger.warning(f"No model config for '{name}', using the defaults.")
+        return {**self.defaults, **self.overrides.get(name, {})}
+
+    def get(self, name: str) -> LazyModel:
+        with self._lock:
+            model = self._lazy.get(name)
+            if model is None:
+                model = self._lazy[name] = LazyModel(self, name, self.settings(name))
+            return model
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.pool.get("max_connections", 100),
+            max_keepalive_connections=self.pool.get("max_keepalive_connections", 20),
+            keepalive_expiry=self.pool.get("keepalive_expiry", 60),
+        )
+
+    def _build(self, settings: dict):
+        key = tuple(sorted(settings.items()))
+        model = self._built.get(key)
+        if model is not None:
+            return model
+        with self._lock:
+            model = self._built.get(key)
+            if model is None:
+                started = time.perf_counter()
+                if self._http_client is None:
+                    self._http_client = httpx.Client(limits=self._limits())
+                    self._http_async_client = httpx.AsyncClient(limits=self._limits())
+                model = self._built[key] = self._factory(self._http_client, self._http_async_client, **settings)
+                elapsed = time.perf_counter() - started
+                self._build_seconds += elapsed
+                logger.info(f"Built model client {settings['model_name']} (temperature {settings.get('temperature')}) in {elapsed:.3f}s.")
+            return model
+
+    # Close both connection pools. The async pool is closed on the running event loop when called from one
+    # (prefer aclose() there), otherwise on a short-lived loop of its own.
+    def close(self) -> None:
+        async_client = self._release_clients()
+        if async_client is None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is not None:
+            loop.create_task(async_client.aclose())
+            return
+        try:
+            asyncio.run(async_client.aclose())
+        except RuntimeError as e:
+            # Connections opened on an event loop that has since closed cannot be shut down cleanly
+            logger.warning(f"Could not close the async model connection pool: {e}")
+
+    # Close both connection pools, for the ASGI lifespan shutdown
+    async def aclose(self) -> None:
+        async_client = self._release_clients()
+        if async_client is not None:
+            await async_client.aclose()
+
+    # Close the sync pool and forget the built clients; the async pool is returned for the caller to close
+    def _release_clients(self) -> Optional[httpx.AsyncClient]:
+        with self._lock:
+            if self._http_client is not None:
+                self._http_client.close()
+            async_client = self._http_async_client
+            self._http_client = None
+            self._http_async_client = None
+            self._built.clear()
+            return async_client
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "declared": len(self._lazy),
+                "clients_built": len(self._built),
+                "build_seconds": round(self._build_seconds, 3),
+                "gateway": self.gateway.stats(),
+            }
+
+
+# Build the model registry from the JSON file at MODEL_CONFIG_PATH (src/config/models.json by default)
+def model_registry_from_env() -> ModelRegistry:
+    return ModelRegistry(load_model_config(os.getenv("MODEL_CONFIG_PATH", DEFAULT_CONFIG_PATH)))
@@ -0,0 +1,436 @@
+import asyncio
+import contextvars
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator, Optional
+
+import groq
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class ModelUnavailable(RuntimeError):
+    """The upstream model cannot answer right now; callers should fall back to a degraded answer."""
+
+
+class CircuitOpen(ModelUnavailable):
+    """The model's circuit breaker is open after repeated failures, so the call was not attempted."""
+
+
+class DeadlineExceeded(ModelUnavailable):
+    """The call did not succeed within its deadline, retries and hedges included."""
+
+
+# Timeouts, dropped connections, 408/409/429 and server errors may succeed on another attempt; anything
+# else (a bad request, a missing key, a bug) would fail the same way again
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (TimeoutError, ConnectionError, httpx.TransportError, groq.APIConnectionError)):
+        return True
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is not None:
+        return int(status) in (408, 409, 429) or int(status) >= 500
+    return False
+
+
+class CircuitBreaker:
+    """Stops calling a model after `failure_threshold` consecutive failures.
+
+    Once open, calls fail fast for `reset_after` seconds; then a single trial call is let through,
+    which closes the circuit again if it succeeds and reopens it if it fails. A trial that never
+    reports back (e.g. a cancelled request) is replaced after another `reset_after` seconds.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_after: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self._clock = clock
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half-open" if self._clock() - self._opened_at >= self.reset_after else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            now = self._clock()
+            if now - self._opened_at < self.reset_after:
+                return False
+            if self._trial_at is not None and now - self._trial_at < self.reset_after:
+                return False
+            self._trial_at = now
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_at = None
+
+    # Returns True when this failure opened the circuit
+    def record_failure(self) -> bool:
+        with self._lock:
+            self._failures += 1
+            if self._trial_at is not None or (self._opened_at is None and self._failures >= self.failure_threshold):
+                self._opened_at = self._clock()
+                self._trial_at = None
+                self.opened += 1
+                return True
+            return False
+
+
+class LatencyTracker:
+    """Durations of a model's recent successful attempts, for choosing when to hedge."""
+
+    def __init__(self, window: int = 200):
+        self._samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float, min_samples: int) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class _ModelState:
+    def __init__(self, breaker: CircuitBreaker):
+        self.breaker = breaker
+        self.latency = LatencyTracker()
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.fast_failures = 0
+
+
+class ResiliencePolicy:
+    """Deadlines, retries, circuit breaking and hedging around each upstream model's calls.
+
+    A call gets `deadline` seconds in total. Each attempt may also have its own timeout (the model's
+    `timeout` setting), after which it counts as a retryable failure. Retryable failures are retried
+    up to `max_attempts` with jittered exponential backoff, as long as the deadline allows. Every
+    upstream model_name has its own circuit breaker. With `hedge` on, an attempt that is still
+    running after the model's recent p95 latency gets a second, identical request; the first answer
+    wins. Synchronous attempts run on a small thread pool, so the caller can stop waiting for them.
+    """
+
+    def __init__(
+        self,
+        deadline: float = 60.0,
+        max_attempts: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 4.0,
+        failure_threshold: int = 5,
+        reset_after: float = 30.0,
+        hedge: bool = False,
+        hedge_quantile: float = 0.95,
+        hedge_min_samples: int = 20,
+        workers: int = 32,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.deadline = deadline
+        self.max_attempts = max(1, max_attempts)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self._clock = clock
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="model-call")
+        self._models: dict[str, _ModelState] = {}
+        self._lock = threading.Lock()
+
+    def _state(self, model_name: str) -> _ModelState:
+        state = self._models.get(model_name)
+        if state is None:
+            with self._lock:
+                state = self._models.get(model_name)
+                if state is None:
+                    breaker = CircuitBreaker(self.failure_threshold, self.reset_after, self._clock)
+                    state = self._models[model_name] = _ModelState(breaker)
+        return state
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+    def _hedge_delay(self, state: _ModelState) -> Optional[float]:
+        if not self.hedge:
+            return None
+        return state.latency.quantile(self.hedge_quantile, self.hedge_min_samples)
+
+    # Before an attempt: fail fast while the circuit is open, and give up once the deadline has passed
+    def _admit(self, model_name: str, state: _ModelState, deadline: float, last_error: Optional[BaseException]) -> None:
+        if not state.breaker.allow():
+            with self._lock:
+                state.fast_failures += 1
+            raise CircuitOpen(f"{model_name} is unavailable after repeated failures; retrying in up to {self.reset_after:.0f}s")
+        remaining = deadline - self._clock()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"{model_name} did not answer within {self.deadline:.1f}s") from last_error
+        with self._lock:
+            state.attempts += 1
+
+    # After a failed attempt: record it, then return how long to back off, or re-raise when it is not worth retrying
+    def _failed(self, model_name: str, state: _ModelState, error: BaseException, attempt: int, deadline: float) -> float:
+        if not is_retryable(error):
+            state.breaker.record_success()  # the model answered; the request itself was at fault
+            raise error
+        if isinstance(error, TimeoutError):
+            with self._lock:
+                state.timeouts += 1
+        if state.breaker.record_failure():
+            logger.error(f"\033[91mCircuit for {model_name} opened after repeated failures: {error}\033[0m")
+        if attempt >= self.max_attempts:
+            raise ModelUnavailable(f"{model_name} failed {attempt} times; last error: {type(error).__name__}: {error}") from error
+        delay = self._backoff(attempt)
+        if self._clock() + delay >= deadline:
+            raise DeadlineExceeded(f"{model_name} did not answer within {self.deadline:.1f}s") from error
+        with self._lock:
+            state.retries += 1
+        logger.warning(f"\033[93m{model_name} call failed ({type(error).__name__}: {error}); retry {attempt} in {delay:.2f}s.\033[0m")
+        return delay
+
+    def _succeeded(self, state: _ModelState, started: float, hedged: bool = False) -> None:
+        state.breaker.record_success()
+        state.latency.add(self._clock() - started)
+        if hedged:
+            with self._lock:
+                state.hedge_wins += 1
+
+    # One attempt on the pool: hedged once it runs past the model's p95 (if the rate limit has room for
+    # another request right away), abandoned after `timeout`
+    def _attempt(self, model_name: str, state: _ModelState, attempt: Callable[[], Any], timeout: float, try_admit: Callable[[], bool]) -> Any:
+        started = self._clock()
+        futures = [self._executor.submit(contextvars.copy_context().run, attempt)]
+        hedge_delay = self._hedge_delay(state)
+        if hedge_delay is not None and hedge_delay < timeout:
+            done, _ = wait(futures, timeout=hedge_delay)
+            if not done and try_admit():
+                with self._lock:
+                    state.hedges += 1
+                futures.append(self._executor.submit(contextvars.copy_context().run, attempt))
+        pending, error = set(futures), None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, started + timeout - self._clock()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    self._succeeded(state, started, hedged=future is not futures[0])
+                    return future.result()
+                error = error or future.exception()
+        if error is not None and not pending:
+            raise error
+        for future in pending:
+            future.cancel()
+        raise TimeoutError(f"{model_name} did not answer within {timeout:.1f}s")
+
+    # `admit` runs before each attempt, in the caller's thread (e.g. waiting for the rate limit);
+    # `try_admit` decides whether a hedge may be sent without waiting
+    def call(
+        self,
+        model_name: str,
+        attempt: Callable[[], Any],
+        timeout: Optional[float] = None,
+        admit: Callable[[], None] = lambda: None,
+        try_admit: Callable[[], bool] = lambda: True,
+    ) -> Any:
+        state = self._state(model_name)
+        with self._lock:
+            state.calls += 1
+        deadline = self._clock() + self.deadline
+        last_error = None
+        for number in range(1, self.max_attempts + 1):
+            self._admit(model_name, state, deadline, last_error)
+            admit()
+            remaining = deadline - self._clock()
+            try:
+                return self._attempt(model_name, state, attempt, min(timeout or remaining, remaining), try_admit)
+            except Exception as e:
+                last_error = e
+                time.sleep(self._failed(model_name, state, e, number, deadline))
+
+    async def _aattempt(self, model_name: str, state: _ModelState, attempt: Callable[[], Awaitable[Any]], timeout: float, try_admit: Callable[[], bool]) -> Any:
+        started = self._clock()
+        tasks = [asyncio.ensure_future(attempt())]
+        try:
+            hedge_delay = self._hedge_delay(state)
+            if hedge_delay is not None and hedge_delay < timeout:
+                done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+                if not done and try_admit():
+                    with self._lock:
+                        state.hedges += 1
+                    tasks.append(asyncio.ensure_future(attempt()))
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=max(0.0, started + timeout - self._clock()), return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                for task in done:
+                    if task.exception() is None:
+                        self._succeeded(state, started, hedged=task is not tasks[0])
+                        return task.result()
+                    error = error or task.exception()
+            if error is not None and not pending:
+                raise error
+            raise TimeoutError(f"{model_name} did not answer within {timeout:.1f}s")
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def acall(
+        self,
+        model_name: str,
+        attempt: Callable[[], Awaitable[Any]],
+        timeout: Optional[float] = None,
+        admit: Optional[Callable[[], Awaitable[None]]] = None,
+        try_admit: Callable[[], bool] = lambda: True,
+    ) -> Any:
+        state = self._state(model_name)
+        with self._lock:
+            state.calls += 1
+        deadline = self._clock() + self.deadline
+        last_error = None
+        for number in range(1, self.max_attempts + 1):
+            self._admit(model_name, state, deadline, last_error)
+            if admit is not None:
+                await admit()
+            remaining = deadline - self._clock()
+            try:
+                return await self._aattempt(model_name, state, attempt, min(timeout or remaining, remaining), try_admit)
+            except Exception as e:
+                last_error = e
+                await asyncio.sleep(self._failed(model_name, state, e, number, deadline))
+
+    def _stream_failed(self, model_name: str, state: _ModelState, error: BaseException) -> None:
+        if is_retryable(error) and state.breaker.record_failure():
+            logger.error(f"\033[91mCircuit for {model_name} opened after repeated failures: {error}\033[0m")
+
+    # Open a stream and wait for its first chunk (None when it is empty)
+    @staticmethod
+    def _open_stream(open_stream: Callable[[], Iterator]) -> tuple[Iterator, Any]:
+        chunks = iter(open_stream())
+        return chunks, next(chunks, None)
+
+    # Close a stream whose first chunk arrived after the caller had given up on it
+    @staticmethod
+    def _close_abandoned(opening: Future) -> None:
+        if opening.cancelled() or opening.exception() is not None:
+            return
+        close = getattr(opening.result()[0], "close", None)
+        if close is not None:
+            close()
+
+    # Streams are retried only until their first chunk arrives; after that a failure reaches the caller. The first
+    # chunk is awaited on the pool, so a stream that sends nothing is abandoned at the deadline, as in astream.
+    def stream(self, model_name: str, open_stream: Callable[[], Iterator], admit: Callable[[], None] = lambda: None) -> Iterator:
+        state = self._state(model_name)
+        with self._lock:
+            state.calls += 1
+        deadline = self._clock() + self.deadline
+        last_error = None
+        for number in range(1, self.max_attempts + 1):
+            self._admit(model_name, state, deadline, last_error)
+            admit()
+            remaining = deadline - self._clock()
+            opening = self._executor.submit(contextvars.copy_context().run, self._open_stream, open_stream)
+            try:
+                chunks, first = opening.result(timeout=max(0.0, remaining))
+                break
+            except FutureTimeoutError:
+                opening.add_done_callback(self._close_abandoned)
+                last_error = TimeoutError(f"{model_name} sent nothing within {remaining:.1f}s")
+            except Exception as e:
+                last_error = e
+            time.sleep(self._failed(model_name, state, last_error, number, deadline))
+        if first is not None:
+            yield first
+            try:
+                yield from chunks
+            except Exception as e:
+                self._stream_failed(model_name, state, e)
+                raise
+        state.breaker.record_success()
+
+    async def astream(self, model_name: str, open_stream: Callable[[], AsyncIterator], admit: Optional[Callable[[], Awaitable[None]]] = None) -> AsyncIterator:
+        state = self._state(model_name)
+        with self._lock:
+            state.calls += 1
+        deadline = self._clock() + self.deadline
+        last_error = None
+        for number in range(1, self.max_attempts + 1):
+            self._admit(model_name, state, deadline, last_error)
+            if admit is not None:
+                await admit()
+            remaining = deadline - self._clock()
+            chunks = open_stream().__aiter__()
+            try:
+                first = await asyncio.wait_for(chunks.__anext__(), max(0.0, remaining))
+                break
+            except StopAsyncIteration:
+                state.breaker.record_success()
+                return
+            except asyncio.TimeoutError:
+                last_error = TimeoutError(f"{model_name} sent nothing within {remaining:.1f}s")
+            except Exception as e:
+                last_error = e
+            await asyncio.sleep(self._failed(model_name, state, last_error, number, deadline))
+        yield first
+        try:
+            async for chunk in chunks:
+                yield chunk
+        except Exception as e:
+            self._stream_failed(model_name, state, e)
+            raise
+        state.breaker.record_success()
+
+    def circuit_states(self) -> dict[str, str]:
+        return {model_name: state.breaker.state for model_name, state in list(self._models.items())}
+
+    def stats(self) -> dict:
+        models = {}
+        for model_name, state in list(self._models.items()):
+            with self._lock:
+                models[model_name] = {
+                    "circuit": state.breaker.state,
+                    "circuit_opened": state.breaker.opened,
+                    "calls": state.calls,
+                    "attempts": state.attempts,
+                    "retries": state.retries,
+                    "timeouts": state.timeouts,
+                    "hedges": state.hedges,
+                    "hedge_wins": state.hedge_wins,
+                    "fast_failures": state.fast_failures,
+                }
+            p95 = state.latency.quantile(self.hedge_quantile, 1)
+            models[model_name]["latency_p95"] = round(p95, 3) if p95 is not None else None
+        return {"deadline": self.deadline, "max_attempts": self.max_attempts, "hedge": self.hedge, "models": models}
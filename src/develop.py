@@ -1,28 +1,42 @@
-
-
-from flask import Flask, request, jsonify
+import time
+_import_started = time.perf_counter()  # import time is logged and reported by /ready
+from flask import Flask, Response, request, jsonify
 import os
-from typing import TypedDict, Union, Callable
-from langchain.schema import SystemMessage, HumanMessage, AIMessage
+import base64
+from email.mime.text import MIMEText
+from typing import Annotated, TypedDict, Union, Callable, Optional
+from langchain.schema import HumanMessage, AIMessage
 from langchain_groq import ChatGroq
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder, HumanMessagePromptTemplate
 from langgraph.graph import StateGraph, END
+from langgraph.graph.message import add_messages
 import logging
 from langsmith import trace
 import random
-from googleapiclient.discovery import build
-from google.oauth2 import service_account
-import requests
-
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('multi_agent_orchestrator.log')
-    ]
-)
+import re
+import uuid
+from config.gateway import RateLimitExceeded
+from config.models import model_registry_from_env
+from config.resilience import ModelUnavailable
+from integrations.google import OfflineCalendarService, OfflineGmailService, batch_sender, calendar_service, gmail_service
+from integrations.lazy import IntegrationRegistry, IntegrationUnavailable
+from integrations.outbox import outbox_from_env
+from integrations.weather import OfflineWeatherSession, WeatherLookupError, weather_provider_from_env, weather_session
+from minions.history import history_manager_from_env
+from minions.prompts import ChatPrompt
+from minions.notes_index import extract_links, extract_tags, notes_index_from_env
+from minions.response_cache import response_cache_from_env
+from minions.turns import MinionTurns
+from orchestrator.logs import REQUEST_ID_HEADER, bind_log_context, clip, log_context, logging_from_env, request_id_from
+from orchestrator.metrics import METRICS_CONTENT_TYPE, MetricsRegistry
+from orchestrator.registry import ToolResult, minion_registry_from_env
+from orchestrator.router import DegradedRoute, FastPathRouter
+from orchestrator.routing_cache import RoutingCache
+from orchestrator.sessions import SESSION_COOKIE, SESSION_HEADER, resolve_session_id, session_store_from_env
+from orchestrator.speculation import Speculator
+from orchestrator.workers import worker_health_from_env
+
+# Set up logging: JSON lines to a size-rotated file and colored text to stderr, written by a background thread
+logging_from_env('multi_agent_orchestrator.log')
 logger = logging.getLogger(__name__)
 
 # Access environment variables
@@ -32,242 +46,461 @@ langchain_endpoint = os.getenv("LANGCHAIN_ENDPOINT")
 langchain_api_key = os.getenv("LANGCHAIN_API_KEY")
 langchain_project = os.getenv("LANGCHAIN_PROJECT")
 
-os.environ["WEATHER_API_KEY"] = "<INSERT_YOUR_WEATHER_API_KEY_HERE>"
+os.environ.setdefault("WEATHER_API_KEY", "<INSERT_YOUR_WEATHER_API_KEY_HERE>")
 
 # Google API credentials setup
-GOOGLE_CREDENTIALS_PATH = '<INSERT_PATH_TO_YOUR_GOOGLE_CREDENTIALS_JSON>'
+GOOGLE_CREDENTIALS_PATH = os.getenv("GOOGLE_CREDENTIALS_PATH", '<INSERT_PATH_TO_YOUR_GOOGLE_CREDENTIALS_JSON>')
 
 # Define chatbot state
 class State(TypedDict):
-    messages: list[Union[HumanMessage, AIMessage]]
-
-# Initialize models for each agent
-cat_model = ChatGroq(temperature=0.7, model_name="llama3-groq-70b-8192-tool-use-preview")
-dog_model = ChatGroq(temperature=0.7, model_name="llama3-groq-70b-8192-tool-use-preview")
-monkey_model = ChatGroq(temperature=0.7, model_name="llama3-groq-70b-8192-tool-use-preview")
-receptionist_model = ChatGroq(temperature=0.7, model_name="llama3-groq-70b-8192-tool-use-preview")
-orchestrator_model = ChatGroq(temperature=0.7, model_name="llama3-groq-70b-8192-tool-use-preview")
-email_manager_model = ChatGroq(temperature=0.7, model_name="llama3-groq-70b-8192-tool-use-preview")
-scheduling_model = ChatGroq(temperature=0.7, model_name="llama3-groq-70b-8192-tool-use-preview")
-research_model = ChatGroq(temperature=0.7, model_name="llama3-groq-70b-8192-tool-use-preview")
-knowledge_base_model = ChatGroq(temperature=0.7, model_name="llama3-groq-70b-8192-tool-use-preview")
-
-# Prompt templates for each agent
-cat_prompt = ChatPromptTemplate.from_messages([
-    SystemMessage(content="You are a friendly AI assistant who loves to talk about cats."),
-    MessagesPlaceholder(variable_name="chat_history"),
-    HumanMessagePromptTemplate.from_template("{input}")
-])
-
-dog_prompt = ChatPromptTemplate.from_messages([
-    SystemMessage(content="You are a friendly AI assistant who loves to talk about dogs."),
-    MessagesPlaceholder(variable_name="chat_history"),
-    HumanMessagePromptTemplate.from_template("{input}")
-])
-
-monkey_prompt = ChatPromptTemplate.from_messages([
-    SystemMessage(content="You are a friendly AI assistant who loves to talk about monkeys."),
-    MessagesPlaceholder(variable_name="chat_history"),
-    HumanMessagePromptTemplate.from_template("{input}")
-])
-
-receptionist_prompt = ChatPromptTemplate.from_messages([
-    SystemMessage(content="You are a friendly AI receptionist, providing general help and directing users appropriately."),
-    MessagesPlaceholder(variable_name="chat_history"),
-    HumanMessagePromptTemplate.from_template("{input}")
-])
-
-email_manager_prompt = ChatPromptTemplate.from_messages([
-    SystemMessage(content="You are an email manager assistant who can send and organize emails."),
-    MessagesPlaceholder(variable_name="chat_history"),
-    HumanMessagePromptTemplate.from_template("{input}")
-])
-
-scheduling_prompt = ChatPromptTemplate.from_messages([
-    SystemMessage(content="You are a scheduling assistant who helps users manage events in their calendar."),
-    MessagesPlaceholder(variable_name="chat_history"),
-    HumanMessagePromptTemplate.from_template("{input}")
-])
-
-research_prompt = ChatPromptTemplate.from_messages([
-    SystemMessage(content="You are a research assistant who can gather information from the web, such as the weather."),
-    MessagesPlaceholder(variable_name="chat_history"),
-    HumanMessagePromptTemplate.from_template("{input}")
-])
-
-knowledge_base_prompt = ChatPromptTemplate.from_messages([
-    SystemMessage(content="You help manage the user's knowledge base, including note taking, categorization, and linking."),
-    MessagesPlaceholder(variable_name="chat_history"),
-    HumanMessagePromptTemplate.from_template("{input}")
-])
-
-# Google API setup
-def setup_gmail_service():
-    creds = service_account.Credentials.from_service_account_file(
-        GOOGLE_CREDENTIALS_PATH, scopes=['https://www.googleapis.com/auth/gmail.send']
-    )
-    service = build('gmail', 'v1', credentials=creds)
-    return service
-
-def setup_calendar_service():
-    creds = service_account.Credentials.from_service_account_file(
-        GOOGLE_CREDENTIALS_PATH, scopes=['https://www.googleapis.com/auth/calendar']
-    )
-    service = build('calendar', 'v3', credentials=creds)
-    return service
-
-gmail_service = setup_gmail_service()
-calendar_service = setup_calendar_service()
-
-# Helper functions
-def send_email(recipient, subject, message_body):
-    # Code to send an email via Gmail API
-    pass
-
-def create_event(event_data):
-    # Code to create a calendar event using Google Calendar API
-    pass
+    messages: Annotated[list[Union[HumanMessage, AIMessage]], add_messages]  # merged by message id, so a turn adds only its new messages
+    summary: str  # rolling summary of the messages folded out of the history window
+    summarized: int  # number of leading messages covered by the summary
+    route: str  # route that answered the previous turn
+
+# Chat models are declared in src/config/models.json and built on first use over one shared connection pool
+model_registry = model_registry_from_env()
+
+# Latency histograms for routing, model calls, tool calls and whole requests, exported at /metrics
+metrics_registry = MetricsRegistry()
+routing_seconds = metrics_registry.histogram("minion_routing_seconds", "Time to choose the minion for a question.", ["minion", "outcome"])
+model_seconds = metrics_registry.histogram("minion_model_seconds", "Time spent in a minion's model call.", ["minion", "outcome"])
+tool_seconds = metrics_registry.histogram("minion_tool_seconds", "Time spent in a minion's tool call.", ["tool", "outcome"])
+request_seconds = metrics_registry.histogram("minion_request_seconds", "Time to answer a chat request end to end.", ["endpoint", "minion", "outcome"])
+
+# Calls waiting for an upstream model's rate limit: how many are queued now, and how long each waited
+model_queue_seconds = metrics_registry.histogram("minion_model_queue_seconds", "Time model calls waited for their model's rate limit.", ["model"])
+model_registry.gateway.on_wait = lambda model_name, seconds: model_queue_seconds.observe(seconds, model=model_name)
+metrics_registry.gauge("minion_model_queue_depth", "Model calls waiting for their model's rate limit.", ["model"],
+                       lambda: {(model_name,): depth for model_name, depth in model_registry.gateway.queue_depth().items()})
+# 1 while a model's circuit breaker is open (failing fast) or half-open (letting a trial call through)
+metrics_registry.gauge("minion_model_circuit_open", "1 while the model's circuit breaker is open or half-open.", ["model"],
+                       lambda: {(model_name,): int(state != "closed") for model_name, state in model_registry.gateway.resilience.circuit_states().items()})
+
+# External integrations are set up on first use, so a missing credential only affects the minion that needs it.
+# INTEGRATIONS_OFFLINE=1 swaps in local stand-ins; INTEGRATIONS_WARMUP=1 initializes them in the background at startup.
+integrations = IntegrationRegistry()
+if os.getenv("INTEGRATIONS_OFFLINE", "0") == "1":
+    integrations.register("gmail", OfflineGmailService)
+    integrations.register("calendar", OfflineCalendarService)
+    integrations.register("weather", OfflineWeatherSession)
+else:
+    integrations.register("gmail", lambda: gmail_service(GOOGLE_CREDENTIALS_PATH))
+    integrations.register("calendar", lambda: calendar_service(GOOGLE_CREDENTIALS_PATH))
+    integrations.register("weather", weather_session)
+
+# Obsidian vault, with a full-text index over it that the knowledge base minion searches to ground its answers
+NOTES_DIR = os.getenv("NOTES_DIR", "obsidian_notes")
+NOTES_TOP_K = int(os.getenv("NOTES_TOP_K", 5))
+notes_index = notes_index_from_env(NOTES_DIR)
+
+# Cached weather lookups: fresh observations are reused, stale ones are served while they refresh in the
+# background, and concurrent questions about the same ZIP code share one request with bounded timeouts
+weather_provider = weather_provider_from_env(lambda: integrations.get("weather"))
+
+# Batched delivery of queued Gmail sends and Calendar inserts, run by the outbox workers
+def deliver_emails(payloads: list[dict]) -> list:
+    with tool_seconds.time(tool="deliver_emails"):
+        return send_gmail_batch(payloads)
+
+def deliver_events(payloads: list[dict]) -> list:
+    with tool_seconds.time(tool="deliver_events"):
+        return insert_calendar_batch(payloads)
+
+send_gmail_batch = batch_sender(lambda: integrations.get("gmail"), lambda gmail, body: gmail.users().messages().send(userId="me", body=body))
+insert_calendar_batch = batch_sender(lambda: integrations.get("calendar"), lambda calendar, event: calendar.events().insert(calendarId="primary", body=event))
+
+# Outgoing emails and calendar events wait in a local SQLite queue (OUTBOX_PATH) and are delivered in batches
+# by background workers, with retries, so a slow Google API never holds up the reply
+outbox = outbox_from_env({"send_email": deliver_emails, "create_event": deliver_events})
+
+# Idempotency key for a tool call made while answering this message; a retried request carries the same key.
+# The key travels with the message rather than as its id, because the graph merges messages with equal ids.
+def idempotency_key(message, tool: str) -> Optional[str]:
+    key = getattr(message, "additional_kwargs", {}).get("idempotency_key") or getattr(message, "id", None)
+    return f"{key}:{tool}" if key else None
+
+# Helper functions; both return the outbox job that tracks the delivery
+def send_email(recipient, subject, message_body, key: Optional[str] = None):
+    message = MIMEText(message_body)
+    message["to"] = recipient
+    message["subject"] = subject
+    raw = base64.urlsafe_b64encode(message.as_bytes()).decode()
+    with tool_seconds.time(tool="send_email"):
+        return outbox.enqueue("send_email", {"raw": raw}, idempotency_key=key)
+
+def create_event(event_data, key: Optional[str] = None):
+    event = {
+        "summary": event_data["summary"],
+        "start": {"dateTime": event_data["start"]},
+        "end": {"dateTime": event_data["end"]},
+    }
+    with tool_seconds.time(tool="create_event"):
+        return outbox.enqueue("create_event", event, idempotency_key=key)
 
 def get_weather(zip_code: str):
-    api_key = os.getenv("WEATHER_API_KEY")
-    response = requests.get(f"http://api.openweathermap.org/data/2.5/weather?zip={zip_code}&appid={api_key}")
-    if response.status_code == 200:
-        weather_data = response.json()
+    with tool_seconds.time(tool="get_weather") as timing:
+        try:
+            weather_data = weather_provider.get(zip_code)
+        except IntegrationUnavailable:
+            timing.labels["outcome"] = "unavailable"
+            return "The weather service is not available right now. Please try again later."
+        except WeatherLookupError as e:
+            logger.error(f"\033[91m[research agent] {e}\033[0m")
+            timing.labels["outcome"] = "error"
+            return "I couldn't fetch the weather data. Please try again later."
         return f"The current weather is {weather_data['weather'][0]['description']} with a temperature of {weather_data['main']['temp']}K."
-    else:
-        return "I couldn't fetch the weather data. Please try again later."
 
 def save_note_to_obsidian(note_title: str, note_content: str):
-    with open(f"obsidian_notes/{note_title}.md", 'w') as note_file:
-        note_file.write(note_content)
+    with tool_seconds.time(tool="save_note"):
+        with open(notes_index.path_for(note_title), 'w') as note_file:
+            note_file.write(note_content)
+        notes_index.update(note_title)
 
 def get_note_from_obsidian(note_title: str) -> str:
+    with tool_seconds.time(tool="get_note") as timing:
+        try:
+            with open(notes_index.path_for(note_title), 'r') as note_file:
+                return note_file.read()
+        except FileNotFoundError:
+            timing.labels["outcome"] = "not_found"
+            return "Note not found."
+        except ValueError:
+            timing.labels["outcome"] = "invalid"
+            return "Invalid note title."
+
+# Notes matching the question (plus any #tags and [[links]] it mentions), as context for the model
+def search_notes(question: str) -> str:
+    lines = []
+    with tool_seconds.time(tool="search_notes") as timing:
+        try:
+            for result in notes_index.search(question, k=NOTES_TOP_K):
+                tags = f" (tags: {', '.join('#' + tag for tag in result.tags)})" if result.tags else ""
+                lines.append(f"- [[{result.title}]]{tags}: {result.snippet}")
+            for tag in sorted(extract_tags(question)):
+                tagged = notes_index.tagged(tag)
+                if tagged:
+                    lines.append(f"- Notes tagged #{tag}: {', '.join(tagged[:20])}")
+            for title in sorted(extract_links(question)):
+                linking = notes_index.backlinks(title)
+                if linking:
+                    lines.append(f"- Notes linking to [[{title}]]: {', '.join(linking[:20])}")
+        except Exception as e:
+            logger.error(f"\033[91m[knowledge_base agent] Notes search failed: {str(e)}\033[0m", exc_info=True)
+            timing.labels["outcome"] = "error"
+            return ""
+    return "Relevant notes from the user's vault:\n" + "\n".join(lines) if lines else ""
+
+# Email details in a message such as "send email to ana@example.com subject: Lunch body: See you at noon"
+EMAIL_ADDRESS = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+EMAIL_SUBJECT = re.compile(r"\bsubject:\s*(.+?)\s*(?=\b(?:body|message):|$)", re.IGNORECASE | re.DOTALL)
+EMAIL_BODY = re.compile(r"\b(?:body|message):\s*(.+)", re.IGNORECASE | re.DOTALL)
+EMAIL_USAGE = "To send an email, give the recipient, a subject and a body, e.g. \"send email to ana@example.com subject: Lunch body: See you at noon\"."
+
+# Returns (recipient, subject, body), or None when any of them is missing
+def parse_email_request(text: str) -> Optional[tuple[str, str, str]]:
+    recipient = EMAIL_ADDRESS.search(text)
+    subject = EMAIL_SUBJECT.search(text)
+    body = EMAIL_BODY.search(text)
+    if not (recipient and subject and body and subject.group(1) and body.group(1).strip()):
+        return None
+    return recipient.group(0), subject.group(1), body.group(1).strip()
+
+# Tools a minion can list in src/config/develop_minions.json. Each looks at the question and either answers the turn
+# itself or adds context for the minion's model, and returns None when the question is not for it.
+def send_email_tool(state: State) -> Optional[ToolResult]:
+    if "send email" not in state['messages'][-1].content.lower():
+        return None
+    # Nothing is queued unless the message names the recipient, the subject and the body
+    details = parse_email_request(state['messages'][-1].content)
+    if details is None:
+        return ToolResult(reply=EMAIL_USAGE)
+    job = send_email(*details, key=idempotency_key(state['messages'][-1], "send_email"))
+    return ToolResult(reply=f"Your email to {details[0]} is queued for sending (tracking id {job.id}).")
+
+def create_event_tool(state: State) -> Optional[ToolResult]:
+    if "schedule event" not in state['messages'][-1].content.lower():
+        return None
+    # Extract event details from user input
+    event = {"summary": "Meeting", "start": "2024-10-06T09:00:00-07:00", "end": "2024-10-06T10:00:00-07:00"}
+    job = create_event(event, key=idempotency_key(state['messages'][-1], "create_event"))
+    return ToolResult(reply=f"Your event is queued for your calendar (tracking id {job.id}).")
+
+def get_weather_tool(state: State) -> Optional[ToolResult]:
+    if "weather" not in state['messages'][-1].content.lower():
+        return None
+    zip_code = "94103"  # Example ZIP code, extract actual code from user input
+    return ToolResult(reply=get_weather(zip_code))
+
+def search_notes_tool(state: State) -> Optional[ToolResult]:
+    return ToolResult(context=search_notes(state['messages'][-1].content))
+
+minion_tools = {
+    "send_email": send_email_tool,
+    "create_event": create_event_tool,
+    "get_weather": get_weather_tool,
+    "search_notes": search_notes_tool,
+}
+
+# Minions are declared in src/config/develop_minions.json: what each handles, example questions, keywords, prompt,
+# model and tools. The router, the orchestrator prompt and the minions below are all built from it.
+minion_registry = minion_registry_from_env("develop_minions.json", tools=minion_tools)
+
+# Model of each minion, by minion name, and of the orchestrator
+minion_models = {name: model_registry.get(minion.model) for name, minion in minion_registry.minions.items()}
+orchestrator_model = model_registry.get(minion_registry.orchestrator_model)
+
+# Local fast-path router; the orchestrator LLM is only consulted when it is not confident
+fast_router = FastPathRouter(
+    routes=minion_registry.route_specs(),
+    fallback=minion_registry.fallback,
+    threshold=float(os.getenv("FAST_ROUTER_THRESHOLD", 0.8)),
+)
+
+# Check the local router against the minions' example questions; a misroute means two minions' keywords overlap
+router_report = fast_router.evaluate(minion_registry.examples())
+logger.info(f"Fast-path router: {router_report['accuracy']:.0%} accuracy, {router_report['coverage']:.0%} coverage on minion examples.")
+
+# Routing decisions for repeated questions, shared by all request threads
+routing_cache = RoutingCache(maxsize=int(os.getenv("ROUTING_CACHE_SIZE", 1024)), ttl=float(os.getenv("ROUTING_CACHE_TTL", 3600)))
+
+# Without the orchestrator LLM (down or rate limited), go with the local router's best guess, however unsure it is. The guess is marked as
+# degraded so it is not cached past the outage.
+def degraded_route(user_question: str, error: Exception) -> DegradedRoute:
+    decision = fast_router.classify(user_question)
+    logger.warning(f"\033[93mOrchestrator model unavailable or rate limited ({error}); routing to {decision.route} (confidence {decision.confidence:.2f}).\033[0m")
+    return DegradedRoute(decision.route)
+
+# Ask the orchestrator LLM which minion should handle the question. Its prompt lists only the minions most likely to
+# fit, so it does not grow with the registry; when none but the fallback resembles the question, there is nothing to ask.
+def llm_route(user_question: str) -> str:
+    candidates = fast_router.candidates(user_question, minion_registry.candidate_count)
+    if len(candidates) == 1:
+        return candidates[0]
     try:
-        with open(f"obsidian_notes/{note_title}.md", 'r') as note_file:
-            return note_file.read()
-    except FileNotFoundError:
-        return "Note not found."
-
-# Define orchestrator prompt with more explicit instructions
-orchestrator_prompt = ChatPromptTemplate.from_messages([
-    SystemMessage(content="""
-    You are an orchestrator assistant. You need to determine which specialized agent should handle each user query. Here are the rules:
-    - The 'generic fallback minion' handles general queries.
-    - The 'email manager minion' handles email-related queries.
-    - The 'scheduling assistant minion' handles event or reminder-related queries.
-    - The 'research minion' handles weather and simple information gathering.
-    - The 'knowledge base minion' manages information and notes.
-    Based on the user query, output the name of the agent that should handle the query: 'generic fallback', 'email manager', 'scheduling assistant', 'research', 'knowledge base', or other.
-    """),
-    HumanMessagePromptTemplate.from_template("{input}")
-])
+        response = orchestrator_model.invoke(minion_registry.orchestrator_prompt(candidates).messages_for((), user_question))
+    except (ModelUnavailable, RateLimitExceeded) as e:
+        return degraded_route(user_question, e)
+    return minion_registry.resolve(response.content, candidates)
+
+# Reuse a cached decision, route locally when confident, otherwise ask the orchestrator LLM.
+# before_llm runs only when the orchestrator LLM is about to be called.
+def route_question(user_question: str, before_llm: Callable[[], None] = lambda: None) -> str:
+    with routing_seconds.time() as timing:
+        agent_name = routing_cache.get(user_question)
+        if agent_name is None:
+            def ask_llm(question: str) -> str:
+                before_llm()
+                return llm_route(question)
+            agent_name = fast_router.route(user_question, ask_llm)
+            if not isinstance(agent_name, DegradedRoute):
+                routing_cache.put(user_question, agent_name)
+        else:
+            timing.labels["outcome"] = "cached"
+        timing.labels["minion"] = agent_name if agent_name in route_agents else "other"
+    bind_log_context(minion=agent_name)
+    return agent_name
+
+# Map a routing decision to the minion that handles it; an unknown name goes to the fallback minion
+def select_agent(agent_name: str) -> Callable[[State], dict]:
+    return route_agents.get(agent_name) or route_agents[minion_registry.fallback]
 
 # Function to determine which agent to use
 def agent_orchestrator(user_question: str) -> Callable[[State], dict]:
-    response = orchestrator_model.invoke(orchestrator_prompt.format(input=user_question))
-    agent_name = response.content.strip().lower()
-
-    if agent_name == "generic fallback":
-        return generic_fallback_minion
-    elif agent_name == "email manager":
-        return email_manager_minion
-    elif agent_name == "scheduling assistant":
-        return scheduling_minion
-    elif agent_name == "research":
-        return research_minion
-    elif agent_name == "knowledge base":
-        return knowledge_base_minion
-    else:
-        return generic_fallback_minion
-
-# Functions for each minion
-def email_manager_minion(state: State) -> dict:
-    user_input = state['messages'][-1].content
-    if "send email" in user_input.lower():
-        # Extract email details from user input
-        send_email("recipient@example.com", "Subject", "This is a test message.")
-        return {"messages": state['messages'] + [AIMessage(content="Email sent successfully!")]}    
-    else:
-        return invoke_agent(state, email_manager_model, email_manager_prompt, "email_manager")
-
-def scheduling_minion(state: State) -> dict:
-    user_input = state['messages'][-1].content
-    if "schedule event" in user_input.lower():
-        # Extract event details from user input
-        create_event({"summary": "Meeting", "start": "2024-10-06T09:00:00-07:00", "end": "2024-10-06T10:00:00-07:00"})
-        return {"messages": state['messages'] + [AIMessage(content="Event scheduled successfully!")]}    
-    else:
-        return invoke_agent(state, scheduling_model, scheduling_prompt, "scheduling")
-
-def research_minion(state: State) -> dict:
-    user_input = state['messages'][-1].content
-    if "weather" in user_input.lower():
-        zip_code = "94103"  # Example ZIP code, extract actual code from user input
-        weather_info = get_weather(zip_code)
-        return {"messages": state['messages'] + [AIMessage(content=weather_info)]}
-    return invoke_agent(state, research_model, research_prompt, "research")
-
-def knowledge_base_minion(state: State) -> dict:
-    return invoke_agent(state, knowledge_base_model, knowledge_base_prompt, "knowledge_base")
-
-def generic_fallback_minion(state: State) -> dict:
-    return invoke_agent(state, receptionist_model, receptionist_prompt, "receptionist")
-
-# Function to invoke a specific agent
-def invoke_agent(state: State, model: ChatGroq, prompt: ChatPromptTemplate, agent_name: str) -> dict:
-    messages = state['messages']
-    human_input = messages[-1].content if isinstance(messages[-1], HumanMessage) else ""
-    
-    logger.info(f"\033[94m[{agent_name} agent] Received input: {human_input}\033[0m")
-    
+    return select_agent(route_question(user_question))
+
+# Run a minion: its tools in order, until one answers the turn, then its model with whatever context they added
+def run_minion(state: State, name: str) -> dict:
+    context = []
+    for tool in minion_registry.get(name).tools:
+        result = minion_tools[tool](state)
+        if result is None:
+            continue
+        if result.reply is not None:
+            return {"messages": state['messages'] + [AIMessage(content=result.reply)]}
+        if result.context:
+            context.append(result.context)
+    return invoke_agent(state, minion_models[name], minion_registry.prompt(name), name, context="\n\n".join(context))
+
+def minion_agent(name: str) -> Callable[[State], dict]:
+    def agent(state: State) -> dict:
+        return run_minion(state, name)
+    agent.__name__ = f"{name.replace(' ', '_')}_minion"
+    return agent
+
+# Token-budgeted chat history: recent turns verbatim, older turns folded into a rolling summary
+history_manager = history_manager_from_env()
+
+# Opt-in cache of minion answers for repeated and near-duplicate questions. Minions declared "cacheable": false
+# (email, scheduling and knowledge base answers depend on the inbox, calendar and vault) are never cached.
+response_cache = response_cache_from_env(disabled_minions={name for name, minion in minion_registry.minions.items() if not minion.cacheable})
+
+# The work around each model call: the response cache, the history window, logging, fallbacks for empty answers
+# and errors, and the model call metrics
+minion_turns = MinionTurns(history_manager, response_cache, model_seconds=model_seconds, trace_name="agent_response")
+
+# Function to invoke a specific agent; context (e.g. retrieved notes) is sent to the model after the question
+def invoke_agent(state: State, model: ChatGroq, prompt: ChatPrompt, agent_name: str, context: str = "") -> dict:
+    turn = minion_turns.begin(state, model, prompt, agent_name, context=context)
+    hit = turn.cached()
+    if hit is not None:
+        return turn.update(hit.content)
+    model_input = turn.model_input()
     try:
-        with trace("agent_response"):
-            response = model.invoke(prompt.format(chat_history=messages[:-1], input=human_input))
-        
-        logger.info(f"\033[92m[{agent_name} agent] Response: {response.content}\033[0m")
-        
-        if response.content.strip():
-            return {"messages": state['messages'] + [AIMessage(content=response.content)]}
-        else:
-            logger.warning(f"\033[93m[{agent_name} agent] Empty response from agent\033[0m")
-            return {"messages": state['messages'] + [AIMessage(content="I'm sorry, I couldn't generate a response. Could you try asking something else?")]}    
+        with turn.timed():
+            response = model.invoke(model_input)
+        return turn.update(turn.answered(response.content))
     except Exception as e:
-        logger.error(f"\033[91m[{agent_name} agent] Error in invoke_agent function: {str(e)}\033[0m", exc_info=True)
-        return {"messages": state['messages'] + [AIMessage(content="I apologize, but I encountered an error. Can we try again?")]}    
+        return turn.update(turn.failed(e, "invoke_agent"))
+
+# Routes the local router can name, and the minion behind each
+route_agents = {name: minion_agent(name) for name in minion_registry.minions}
+agent_routes = {agent: route for route, agent in route_agents.items()}
+
+# Opt-in speculative routing: while the orchestrator LLM decides, the likely minion already starts answering.
+# Minions declared with "side_effects" (the email and scheduling minions send mail and create events) never run speculatively.
+speculator = Speculator(
+    enabled=os.getenv("SPECULATIVE_ROUTING", "0") == "1",
+    max_workers=int(os.getenv("SPECULATION_WORKERS", 8)),
+    unsafe_routes={route_agents[name] for name, minion in minion_registry.minions.items() if minion.side_effects},
+)
+
+# Cheap guess at the minion for this turn: the local router's best guess, else the minion that answered last
+def predict_agent(state: State) -> Optional[Callable[[State], dict]]:
+    decision = fast_router.classify(state['messages'][-1].content)
+    if decision.confidence > 0:
+        return route_agents.get(decision.route)
+    return route_agents.get(state.get('route'))
 
 # Create the state graph and add nodes
+# Orchestrator node: route the question, then answer with the chosen minion (or the speculative answer)
+def orchestrate(state: State) -> dict:
+    speculation = speculator.begin(predict_agent(state) if speculator.enabled else None, lambda agent: agent(state))
+    agent = select_agent(route_question(state['messages'][-1].content, before_llm=speculation.start))
+    return session_store.turn_update(state, {**speculation.finish(agent), "route": agent_routes[agent]})
+
 graph = StateGraph(State)
-graph.add_node("orchestrator", lambda state: agent_orchestrator(state['messages'][-1].content)(state))
+graph.add_node("orchestrator", orchestrate)
 graph.set_entry_point("orchestrator")
 graph.add_edge("orchestrator", END)
 
-# Compile the graph
-app = graph.compile()
+# Per-session conversation state, keyed by the X-Session-ID header or session_id cookie
+session_store = session_store_from_env()
+
+# Compile the graph; each session is a checkpointed thread, so a turn sends only its new message
+app = graph.compile(checkpointer=session_store.checkpointer)
 
 # Initialize Flask app
 flask_app = Flask(__name__)
 
-# Global state to maintain conversation history
-global_state = {"messages": []}
+# Requests handled and in flight in this worker, reported with the other workers' at /health; under the pre-fork
+# server its metric series are shared too, so /metrics exports every worker's
+worker_health = worker_health_from_env(metrics=metrics_registry.snapshot)
+flask_app.wsgi_app = worker_health.wsgi(flask_app.wsgi_app)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
 
 @flask_app.route('/chat', methods=['POST'])
 def chat():
-    global global_state
-    
-    data = request.json
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object."}), 400
     user_question = data.get('userquestion', '')
+    session_id, is_new_session = resolve_session_id(request.headers.get(SESSION_HEADER), request.cookies.get(SESSION_COOKIE))
+    # A client retrying this request sends the same Idempotency-Key, so queued emails and events are not sent twice
+    message_id = (request.headers.get(IDEMPOTENCY_HEADER) or uuid.uuid4().hex)[:128]
+    request_id = request_id_from(request.headers.get(REQUEST_ID_HEADER))
     
-    try:
-        with trace("user_interaction"):
-            global_state = app.invoke({"messages": global_state["messages"] + [HumanMessage(content=user_question)]})
-            ai_message = global_state['messages'][-1].content
+    with log_context(request_id=request_id):
+        try:
+            with request_seconds.time(endpoint="/chat") as timing, trace("user_interaction"), session_store.thread(session_id) as config:
+                question = HumanMessage(content=user_question, additional_kwargs={"idempotency_key": message_id})
+                state = app.invoke({"messages": [question]}, config)
+                ai_message = state['messages'][-1].content
+                timing.labels["minion"] = state.get("route", "")
+            
+            logger.info(f"\nUser: {clip(user_question)}\nAI: {clip(ai_message)}\n{'-'*50}")
+            response = jsonify({"response": ai_message, "session_id": session_id})
+            response.headers[REQUEST_ID_HEADER] = request_id
+            if is_new_session:
+                response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite="Lax")
+            return response
         
-        logger.info(f"\nUser: {user_question}\nAI: {ai_message}\n{'-'*50}")
-        return jsonify({"response": ai_message})
-    
-    except Exception as e:
-        logger.error(f"\033[91mError in chat endpoint: {str(e)}\033[0m", exc_info=True)
-        return jsonify({"error": "An error occurred while processing your request."}), 500
+        except Exception as e:
+            logger.error(f"\033[91mError in chat endpoint: {str(e)}\033[0m", exc_info=True)
+            return jsonify({"error": "An error occurred while processing your request."}), 500, {REQUEST_ID_HEADER: request_id}
+
+@flask_app.route('/routing/stats', methods=['GET'])
+def routing_stats():
+    return jsonify({"router": fast_router.stats(), "cache": routing_cache.stats(), "speculation": speculator.stats()})
+
+@flask_app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(response_cache.stats())
+
+# Ranked search over the notes vault: /notes/search?q=...&k=5
+@flask_app.route('/notes/search', methods=['GET'])
+def notes_search():
+    query = request.args.get('q', '')
+    k = request.args.get('k', NOTES_TOP_K, type=int)
+    results = notes_index.search(query, k=max(1, min(k, 50)))
+    return jsonify({"results": [vars(result) for result in results], "index": notes_index.stats()})
+
+# Delivery status of a queued email or calendar event, by the tracking id the minion replied with
+@flask_app.route('/outbox/<job_id>', methods=['GET'])
+def outbox_job(job_id):
+    job = outbox.status(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown tracking id."}), 404
+    return jsonify(job)
+
+@flask_app.route('/outbox/stats', methods=['GET'])
+def outbox_stats():
+    return jsonify(outbox.stats())
+
+@flask_app.route('/weather/stats', methods=['GET'])
+def weather_stats():
+    return jsonify(weather_provider.stats())
+
+# Latency histograms in Prometheus text format; under the pre-fork server, every live worker's with a "worker" label
+@flask_app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(metrics_registry.render(worker_health.worker_metrics()), content_type=METRICS_CONTENT_TYPE)
+
+# Liveness and per-worker health: this worker's counters and model circuits, and every worker's last heartbeat
+@flask_app.route('/health', methods=['GET'])
+def health():
+    return jsonify({
+        "status": "ok",
+        "worker": worker_health.snapshot(),
+        "workers": worker_health.workers(),
+        "circuits": model_registry.gateway.resilience.circuit_states(),
+        "sessions": session_store.stats(),
+    })
+
+# Integrations that must be live for /ready to report ready (comma-separated, e.g. "gmail,calendar")
+READY_REQUIRES = tuple(name.strip() for name in os.getenv("READY_REQUIRES", "").split(",") if name.strip())
+
+# Readiness probe: which integrations are live, and how long the module took to import
+@flask_app.route('/ready', methods=['GET'])
+def ready():
+    is_ready, statuses = integrations.readiness(READY_REQUIRES)
+    body = {
+        "status": "ready" if is_ready else "not_ready",
+        "import_seconds": round(IMPORT_SECONDS, 3),
+        "required": list(READY_REQUIRES),
+        "integrations": statuses,
+    }
+    return jsonify(body), 200 if is_ready else 503
+
+IMPORT_SECONDS = time.perf_counter() - _import_started
+logger.info(f"develop.py imported in {IMPORT_SECONDS:.3f}s.")
+
+if os.getenv("INTEGRATIONS_WARMUP", "0") == "1":
+    integrations.warm_up()
+
+# Deliver anything left in the outbox by a previous run
+outbox.ensure_started()
 
 if __name__ == '__main__':
     print("Multi-Agent Chat Server is running. Press Ctrl+C to quit.")
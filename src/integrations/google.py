@@ -0,0 +1,116 @@
+import itertools
+import logging
+import threading
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+GMAIL_SCOPES = ['https://www.googleapis.com/auth/gmail.send']
+CALENDAR_SCOPES = ['https://www.googleapis.com/auth/calendar']
+
+
+# The Google client libraries take a noticeable time to import, so they are only loaded on first use
+def _build_service(api: str, version: str, credentials_path: str, scopes: list[str]):
+    from google.oauth2 import service_account
+    from googleapiclient.discovery import build
+
+    creds = service_account.Credentials.from_service_account_file(credentials_path, scopes=scopes)
+    return build(api, version, credentials=creds, cache_discovery=False)
+
+def gmail_service(credentials_path: str):
+    return _build_service('gmail', 'v1', credentials_path, GMAIL_SCOPES)
+
+def calendar_service(credentials_path: str):
+    return _build_service('calendar', 'v3', credentials_path, CALENDAR_SCOPES)
+
+# Outbox handler that sends a list of payloads as one batch HTTP request; each payload gets its response or error back.
+# Google caps a batch at 100 calls (50 for Calendar), so keep OUTBOX_BATCH_SIZE at or below that.
+def batch_sender(service: Callable[[], Any], build_request: Callable[[Any, dict], Any]) -> Callable[[list[dict]], list]:
+    def send(payloads: list[dict]) -> list:
+        client = service()
+        results: list = [None] * len(payloads)
+
+        def collect(request_id: str, response: Any, exception: Exception) -> None:
+            results[int(request_id)] = exception if exception is not None else response
+
+        batch = client.new_batch_http_request(callback=collect)
+        for i, payload in enumerate(payloads):
+            batch.add(build_request(client, payload), request_id=str(i))
+        batch.execute()
+        return results
+    return send
+
+
+class _Request:
+    """Mimics a googleapiclient HttpRequest: nothing happens until execute()."""
+
+    def __init__(self, run):
+        self._run = run
+
+    def execute(self):
+        return self._run()
+
+
+class _Batch:
+    """Mimics a googleapiclient BatchHttpRequest: the added requests run, in order, on execute()."""
+
+    def __init__(self, recorder: "_Recorder", callback):
+        self._recorder = recorder
+        self._callback = callback
+        self._requests: list[tuple[str, _Request]] = []
+
+    def add(self, request: _Request, callback=None, request_id: str = None) -> None:
+        self._requests.append((request_id or str(len(self._requests) + 1), request))
+
+    def execute(self) -> None:
+        with self._recorder._lock:
+            self._recorder.batches.append(len(self._requests))
+        for request_id, request in self._requests:
+            try:
+                response, exception = request.execute(), None
+            except Exception as e:
+                response, exception = None, e
+            self._callback(request_id, response, exception)
+
+
+class _Recorder:
+    def __init__(self):
+        self.calls: list[tuple[str, dict]] = []
+        self.batches: list[int] = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def new_batch_http_request(self, callback=None) -> _Batch:
+        return _Batch(self, callback)
+
+    def record(self, method: str, **kwargs) -> _Request:
+        def run():
+            with self._lock:
+                self.calls.append((method, kwargs))
+                result_id = f"offline-{next(self._ids)}"
+            logger.info(f"[offline google] {method} {result_id}")
+            return {"id": result_id, **kwargs.get("body", {})}
+        return _Request(run)
+
+
+class OfflineGmailService(_Recorder):
+    """Local stand-in for the Gmail discovery client; sent messages are recorded in `calls`, batch sizes in `batches`."""
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def send(self, userId: str, body: dict) -> _Request:
+        return self.record("gmail.users.messages.send", userId=userId, body=body)
+
+
+class OfflineCalendarService(_Recorder):
+    """Local stand-in for the Calendar discovery client; inserted events are recorded in `calls`, batch sizes in `batches`."""
+
+    def events(self):
+        return self
+
+    def insert(self, calendarId: str, body: dict) -> _Request:
+        return self.record("calendar.events.insert", calendarId=calendarId, body=body)
@@ -0,0 +1,104 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+NOT_STARTED = "not_started"
+INITIALIZING = "initializing"
+READY = "ready"
+FAILED = "failed"
+
+
+class IntegrationUnavailable(RuntimeError):
+    """An external integration could not be initialized."""
+
+
+class LazyIntegration:
+    """A client for an external service, created on first use instead of at import.
+
+    A failed initialization is remembered and retried after `retry_after` seconds,
+    so one bad credential file does not take the whole server down.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Any], retry_after: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.factory = factory
+        self.retry_after = retry_after
+        self._clock = clock
+        self._client: Any = None
+        self._state = NOT_STARTED
+        self._error: Optional[str] = None
+        self._failed_at = 0.0
+        self._init_seconds: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def get(self) -> Any:
+        if self._state == READY:
+            return self._client
+        with self._lock:
+            if self._state == READY:
+                return self._client
+            if self._state == FAILED and self._clock() - self._failed_at < self.retry_after:
+                raise IntegrationUnavailable(f"{self.name} is unavailable: {self._error}")
+            self._state = INITIALIZING
+            started = time.perf_counter()
+            try:
+                client = self.factory()
+            except Exception as e:
+                self._state = FAILED
+                self._error = f"{type(e).__name__}: {e}"
+                self._failed_at = self._clock()
+                logger.error(f"\033[91mIntegration {self.name} failed to initialize: {self._error}\033[0m")
+                raise IntegrationUnavailable(f"{self.name} is unavailable: {self._error}") from e
+            self._client = client
+            self._init_seconds = time.perf_counter() - started
+            self._error = None
+            self._state = READY
+            logger.info(f"Integration {self.name} ready in {self._init_seconds:.3f}s.")
+            return client
+
+    def status(self) -> dict:
+        status = {"state": self._state}
+        if self._init_seconds is not None:
+            status["init_seconds"] = round(self._init_seconds, 3)
+        if self._error:
+            status["error"] = self._error
+        return status
+
+
+class IntegrationRegistry:
+    """Named lazy integrations, with an optional background warm-up and a readiness summary."""
+
+    def __init__(self):
+        self._integrations: dict[str, LazyIntegration] = {}
+
+    def register(self, name: str, factory: Callable[[], Any], **kwargs) -> LazyIntegration:
+        integration = self._integrations[name] = LazyIntegration(name, factory, **kwargs)
+        return integration
+
+    def get(self, name: str) -> Any:
+        return self._integrations[name].get()
+
+    # Initialize every integration on a daemon thread so the server can accept requests meanwhile
+    def warm_up(self) -> threading.Thread:
+        def run():
+            for integration in self._integrations.values():
+                try:
+                    integration.get()
+                except IntegrationUnavailable:
+                    pass
+        thread = threading.Thread(target=run, name="integration-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    # Ready when every required integration is live; the others are reported but do not block readiness
+    def readiness(self, required: tuple[str, ...] = ()) -> tuple[bool, dict]:
+        statuses = {name: integration.status() for name, integration in self._integrations.items()}
+        ready = all(statuses.get(name, {}).get("state") == READY for name in required)
+        return ready, statuses
@@ -0,0 +1,256 @@
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+from .lazy import IntegrationUnavailable
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Delivers a batch of payloads of one kind; returns one result per payload, or the exception that payload failed with
+BatchHandler = Callable[[list[dict]], list]
+
+
+@dataclass
+class QueuedJob:
+    id: str
+    kind: str
+    status: str
+    duplicate: bool = False
+
+
+# Errors worth retrying: the integration is down, the API is throttling or failing, or the network dropped.
+# Any other 4xx answer means the request itself is wrong and will not succeed on a second try.
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, IntegrationUnavailable):
+        return True
+    status = getattr(getattr(error, "resp", None), "status", None)
+    if status is not None:
+        return int(status) == 429 or int(status) >= 500
+    return True
+
+
+class Outbox:
+    """Durable queue of outbound work (emails, calendar events) delivered by background workers.
+
+    Jobs are rows in a local SQLite file, so they survive a restart. One worker per kind claims up to
+    `batch_size` due jobs at a time and hands them to that kind's handler in one call. Failed jobs are
+    retried with exponential backoff until `max_attempts`; a job whose worker died is claimed again once
+    its lease runs out. Delivery is at least once: a crash between the API call and recording the
+    result sends that batch again. Enqueueing the same idempotency key twice returns the first job.
+    """
+
+    def __init__(
+        self,
+        path: str = "outbox.db",
+        handlers: Optional[dict[str, BatchHandler]] = None,
+        batch_size: int = 50,
+        max_attempts: int = 5,
+        backoff: float = 2.0,
+        max_backoff: float = 300.0,
+        lease: float = 120.0,
+        poll_interval: float = 1.0,
+        linger: float = 0.05,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.path = path
+        self.handlers = dict(handlers or {})
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.linger = linger
+        self._clock = clock
+        self._local = threading.local()
+        self._wakeups = {kind: threading.Event() for kind in self.handlers}
+        self._stopping = threading.Event()
+        self._workers: list[threading.Thread] = []
+        self._started_pid: Optional[int] = None
+        self._start_lock = threading.Lock()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, idempotency_key TEXT UNIQUE, payload TEXT NOT NULL, "
+                "status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, due_at REAL NOT NULL, "
+                "result TEXT, error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_due ON jobs (kind, status, due_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # Queue a payload for delivery and return its tracking id straight away
+    def enqueue(self, kind: str, payload: dict, idempotency_key: Optional[str] = None) -> QueuedJob:
+        if kind not in self.handlers:
+            raise KeyError(f"No outbox handler for {kind!r}")
+        now = self._clock()
+        job_id = uuid.uuid4().hex
+        with self._connection() as conn:
+            inserted = conn.execute(
+                "INSERT INTO jobs (id, kind, idempotency_key, payload, status, due_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(idempotency_key) DO NOTHING",
+                (job_id, kind, idempotency_key, json.dumps(payload), PENDING, now, now, now),
+            ).rowcount
+            if not inserted:
+                existing_id, existing_kind, status = conn.execute(
+                    "SELECT id, kind, status FROM jobs WHERE idempotency_key = ?", (idempotency_key,)
+                ).fetchone()
+                return QueuedJob(existing_id, existing_kind, status, duplicate=True)
+        self.ensure_started()
+        self._wakeups[kind].set()
+        return QueuedJob(job_id, kind, PENDING)
+
+    def status(self, job_id: str) -> Optional[dict]:
+        row = self._connection().execute(
+            "SELECT id, kind, status, attempts, result, error, created_at, updated_at FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job_id, kind, status, attempts, result, error, created_at, updated_at = row
+        return {
+            "id": job_id,
+            "kind": kind,
+            "status": status,
+            "attempts": attempts,
+            "result": json.loads(result) if result else None,
+            "error": error,
+            "created_at": created_at,
+            "updated_at": updated_at,
+        }
+
+    # Mark up to batch_size due jobs as running under a lease, so no other worker or process takes them
+    def _claim(self, kind: str) -> list[tuple[str, dict, int]]:
+        now = self._clock()
+        with self._connection() as conn:
+            rows = conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, due_at = ?, updated_at = ? WHERE id IN ("
+                "SELECT id FROM jobs WHERE kind = ? AND status IN (?, ?) AND due_at <= ? ORDER BY due_at LIMIT ?) "
+                "RETURNING id, payload, attempts",
+                (RUNNING, now + self.lease, now, kind, PENDING, RUNNING, now, self.batch_size),
+            ).fetchall()
+        return [(job_id, json.loads(payload), attempts) for job_id, payload, attempts in rows]
+
+    def _retry_delay(self, attempts: int) -> float:
+        return min(self.max_backoff, self.backoff * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+
+    # Deliver one batch of due jobs of this kind; returns how many jobs were attempted
+    def run_once(self, kind: str) -> int:
+        jobs = self._claim(kind)
+        if not jobs:
+            return 0
+        try:
+            results = self.handlers[kind]([payload for _, payload, _ in jobs])
+            if len(results) != len(jobs):
+                raise RuntimeError(f"{kind} handler returned {len(results)} results for {len(jobs)} jobs")
+        except Exception as e:
+            results = [e] * len(jobs)
+        now = self._clock()
+        delivered = retried = failed = 0
+        with self._connection() as conn:
+            for (job_id, _, attempts), result in zip(jobs, results):
+                if not isinstance(result, BaseException):
+                    delivered += 1
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, result = ?, error = NULL, updated_at = ? WHERE id = ?",
+                        (DONE, json.dumps(result, default=str), now, job_id),
+                    )
+                    continue
+                error = f"{type(result).__name__}: {result}"
+                if is_retryable(result) and attempts < self.max_attempts:
+                    retried += 1
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, due_at = ?, error = ?, updated_at = ? WHERE id = ?",
+                        (PENDING, now + self._retry_delay(attempts), error, now, job_id),
+                    )
+                else:
+                    failed += 1
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?", (FAILED, error, now, job_id)
+                    )
+                    logger.error(f"\033[91mOutbox {kind} job {job_id} failed after {attempts} attempts: {error}\033[0m")
+        logger.info(f"Outbox {kind}: {delivered} delivered, {retried} to retry, {failed} failed in a batch of {len(jobs)}.")
+        return len(jobs)
+
+    def _next_due(self, kind: str) -> Optional[float]:
+        row = self._connection().execute(
+            "SELECT MIN(due_at) FROM jobs WHERE kind = ? AND status IN (?, ?)", (kind, PENDING, RUNNING)
+        ).fetchone()
+        return row[0]
+
+    def _work(self, kind: str) -> None:
+        wakeup = self._wakeups[kind]
+        while not self._stopping.is_set():
+            try:
+                if self.run_once(kind):
+                    continue
+                next_due = self._next_due(kind)
+            except Exception as e:
+                logger.error(f"\033[91mOutbox {kind} worker error: {str(e)}\033[0m", exc_info=True)
+                next_due = None
+            wait = self.poll_interval if next_due is None else min(self.poll_interval, max(0.0, next_due - self._clock()))
+            if wakeup.wait(wait):
+                wakeup.clear()
+                # Give a burst of enqueues a moment to land in the same batch
+                self._stopping.wait(self.linger)
+
+    # Start one worker thread per kind; after a fork the workers are started again in the child process
+    def ensure_started(self) -> None:
+        if self._started_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._started_pid == os.getpid():
+                return
+            self._local = threading.local()
+            self._stopping.clear()
+            self._workers = [
+                threading.Thread(target=self._work, args=(kind,), name=f"outbox-{kind}", daemon=True) for kind in self.handlers
+            ]
+            for worker in self._workers:
+                worker.start()
+            self._started_pid = os.getpid()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopping.set()
+        for event in self._wakeups.values():
+            event.set()
+        for worker in self._workers:
+            worker.join(timeout)
+        self._started_pid = None
+
+    def stats(self) -> dict:
+        counts: dict[str, dict[str, int]] = {kind: {} for kind in self.handlers}
+        for kind, status, count in self._connection().execute("SELECT kind, status, COUNT(*) FROM jobs GROUP BY kind, status"):
+            counts.setdefault(kind, {})[status] = count
+        return {"path": self.path, "workers": len([w for w in self._workers if w.is_alive()]), "jobs": counts}
+
+
+def outbox_from_env(handlers: dict[str, BatchHandler]) -> Outbox:
+    return Outbox(
+        path=os.getenv("OUTBOX_PATH", "outbox.db"),
+        handlers=handlers,
+        batch_size=int(os.getenv("OUTBOX_BATCH_SIZE", 50)),
+        max_attempts=int(os.getenv("OUTBOX_MAX_ATTEMPTS", 5)),
+        backoff=float(os.getenv("OUTBOX_BACKOFF", 2)),
+        max_backoff=float(os.getenv("OUTBOX_MAX_BACKOFF", 300)),
+        lease=float(os.getenv("OUTBOX_LEASE", 120)),
+        poll_interval=float(os.getenv("OUTBOX_POLL_INTERVAL", 1)),
+    )
@@ -0,0 +1,207 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from .lazy import IntegrationUnavailable
+
+logger = logging.getLogger(__name__)
+
+WEATHER_URL = "http://api.openweathermap.org/data/2.5/weather"
+
+
+class WeatherLookupError(RuntimeError):
+    """The weather API did not answer, or answered with an error."""
+
+
+# HTTP session for the weather API, kept alive between lookups over a bounded connection pool
+def weather_session():
+    api_key = os.getenv("WEATHER_API_KEY", "")
+    if not api_key or api_key.startswith("<"):
+        raise ValueError("WEATHER_API_KEY is not configured")
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    pool_size = int(os.getenv("WEATHER_POOL_SIZE", 10))
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class _OfflineResponse:
+    status_code = 200
+
+    def __init__(self, payload: dict):
+        self._payload = payload
+
+    def json(self) -> dict:
+        return self._payload
+
+
+class OfflineWeatherSession:
+    """Local stand-in for the weather API session; answers every lookup with the same mild weather."""
+
+    def __init__(self):
+        self.calls: list[dict] = []
+
+    def get(self, url: str, params: dict = None, timeout: float = None) -> _OfflineResponse:
+        self.calls.append(dict(params or {}))
+        return _OfflineResponse({"weather": [{"description": "clear sky"}], "main": {"temp": 293.15}})
+
+
+@dataclass
+class _Observation:
+    payload: dict
+    fetched_at: float
+
+
+class WeatherProvider:
+    """Weather lookups with a per-location TTL cache in front of the API session.
+
+    Fresh entries are served from the cache. For `stale_ttl` seconds after expiring, an entry is still
+    served while one background refresh fetches a new one. Concurrent misses for the same location
+    share a single upstream request.
+    """
+
+    def __init__(
+        self,
+        session: Callable[[], Any],
+        api_key: str = "",
+        url: str = WEATHER_URL,
+        ttl: float = 600.0,
+        stale_ttl: float = 1800.0,
+        maxsize: int = 1024,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 10.0,
+        refresh_workers: int = 2,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._session = session
+        self.api_key = api_key
+        self.url = url
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.maxsize = maxsize
+        self.timeout = (connect_timeout, read_timeout)
+        self._clock = clock
+        self._entries: OrderedDict[str, _Observation] = OrderedDict()
+        self._inflight: dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=max(1, refresh_workers), thread_name_prefix="weather-refresh")
+        self._hits = 0
+        self._stale_hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._refreshes = 0
+        self._errors = 0
+
+    # Current conditions for a location, as returned by the weather API
+    def get(self, location: str) -> dict:
+        key = " ".join(location.split()).lower()
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                age = now - entry.fetched_at
+                if age < self.ttl:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return entry.payload
+                if age < self.ttl + self.stale_ttl:
+                    self._entries.move_to_end(key)
+                    self._stale_hits += 1
+                    if key not in self._inflight:
+                        self._inflight[key] = Future()
+                        self._refreshes += 1
+                        self._refresher.submit(self._refresh, key, location)
+                    return entry.payload
+            # Another request is already fetching this location: wait for its answer instead of asking again
+            future = self._inflight.get(key)
+            if future is not None:
+                self._coalesced += 1
+            else:
+                self._inflight[key] = Future()
+                self._misses += 1
+        if future is not None:
+            return future.result()
+        return self._fetch_into(key, location)
+
+    def _fetch(self, location: str) -> dict:
+        try:
+            response = self._session().get(self.url, params={"zip": location, "appid": self.api_key}, timeout=self.timeout)
+        except IntegrationUnavailable:
+            raise
+        except Exception as e:
+            raise WeatherLookupError(f"Weather request failed: {type(e).__name__}: {e}") from e
+        if response.status_code != 200:
+            raise WeatherLookupError(f"Weather API answered {response.status_code}")
+        return response.json()
+
+    # Fetch a location and publish the result to anyone waiting on it
+    def _fetch_into(self, key: str, location: str) -> dict:
+        future = self._inflight[key]
+        try:
+            payload = self._fetch(location)
+        except Exception as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+                self._errors += 1
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._entries[key] = _Observation(payload, self._clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            self._inflight.pop(key, None)
+        future.set_result(payload)
+        return payload
+
+    def _refresh(self, key: str, location: str) -> None:
+        try:
+            self._fetch_into(key, location)
+        except Exception as e:
+            logger.warning(f"\033[93mWeather refresh for {location} failed, serving the cached observation: {e}\033[0m")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def close(self) -> None:
+        self._refresher.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._stale_hits + self._misses + self._coalesced
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "stale_ttl": self.stale_ttl,
+                "hits": self._hits,
+                "stale_hits": self._stale_hits,
+                "misses": self._misses,
+                "coalesced": self._coalesced,
+                "refreshes": self._refreshes,
+                "errors": self._errors,
+                "hit_ratio": round((self._hits + self._stale_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+
+def weather_provider_from_env(session: Callable[[], Any]) -> WeatherProvider:
+    return WeatherProvider(
+        session,
+        api_key=os.getenv("WEATHER_API_KEY", ""),
+        url=os.getenv("WEATHER_URL", WEATHER_URL),
+        ttl=float(os.getenv("WEATHER_CACHE_TTL", 600)),
+        stale_ttl=float(os.getenv("WEATHER_STALE_TTL", 1800)),
+        maxsize=int(os.getenv("WEATHER_CACHE_SIZE", 1024)),
+        connect_timeout=float(os.getenv("WEATHER_CONNECT_TIMEOUT", 3.05)),
+        read_timeout=float(os.getenv("WEATHER_READ_TIMEOUT", 10)),
+    )
@@ -1,155 +1,180 @@
 # Import necessary libraries
 import os
+import time
 import logging
-from typing import TypedDict, Union, Callable
-from langchain.schema import SystemMessage, HumanMessage, AIMessage
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TypedDict, Union, Callable, Iterator, Optional
+from langchain.schema import HumanMessage, AIMessage
 from langchain_groq import ChatGroq
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder, HumanMessagePromptTemplate
 from langgraph.graph import StateGraph, END
 import random
 import streamlit as st
 from dotenv import load_dotenv
-
-# Load environment variables from .env file
-load_dotenv()
-
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('multi_minion_orchestrator.log')
-    ]
-)
+from config.gateway import RateLimitExceeded
+from config.models import model_registry_from_env
+from config.resilience import ModelUnavailable
+from minions.history import history_manager_from_env
+from minions.prompts import ChatPrompt
+from minions.response_cache import response_cache_from_env
+from minions.turns import MinionTurns
+from orchestrator.logs import bind_log_context, log_context, logging_from_env, request_id_from
+from orchestrator.registry import MinionRegistry, minion_registry_from_env
+from orchestrator.router import DegradedRoute, FastPathRouter
+from orchestrator.routing_cache import RoutingCache
+
+# Set up logging: JSON lines to a size-rotated file and colored text to stderr, written by a background thread.
+# Reruns keep the pipeline started by the first run.
+logging_from_env('multi_minion_orchestrator.log')
 logger = logging.getLogger(__name__)
 
-# Access environment variables
-groq_api_key = os.getenv("GROQ_API_KEY")
-
 # Define chatbot state
 class State(TypedDict):
     messages: list[Union[HumanMessage, AIMessage]]
-
-# Initialize models for each minion
-cat_model = ChatGroq(temperature=0.7, model_name="llama3-groq-70b-8192-tool-use-preview")
-dog_model = ChatGroq(temperature=0.7, model_name="llama3-groq-70b-8192-tool-use-preview")
-monkey_model = ChatGroq(temperature=0.7, model_name="llama3-groq-70b-8192-tool-use-preview")
-receptionist_model = ChatGroq(temperature=0.7, model_name="llama3-groq-70b-8192-tool-use-preview")
-orchestrator_model = ChatGroq(temperature=0.7, model_name="llama3-groq-70b-8192-tool-use-preview")
-
-# Prompt templates
-cat_minion_prompt = ChatPromptTemplate.from_messages([
-    SystemMessage(content="You are a friendly AI assistant who loves to talk about cats."),
-    MessagesPlaceholder(variable_name="chat_history"),
-    HumanMessagePromptTemplate.from_template("{input}")
-])
-
-dog_minion_prompt = ChatPromptTemplate.from_messages([
-    SystemMessage(content="You are a friendly AI assistant who loves to talk about dogs."),
-    MessagesPlaceholder(variable_name="chat_history"),
-    HumanMessagePromptTemplate.from_template("{input}")
-])
-
-monkey_minion_prompt = ChatPromptTemplate.from_messages([
-    SystemMessage(content="You are a friendly AI assistant who loves to talk about monkeys."),
-    MessagesPlaceholder(variable_name="chat_history"),
-    HumanMessagePromptTemplate.from_template("{input}")
-])
-
-chat_minion_prompt = ChatPromptTemplate.from_messages([
-    SystemMessage(content="""You are an advanced, friendly AI assistant named Chat Minion, designed to provide exceptional conversational experiences and general assistance. Your primary goals are:
-
-1. Engage in natural, context-aware conversations
-2. Provide accurate and helpful information on a wide range of topics
-3. Offer personalized assistance based on user preferences and conversation history
-4. Guide users to specialized minions (Cat, Dog, or Monkey) when appropriate
-5. Maintain a positive and supportive tone throughout the interaction
-
-Key features:
-- Contextual understanding: Analyze the entire conversation history to provide relevant responses
-- Personalization: Remember user preferences and adapt your communication style accordingly
-- Proactive assistance: Anticipate user needs and offer suggestions or follow-up questions
-- Emotional intelligence: Recognize and respond appropriately to user emotions
-- Clear communication: Use concise language and break down complex information when needed
-- Honesty: Admit when you don't know something or when a specialized minion might be better suited to help
-
-Remember to:
-- Ask clarifying questions when needed
-- Provide step-by-step explanations for complex topics
-- Offer analogies or examples to illustrate concepts
-- Summarize key points at the end of longer explanations
-- Suggest relevant resources for further learning
-- Maintain a friendly and engaging tone throughout the conversation
-
-If a query is specifically about cats, dogs, or monkeys, politely suggest consulting the respective specialized minion for more detailed information."""),
-    MessagesPlaceholder(variable_name="chat_history"),
-    HumanMessagePromptTemplate.from_template("{input}")
-])
-
-# Define orchestrator prompt with more explicit instructions
-orchestrator_prompt = ChatPromptTemplate.from_messages([
-    SystemMessage(content="""You are the AI orchestrator assistant for this multi-minion framework. You need to determine which specialized minion should handle each user query. Here are the rules:
-    - The 'cat minion' handles all queries related to cats, kittens, or feline-related information. Example queries include: 'I love cats', 'Tell me about Siamese cats', 'Give me a cat fact'.
-    - The 'dog minion' handles all queries related to dogs, puppies, or canine-related information. Example queries include: 'I love dogs', 'What is the best breed of dog?', 'Give me a dog fact'.
-    - The 'monkey minion' handles all queries related to monkeys, apes, or primate-related information. Example queries include: 'Tell me about monkeys', 'I love chimpanzees', 'Give me a monkey fact'.
-    - The 'chat minion' handles any general questions or chat conversation that is not specifically related to cats, dogs, or monkeys, or when the user intent remains unclear.
-    Based on the user query, output the name of the minion that should handle the query: 'cat minion', 'dog minion', 'monkey minion', or 'chat minion'."""),
-    HumanMessagePromptTemplate.from_template("{input}")
-])
+    summary: str  # rolling summary of the messages folded out of the history window
+    summarized: int  # number of leading messages covered by the summary
+
+# Local fast-path router; the orchestrator LLM is only consulted when it is not confident
+def build_fast_router(registry: MinionRegistry) -> FastPathRouter:
+    router = FastPathRouter(
+        routes=registry.route_specs(),
+        fallback=registry.fallback,
+        threshold=float(os.getenv("FAST_ROUTER_THRESHOLD", 0.8)),
+    )
+
+    # Check the local router against the minions' example questions; a misroute means two minions' keywords overlap
+    report = router.evaluate(registry.examples())
+    logger.info(f"Fast-path router: {report['accuracy']:.0%} accuracy, {report['coverage']:.0%} coverage on minion examples.")
+    return router
+
+# Built once per server process and kept across Streamlit reruns: the .env file, the chat models (declared in
+# src/config/models.json and built on first use over one shared connection pool), the minions (declared in
+# src/config/main_minions.json, with their prompts), router, caches and the answer workers. Streamlit looks up the source of every cached function on each rerun, so they
+# are gathered into a single resource.
+@st.cache_resource(show_spinner=False)
+def get_resources() -> dict:
+    load_dotenv()
+    minion_registry = minion_registry_from_env("main_minions.json")
+    return {
+        "model_registry": model_registry_from_env(),
+        "minion_registry": minion_registry,
+        "fast_router": build_fast_router(minion_registry),
+        "routing_cache": RoutingCache(maxsize=int(os.getenv("ROUTING_CACHE_SIZE", 1024)), ttl=float(os.getenv("ROUTING_CACHE_TTL", 3600))),
+        "history_manager": history_manager_from_env(),
+        "response_cache": response_cache_from_env(),
+        "answer_executor": ThreadPoolExecutor(max_workers=int(os.getenv("UI_ANSWER_WORKERS", 4)), thread_name_prefix="minion-answer"),
+    }
+
+resources = get_resources()
+model_registry = resources["model_registry"]
+
+minion_registry = resources["minion_registry"]
+
+# Model of each minion, by minion name, and of the orchestrator
+minion_models = {name: model_registry.get(minion.model) for name, minion in minion_registry.minions.items()}
+orchestrator_model = model_registry.get(minion_registry.orchestrator_model)
+
+fast_router = resources["fast_router"]
+
+# Routing decisions for repeated questions, shared by every session
+routing_cache = resources["routing_cache"]
+
+# Without the orchestrator LLM (down or rate limited), go with the local router's best guess, however unsure it is. The guess is marked as
+# degraded so it is not cached past the outage.
+def degraded_route(user_question: str, error: Exception) -> DegradedRoute:
+    decision = fast_router.classify(user_question)
+    logger.warning(f"\033[93mOrchestrator model unavailable or rate limited ({error}); routing to {decision.route} (confidence {decision.confidence:.2f}).\033[0m")
+    return DegradedRoute(decision.route)
+
+# Ask the orchestrator LLM which minion should handle the question. Its prompt lists only the minions most likely to
+# fit, so it does not grow with the registry; when none but the fallback resembles the question, there is nothing to ask.
+def llm_route(user_question: str) -> str:
+    candidates = fast_router.candidates(user_question, minion_registry.candidate_count)
+    if len(candidates) == 1:
+        return candidates[0]
+    try:
+        response = orchestrator_model.invoke(minion_registry.orchestrator_prompt(candidates).messages_for((), user_question))
+    except (ModelUnavailable, RateLimitExceeded) as e:
+        return degraded_route(user_question, e)
+    return minion_registry.resolve(response.content, candidates)
 
 # Function to determine which minion to use
 def minion_orchestrator(user_question: str) -> Callable[[State], dict]:
-    # Invoke orchestrator LLM to determine routing
-    response = orchestrator_model.invoke(orchestrator_prompt.format(input=user_question))
-    minion_name = response.content.strip().lower()
-
-    if minion_name == "cat minion":
-        logger.info("Routing to cat minion.")
-        return cat_minion
-    elif minion_name == "dog minion":
-        logger.info("Routing to dog minion.")
-        return dog_minion
-    elif minion_name == "monkey minion":
-        logger.info("Routing to monkey minion.")
-        return monkey_minion
-    else:
-        logger.info("Routing to chat minion.")
-        return chat_minion
-
-# Functions representing each minion
-def cat_minion(state: State) -> dict:
-    return invoke_minion(state, cat_model, cat_minion_prompt, "cat minion")
-
-def dog_minion(state: State) -> dict:
-    return invoke_minion(state, dog_model, dog_minion_prompt, "dog minion")
-
-def monkey_minion(state: State) -> dict:
-    return invoke_minion(state, monkey_model, monkey_minion_prompt, "monkey minion")
-
-def chat_minion(state: State) -> dict:
-    return invoke_minion(state, receptionist_model, chat_minion_prompt, "chat minion")
+    # Reuse a cached decision, route locally when confident, otherwise invoke orchestrator LLM to determine routing
+    minion_name = routing_cache.get(user_question)
+    if minion_name is None:
+        minion_name = fast_router.route(user_question, llm_route)
+        if not isinstance(minion_name, DegradedRoute):
+            routing_cache.put(user_question, minion_name)
+
+    # An unknown name goes to the fallback minion
+    minion = named_minions.get(minion_name) or named_minions[minion_registry.fallback]
+    logger.info(f"Routing to {minion.__name__.replace('_', ' ')}.")
+    return minion
+
+# One function per minion, running the minion's prompt on its model
+def named_minion(name: str) -> Callable[[State], dict]:
+    def minion(state: State) -> dict:
+        return invoke_minion(state, minion_models[name], minion_registry.prompt(name), name)
+    minion.__name__ = name.replace(" ", "_")
+    return minion
+
+named_minions = {name: named_minion(name) for name in minion_registry.minions}
+
+# Streaming counterparts of each minion; they yield text chunks and fill `result` with the state update
+streaming_minions = {
+    minion: lambda state, result, name=name: stream_minion(state, minion_models[name], minion_registry.prompt(name), name, result)
+    for name, minion in named_minions.items()
+}
+
+# Token-budgeted chat history: recent turns verbatim, older turns folded into a rolling summary
+history_manager = resources["history_manager"]
+
+# Opt-in cache of minion answers for repeated and near-duplicate questions
+response_cache = resources["response_cache"]
+
+# The work around each model call that invoke_minion and stream_minion share: the response cache, the history
+# window, logging, and fallbacks for empty answers and errors
+minion_turns = MinionTurns(history_manager, response_cache, label="")
 
 # Function to invoke a specific minion
-def invoke_minion(state: State, model: ChatGroq, prompt: ChatPromptTemplate, minion_name: str) -> dict:
-    messages = state['messages']
-    human_input = messages[-1].content if isinstance(messages[-1], HumanMessage) else ""
-    
-    logger.info(f"\033[94m[{minion_name}] Received input: {human_input}\033[0m")
-    
+def invoke_minion(state: State, model: ChatGroq, prompt: ChatPrompt, minion_name: str) -> dict:
+    turn = minion_turns.begin(state, model, prompt, minion_name)
+    hit = turn.cached()
+    if hit is not None:
+        return turn.update(hit.content)
+    model_input = turn.model_input()
+    try:
+        with turn.timed():
+            response = model.invoke(model_input)
+        return turn.update(turn.answered(response.content))
+    except Exception as e:
+        return turn.update(turn.failed(e, "invoke_minion"))
+
+# Streaming variant of invoke_minion: yields text chunks as the model produces them
+def stream_minion(state: State, model: ChatGroq, prompt: ChatPrompt, minion_name: str, result: dict) -> Iterator[str]:
+    turn = minion_turns.begin(state, model, prompt, minion_name)
+    hit = turn.cached()
+    if hit is not None:
+        yield hit.content
+        result.update(turn.update(hit.content))
+        return
+    model_input = turn.model_input()
+    chunks = []
     try:
-        response = model.invoke(prompt.format(chat_history=messages[:-1], input=human_input))
-        
-        logger.info(f"\033[92m[{minion_name}] Response: {response.content}\033[0m")
-        
-        if response.content.strip():
-            return {"messages": state['messages'] + [AIMessage(content=response.content)]}
-        else:
-            logger.warning(f"\033[93m[{minion_name}] Empty response from minion\033[0m")
-            return {"messages": state['messages'] + [AIMessage(content="I'm sorry, I couldn't generate a response. Could you try asking something else?")]}    
+        with turn.timed():
+            for chunk in model.stream(model_input):
+                if chunk.content:
+                    chunks.append(chunk.content)
+                    yield chunk.content
+        streamed = "".join(chunks)
+        content = turn.answered(streamed)
+        if content != streamed:
+            yield content
     except Exception as e:
-        logger.error(f"\033[91m[{minion_name}] Error in invoke_minion function: {str(e)}\033[0m", exc_info=True)
-        return {"messages": state['messages'] + [AIMessage(content="I apologize, but I encountered an error. Can we try again?")]}    
+        content = turn.failed(e, "stream_minion")
+        yield content if not chunks else f"\n\n{content}"
+        content = "".join(chunks) + (f"\n\n{content}" if chunks else content)
+    result.update(turn.update(content))
 
 import streamlit as st
 from langchain.schema import HumanMessage, AIMessage
@@ -167,6 +192,10 @@ st.sidebar.title("Project Minion Toolkit 🛠️")
 st.sidebar.subheader("Menu 📋")
 if st.sidebar.button("Clear Chat 🗑️"):
     st.session_state['messages'] = []
+    st.session_state['summary'] = ""
+    st.session_state['summarized'] = 0
+    st.session_state.pop('pending_answer', None)
+    st.session_state.pop('visible_messages', None)
 if st.sidebar.button("Run Diagnostics 🩺"):
     st.session_state['messages'].append(AIMessage(content="Running diagnostics on all Minions..."))
 if st.sidebar.button("View Logs 📜"):
@@ -188,37 +217,147 @@ st.sidebar.write(f"Selected tool: {selected_tool}")
 if 'messages' not in st.session_state:
     st.session_state['messages'] = []
 
+# Messages shown at first, and added by each "Show earlier messages" click; older turns are not rendered until asked for
+PAGE_SIZE = int(os.getenv("UI_PAGE_SIZE", 20))
+
+# Questions are answered on worker threads shared by every session, so the UI keeps responding while a minion is slow
+answer_executor = resources["answer_executor"]
+
+
+class PendingAnswer:
+    """A question being answered on a worker thread; reruns poll it and render what has streamed so far."""
+
+    def __init__(self, question: str, state: State):
+        self.question = question
+        self.state = state
+        self.request_id = request_id_from(None)
+        self.minion_name = ""
+        self.chunks: list[str] = []
+        self.result: dict = {}
+        self.started = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.future: Optional[Future] = None
+
+    @property
+    def text(self) -> str:
+        return "".join(self.chunks)
+
+
+# Runs on a worker thread: route the question and stream the minion's answer into `pending`.
+# Streamlit calls are not allowed here; the script thread does all the rendering.
+def answer_question(pending: PendingAnswer) -> None:
+    with log_context(request_id=pending.request_id):
+        run_answer(pending)
+
+def run_answer(pending: PendingAnswer) -> None:
+    state = pending.state
+    try:
+        selected_minion = minion_orchestrator(pending.question)
+        pending.minion_name = selected_minion.__name__.replace("_", " ")
+        bind_log_context(minion=pending.minion_name)
+        for token in streaming_minions[selected_minion](state, pending.result):
+            if pending.first_token_at is None:
+                pending.first_token_at = time.perf_counter()
+            pending.chunks.append(token)
+    except Exception as e:
+        logger.error(f"Error in orchestrator or minion: {str(e)}", exc_info=True)
+        pending.result = {"messages": state['messages'] + [AIMessage(content="An error occurred while processing your request.")]}
+    
+    total = time.perf_counter() - pending.started
+    logger.info(f"Time to first token: {(pending.first_token_at or time.perf_counter()) - pending.started:.3f}s, total: {total:.3f}s")
+
 # Function to handle sending queries
+# The answer is produced in the background and streamed below the history by the reruns that follow.
 def send_query():
     user_question = st.session_state.user_input
-    if user_question:
-        # Update state with user's question
-        st.session_state['messages'].append(HumanMessage(content=user_question))
-        
-        # Determine which minion should handle the query
-        try:
-            selected_minion = minion_orchestrator(user_question)
-            st.session_state['messages'] = selected_minion({"messages": st.session_state['messages']})['messages']
-        except Exception as e:
-            logger.error(f"Error in orchestrator or minion: {str(e)}", exc_info=True)
-            st.session_state['messages'].append(AIMessage(content="An error occurred while processing your request."))
-        
-        # Reset the input field
-        st.session_state.user_input = ""
-
-# Display conversation history in a chat-like format with enhanced UI
-for message in st.session_state['messages']:
-    if isinstance(message, HumanMessage):
-        st.markdown(f"<div style='background-color:#2a2a2a; padding:10px; border-radius:10px; margin-bottom:5px; color: #ffffff;'><strong>You:</strong> {message.content} 💬</div>", unsafe_allow_html=True)
-    elif isinstance(message, AIMessage):
-        st.markdown(f"<div style='background-color:#3a3a3a; padding:10px; border-radius:10px; margin-bottom:5px; color: #ffffff;'><strong>🤖 Minion AI:</strong> {message.content} 🤖</div>", unsafe_allow_html=True)
+    if not user_question:
+        return
+    if st.session_state.get('pending_answer') is not None:
+        st.toast("Still answering your last question; send this one when it is done.")
+        return
+    
+    # Update state with user's question
+    st.session_state['messages'].append(HumanMessage(content=user_question))
+    state = {
+        "messages": list(st.session_state['messages']),
+        "summary": st.session_state.get('summary', ""),
+        "summarized": st.session_state.get('summarized', 0),
+    }
+    pending = PendingAnswer(user_question, state)
+    pending.future = answer_executor.submit(answer_question, pending)
+    st.session_state['pending_answer'] = pending
+    
+    # Reset the input field
+    st.session_state.user_input = ""
+
+# Chat bubbles for each side of the conversation
+def human_message_html(content: str) -> str:
+    return f"<div style='background-color:#2a2a2a; padding:10px; border-radius:10px; margin-bottom:5px; color: #ffffff;'><strong>You:</strong> {content} 💬</div>"
+
+def ai_message_html(content: str) -> str:
+    return f"<div style='background-color:#3a3a3a; padding:10px; border-radius:10px; margin-bottom:5px; color: #ffffff;'><strong>🤖 Minion AI:</strong> {content} 🤖</div>"
+
+def render_ai_message(content: str, container=st):
+    container.markdown(ai_message_html(content), unsafe_allow_html=True)
+
+def show_earlier_messages():
+    st.session_state['visible_messages'] = st.session_state.get('visible_messages', PAGE_SIZE) + PAGE_SIZE
+
+# Display the latest page of the conversation as a single element; earlier turns stay collapsed until requested
+def render_history():
+    messages = st.session_state['messages']
+    visible = st.session_state.get('visible_messages', PAGE_SIZE)
+    hidden = max(0, len(messages) - visible)
+    if hidden:
+        st.button(f"Show earlier messages ({hidden} hidden) ⬆️", on_click=show_earlier_messages)
+    bubbles = []
+    for message in messages[hidden:]:
+        if isinstance(message, HumanMessage):
+            bubbles.append(human_message_html(message.content))
+        elif isinstance(message, AIMessage):
+            bubbles.append(ai_message_html(message.content))
+    if bubbles:
+        st.markdown("".join(bubbles), unsafe_allow_html=True)
+
+# Follow the answer being produced in the background: stream it into a placeholder with a progress line,
+# then move it into the conversation. A rerun in the middle (e.g. a click) picks the same answer up again.
+def render_pending_answer():
+    pending = st.session_state.get('pending_answer')
+    if pending is None:
+        return
+    placeholder = st.empty()
+    progress = st.empty()
+    shown = None
+    while not pending.future.done():
+        text = pending.text
+        if text != shown:
+            render_ai_message(text or "…", placeholder)
+            shown = text
+        progress.caption(f"⏳ {pending.minion_name or 'Choosing a minion'} is answering… {time.perf_counter() - pending.started:.1f}s")
+        time.sleep(0.05)
+    progress.empty()
+    
+    result = pending.result
+    st.session_state['messages'].extend(result['messages'][len(pending.state['messages']):])
+    st.session_state['summary'] = result.get('summary', pending.state['summary'])
+    st.session_state['summarized'] = result.get('summarized', pending.state['summarized'])
+    st.session_state.pop('pending_answer', None)
+    render_ai_message(st.session_state['messages'][-1].content, placeholder)
 
 # User input with an improved UI
 def user_input_widget():
     return st.text_input("Enter your query:", key="user_input", placeholder="Ask me anything... 💬", on_change=send_query)
 
-# Display the user input widget below the chat history
-user_input_widget()
+# The conversation and the input box form a fragment: sending a query or paging through history reruns
+# only this part of the page instead of the whole script
+@st.fragment
+def chat_panel():
+    render_history()
+    render_pending_answer()
+    # Display the user input widget below the chat history
+    user_input_widget()
+
+chat_panel()
 
 # Footer section with credits and helpful information
 st.sidebar.markdown("---")
@@ -0,0 +1,190 @@
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Callable, Optional
+
+from langchain.schema import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+logger = logging.getLogger(__name__)
+
+# Context window sizes of the models we route to
+MODEL_CONTEXT_TOKENS = {
+    "llama3-groq-70b-8192-tool-use-preview": 8192,
+}
+DEFAULT_CONTEXT_TOKENS = 8192
+
+# Tokens added per message for role markers and separators
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_tiktoken_encoding = None
+if os.getenv("TOKEN_COUNTER", "estimate").lower() == "tiktoken":
+    try:
+        import tiktoken
+        _tiktoken_encoding = tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"tiktoken unavailable, falling back to estimated token counts: {e}")
+
+# Token count of a piece of text; a ~4 chars/token estimate unless TOKEN_COUNTER=tiktoken
+@lru_cache(maxsize=16384)
+def count_tokens(text: str) -> int:
+    if _tiktoken_encoding is not None:
+        return len(_tiktoken_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+def message_tokens(message: BaseMessage) -> int:
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    return count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+# Tokens used by the fixed (non-placeholder) messages of a prompt template, e.g. the system prompt
+_prompt_overhead_cache: dict[int, int] = {}
+
+def prompt_overhead(prompt) -> int:
+    key = id(prompt)
+    if key not in _prompt_overhead_cache:
+        _prompt_overhead_cache[key] = sum(
+            message_tokens(message) for message in getattr(prompt, "messages", []) if isinstance(message, BaseMessage)
+        )
+    return _prompt_overhead_cache[key]
+
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s")
+
+# Default summarizer: append the gist of each folded message to the running summary.
+# It is extractive so folding never costs an extra upstream call.
+def extractive_summarizer(summary: str, messages: list[BaseMessage], max_chars: int = 200) -> str:
+    lines = summary.splitlines() if summary else []
+    for message in messages:
+        role = "User" if isinstance(message, HumanMessage) else "Assistant" if isinstance(message, AIMessage) else "Note"
+        text = " ".join(str(message.content).split())
+        gist = _SENTENCE_END_RE.split(text, maxsplit=1)[0]
+        if len(gist) > max_chars:
+            gist = gist[:max_chars - 3].rstrip() + "..."
+        if gist:
+            lines.append(f"- {role}: {gist}")
+    return "\n".join(lines)
+
+# Summarizer that asks a model to fold new messages into the existing summary
+def llm_summarizer(model) -> Callable[[str, list[BaseMessage]], str]:
+    def summarize(summary: str, messages: list[BaseMessage]) -> str:
+        transcript = "\n".join(f"{message.type}: {message.content}" for message in messages)
+        response = model.invoke([
+            SystemMessage(content="Update the running conversation summary with the new messages. Keep names, facts, preferences and open requests. Reply with the summary only."),
+            HumanMessage(content=f"Current summary:\n{summary or '(empty)'}\n\nNew messages:\n{transcript}"),
+        ])
+        return response.content.strip()
+    return summarize
+
+
+@dataclass
+class HistoryWindow:
+    chat_history: list[BaseMessage]  # what is sent to the model: summary message + recent turns
+    summary: str  # rolling summary of every message before `summarized`
+    summarized: int  # number of leading history messages folded into the summary
+    tokens_full: int  # tokens the unwindowed history would have cost
+    tokens_sent: int
+    folded: list[BaseMessage] = field(default_factory=list)
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.tokens_full - self.tokens_sent)
+
+    # Summary fields to merge into the graph state so the next turn continues from here
+    def state_update(self) -> dict:
+        return {"summary": self.summary, "summarized": self.summarized}
+
+
+class HistoryManager:
+    """Fits chat history into a per-model token budget, folding older turns into a rolling summary."""
+
+    def __init__(
+        self,
+        budgets: Optional[dict[str, int]] = None,
+        default_budget: int = 4096,
+        reserve_tokens: int = 1024,
+        keep_recent: int = 6,
+        summary_tokens: int = 512,
+        summarizer: Callable[[str, list[BaseMessage]], str] = extractive_summarizer,
+    ):
+        self.budgets = budgets or {}
+        self.default_budget = default_budget
+        self.reserve_tokens = reserve_tokens
+        self.keep_recent = keep_recent
+        self.summary_tokens = summary_tokens
+        self.summarizer = summarizer
+
+    # History budget for a model: the configured budget, capped by what the context window leaves over
+    def budget_for(self, model_name: str, fixed_tokens: int = 0) -> int:
+        context = MODEL_CONTEXT_TOKENS.get(model_name, DEFAULT_CONTEXT_TOKENS)
+        available = context - self.reserve_tokens - fixed_tokens
+        return max(0, min(self.budgets.get(model_name, self.default_budget), available))
+
+    def window(self, history: list[BaseMessage], model_name: str, summary: str = "", summarized: int = 0, fixed_tokens: int = 0) -> HistoryWindow:
+        summarized = min(max(summarized, 0), len(history))
+        if summarized == 0:
+            summary = ""
+        tokens_full = sum(message_tokens(message) for message in history)
+        budget = self.budget_for(model_name, fixed_tokens)
+
+        verbatim = history[summarized:]
+        verbatim_tokens = [message_tokens(message) for message in verbatim]
+        summary_cost = count_tokens(summary) + MESSAGE_OVERHEAD_TOKENS if summary else 0
+
+        folded = []
+        if summary_cost + sum(verbatim_tokens) > budget:
+            # Fold down to ~3/4 of the budget so the summary is not rewritten on every turn
+            summary_limit = min(self.summary_tokens, budget // 4)
+            target = budget * 3 // 4 - summary_limit
+            keep, kept_tokens = 0, 0
+            for tokens in reversed(verbatim_tokens):
+                if keep >= self.keep_recent and kept_tokens + tokens > target:
+                    break
+                keep += 1
+                kept_tokens += tokens
+            fold_count = len(verbatim) - keep
+            if fold_count > 0:
+                folded = verbatim[:fold_count]
+                summary = self._fit_summary(self.summarizer(summary, folded), summary_limit)
+                summarized += fold_count
+                verbatim = verbatim[fold_count:]
+                verbatim_tokens = verbatim_tokens[fold_count:]
+
+            # The most recent turns alone can still exceed a tight budget; drop from the oldest end
+            summary_cost = count_tokens(summary) + MESSAGE_OVERHEAD_TOKENS if summary else 0
+            while verbatim and summary_cost + sum(verbatim_tokens) > budget:
+                verbatim = verbatim[1:]
+                verbatim_tokens = verbatim_tokens[1:]
+
+        chat_history = list(verbatim)
+        if summary:
+            chat_history.insert(0, SystemMessage(content=f"Summary of the earlier conversation:\n{summary}"))
+        tokens_sent = sum(message_tokens(message) for message in chat_history)
+        return HistoryWindow(chat_history, summary, summarized, tokens_full, tokens_sent, folded)
+
+    # Window the history of a graph state for one model call
+    def for_turn(self, state: dict, model, prompt, human_input: str) -> HistoryWindow:
+        return self.window(
+            state["messages"][:-1],
+            getattr(model, "model_name", ""),
+            summary=state.get("summary", ""),
+            summarized=state.get("summarized", 0),
+            fixed_tokens=prompt_overhead(prompt) + count_tokens(human_input),
+        )
+
+    # Keep the rolling summary itself within its token allowance by dropping its oldest lines
+    def _fit_summary(self, summary: str, limit: int) -> str:
+        lines = summary.splitlines()
+        while len(lines) > 1 and count_tokens("\n".join(lines)) > limit:
+            lines.pop(0)
+        return "\n".join(lines)
+
+
+# Build the history manager described by the HISTORY_* environment variables
+def history_manager_from_env(**kwargs) -> HistoryManager:
+    return HistoryManager(
+        default_budget=int(os.getenv("HISTORY_TOKEN_BUDGET", 4096)),
+        keep_recent=int(os.getenv("HISTORY_KEEP_RECENT", 6)),
+        summary_tokens=int(os.getenv("HISTORY_SUMMARY_TOKENS", 512)),
+        **kwargs,
+    )
@@ -0,0 +1,294 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = "1"
+
+# Words found in more than this share of notes barely move BM25 scores but make a query scan most
+# of the index, so in vaults big enough for that to matter they are left out of queries that have
+# more selective words
+MAX_DOCUMENT_FREQUENCY = 0.5
+PRUNE_MIN_NOTES = 1000
+
+_TOKEN = re.compile(r"\w+")
+_TAG = re.compile(r"(?<![\w#&])#([^\W\d][\w/-]*)")
+_WIKILINK = re.compile(r"\[\[([^\]|#]+)(?:#[^\]|]*)?(?:\|[^\]]*)?\]\]")
+_FRONTMATTER_TAGS = re.compile(r"^tags:\s*\[?([^\]\n]*)\]?\s*$", re.MULTILINE)
+
+# Words too common to help ranking; leaving them out of queries keeps them fast
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do find for from how i in is it me my note notes of on or so that the this to "
+    "was what when where which who will with you your".split()
+)
+
+
+def query_terms(text: str) -> list[str]:
+    return list(dict.fromkeys(token for token in _TOKEN.findall(text.casefold()) if token not in _STOPWORDS))
+
+def extract_tags(text: str) -> set[str]:
+    tags = {tag.casefold() for tag in _TAG.findall(text)}
+    if text.startswith("---") and "\n---" in text[3:]:
+        frontmatter = text[3:text.find("\n---", 3)]
+        for match in _FRONTMATTER_TAGS.finditer(frontmatter):
+            tags.update(tag.strip(" '\"#").casefold() for tag in match.group(1).split(",") if tag.strip(" '\"#"))
+    return tags
+
+def extract_links(text: str) -> set[str]:
+    return {link.strip().casefold() for link in _WIKILINK.findall(text) if link.strip()}
+
+
+@dataclass
+class SearchResult:
+    title: str
+    score: float
+    snippet: str
+    tags: list[str] = field(default_factory=list)
+
+
+class NotesIndex:
+    """Full-text index over a vault of Markdown notes, persisted in a local SQLite file.
+
+    Search is BM25-ranked over an FTS5 inverted index (title matches weigh double), with tag and
+    backlink tables alongside. Notes are reindexed from file modification times, at most every
+    `refresh_interval` seconds and in the background, and right away through `update` when saved.
+    """
+
+    def __init__(
+        self,
+        vault_dir: str,
+        index_path: str,
+        refresh_interval: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.vault_dir = vault_dir
+        self._vault_root = os.path.realpath(vault_dir)
+        self.index_path = index_path
+        self.refresh_interval = refresh_interval
+        self._clock = clock
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._ready = False
+        self._ready_lock = threading.Lock()
+        self._refreshed_at = 0.0
+        self._refreshing = False
+        self._last_refresh_seconds = 0.0
+        self._last_refresh_changes = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.index_path)), exist_ok=True)
+            conn = sqlite3.connect(self.index_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self) -> None:
+        with self._connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            meta = dict(conn.execute("SELECT key, value FROM meta"))
+            expected = {"version": INDEX_VERSION, "vault_dir": os.path.abspath(self.vault_dir)}
+            if meta and meta != expected:
+                logger.info("Notes index on disk is for another vault or version; rebuilding it.")
+                for table in ("notes", "notes_vocab", "notes_fts", "tags", "links"):
+                    conn.execute(f"DROP TABLE IF EXISTS {table}")
+            conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", expected.items())
+            conn.execute("CREATE TABLE IF NOT EXISTS notes (id INTEGER PRIMARY KEY, title TEXT UNIQUE NOT NULL, mtime REAL NOT NULL, size INTEGER NOT NULL)")
+            conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(title, body)")
+            conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS notes_vocab USING fts5vocab(notes_fts, 'row')")
+            conn.execute("CREATE TABLE IF NOT EXISTS tags (tag TEXT NOT NULL, note_id INTEGER NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS tags_tag ON tags (tag)")
+            conn.execute("CREATE INDEX IF NOT EXISTS tags_note ON tags (note_id)")
+            conn.execute("CREATE TABLE IF NOT EXISTS links (target TEXT NOT NULL, note_id INTEGER NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS links_target ON links (target)")
+            conn.execute("CREATE INDEX IF NOT EXISTS links_note ON links (note_id)")
+
+    # On first use, answer from the persisted index and bring it up to date in the background
+    # (or build it now when it is empty); afterwards refresh in the background every refresh_interval
+    def _ensure_ready(self) -> None:
+        if not self._ready:
+            with self._ready_lock:
+                if not self._ready:
+                    self._create_schema()
+                    if self._connection().execute("SELECT 1 FROM notes LIMIT 1").fetchone() is None:
+                        self.refresh()
+                    self._ready = True
+        if not self._refreshing and self._clock() - self._refreshed_at >= self.refresh_interval:
+            with self._ready_lock:
+                if self._refreshing:
+                    return
+                self._refreshing = True
+            threading.Thread(target=self._background_refresh, name="notes-refresh", daemon=True).start()
+
+    def _background_refresh(self) -> None:
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.error(f"\033[91mNotes index refresh failed: {e}\033[0m", exc_info=True)
+        finally:
+            self._refreshing = False
+
+    # File of a note. Titles may name subfolders ("projects/alpha"), but a title that is absolute, has empty, "." or
+    # ".." parts, or otherwise resolves outside the vault raises ValueError.
+    def path_for(self, title: str) -> str:
+        parts = title.split("/")
+        if not title or "\\" in title or "\0" in title or os.path.isabs(title) or any(part in ("", ".", "..") for part in parts):
+            raise ValueError(f"Invalid note title: {title!r}")
+        path = os.path.join(self.vault_dir, *parts[:-1], f"{parts[-1]}.md")
+        if os.path.commonpath([self._vault_root, os.path.realpath(path)]) != self._vault_root:
+            raise ValueError(f"Note {title!r} is outside the vault")
+        return path
+
+    # Modification time and size of every note in the vault, keyed by title (its path without .md)
+    def _scan(self) -> dict[str, tuple[float, int]]:
+        found = {}
+        pending = [self.vault_dir]
+        while pending:
+            directory = pending.pop()
+            try:
+                entries = list(os.scandir(directory))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif entry.name.endswith(".md"):
+                    stat = entry.stat()
+                    title = os.path.relpath(entry.path, self.vault_dir)[:-3].replace(os.sep, "/")
+                    found[title] = (stat.st_mtime, stat.st_size)
+        return found
+
+    # Reindex notes whose file changed since they were indexed, and drop notes whose file is gone
+    def refresh(self) -> None:
+        started = time.perf_counter()
+        found = self._scan()
+        with self._write_lock, self._connection() as conn:
+            indexed = {title: (note_id, mtime, size) for note_id, title, mtime, size in conn.execute("SELECT id, title, mtime, size FROM notes")}
+            changes = 0
+            for title, (note_id, _, _) in indexed.items():
+                if title not in found:
+                    self._remove(conn, note_id)
+                    changes += 1
+            for title, (mtime, size) in found.items():
+                note = indexed.get(title)
+                if note is None or note[1] != mtime or note[2] != size:
+                    self._reindex(conn, title)
+                    changes += 1
+        self._refreshed_at = self._clock()
+        self._last_refresh_seconds = time.perf_counter() - started
+        self._last_refresh_changes = changes
+        if changes:
+            logger.info(f"Notes index refreshed: {changes} notes reindexed in {self._last_refresh_seconds:.3f}s.")
+
+    # Reindex one note right after it was written (or deleted)
+    def update(self, title: str) -> None:
+        if not self._ready:
+            return  # the first query brings the whole vault up to date anyway
+        with self._write_lock, self._connection() as conn:
+            self._reindex(conn, title)
+
+    def _reindex(self, conn: sqlite3.Connection, title: str) -> None:
+        row = conn.execute("SELECT id FROM notes WHERE title = ?", (title,)).fetchone()
+        if row is not None:
+            self._remove(conn, row[0])
+        try:
+            path = self.path_for(title)
+            stat = os.stat(path)
+            with open(path, encoding="utf-8", errors="replace") as f:
+                text = f.read()
+        except (FileNotFoundError, ValueError):
+            return
+        note_id = conn.execute("INSERT INTO notes (title, mtime, size) VALUES (?, ?, ?)", (title, stat.st_mtime, stat.st_size)).lastrowid
+        conn.execute("INSERT INTO notes_fts (rowid, title, body) VALUES (?, ?, ?)", (note_id, title.replace("/", " "), text))
+        conn.executemany("INSERT INTO tags (tag, note_id) VALUES (?, ?)", [(tag, note_id) for tag in extract_tags(text)])
+        conn.executemany("INSERT INTO links (target, note_id) VALUES (?, ?)", [(link, note_id) for link in extract_links(text)])
+
+    @staticmethod
+    def _remove(conn: sqlite3.Connection, note_id: int) -> None:
+        conn.execute("DELETE FROM notes WHERE id = ?", (note_id,))
+        conn.execute("DELETE FROM notes_fts WHERE rowid = ?", (note_id,))
+        conn.execute("DELETE FROM tags WHERE note_id = ?", (note_id,))
+        conn.execute("DELETE FROM links WHERE note_id = ?", (note_id,))
+
+    # The k notes that best match any of the query's words, each with a snippet around the matches
+    def search(self, query: str, k: int = 5) -> list[SearchResult]:
+        terms = query_terms(query)
+        if not terms:
+            return []
+        self._ensure_ready()
+        conn = self._connection()
+        total = conn.execute("SELECT COUNT(*) FROM notes").fetchone()[0]
+        frequencies = dict(conn.execute(f"SELECT term, doc FROM notes_vocab WHERE term IN ({','.join('?' * len(terms))})", terms))
+        limit = MAX_DOCUMENT_FREQUENCY * total if total >= PRUNE_MIN_NOTES else total
+        selective = [term for term in terms if frequencies.get(term, 0) <= limit]
+        match = " OR ".join(f'"{term}"' for term in selective or [min(terms, key=lambda term: frequencies.get(term, 0))])
+
+        ranked = conn.execute(
+            "SELECT rowid, bm25(notes_fts, 2.0, 1.0) AS rank FROM notes_fts WHERE notes_fts MATCH ? ORDER BY rank LIMIT ?",
+            (match, k),
+        ).fetchall()
+        if not ranked:
+            return []
+        # Snippets and tags only for the notes that made the cut
+        details = {
+            note_id: (title, snippet, tags)
+            for note_id, title, snippet, tags in conn.execute(
+                "SELECT notes.id, notes.title, snippet(notes_fts, 1, '', '', '…', 32), "
+                "(SELECT group_concat(tag, ',') FROM tags WHERE tags.note_id = notes.id) "
+                f"FROM notes_fts JOIN notes ON notes.id = notes_fts.rowid WHERE notes_fts MATCH ? AND notes_fts.rowid IN ({','.join('?' * len(ranked))})",
+                (match, *(note_id for note_id, _ in ranked)),
+            )
+        }
+        results = []
+        for note_id, rank in ranked:
+            if note_id in details:
+                title, snippet, tags = details[note_id]
+                results.append(SearchResult(title, round(-rank, 4), " ".join(snippet.split()), sorted(tags.split(",")) if tags else []))
+        return results
+
+    def tagged(self, tag: str) -> list[str]:
+        self._ensure_ready()
+        rows = self._connection().execute(
+            "SELECT notes.title FROM tags JOIN notes ON notes.id = tags.note_id WHERE tags.tag = ? ORDER BY notes.title",
+            (tag.lstrip("#").casefold(),),
+        )
+        return [row[0] for row in rows]
+
+    def backlinks(self, title: str) -> list[str]:
+        self._ensure_ready()
+        rows = self._connection().execute(
+            "SELECT DISTINCT notes.title FROM links JOIN notes ON notes.id = links.note_id WHERE links.target = ? ORDER BY notes.title",
+            (title.casefold(),),
+        )
+        return [row[0] for row in rows]
+
+    def stats(self) -> dict:
+        stats = {
+            "ready": self._ready,
+            "index_path": self.index_path,
+            "last_refresh_seconds": round(self._last_refresh_seconds, 4),
+            "last_refresh_changes": self._last_refresh_changes,
+        }
+        if self._ready:
+            conn = self._connection()
+            stats["notes"] = conn.execute("SELECT COUNT(*) FROM notes").fetchone()[0]
+            stats["tags"] = conn.execute("SELECT COUNT(DISTINCT tag) FROM tags").fetchone()[0]
+        return stats
+
+
+def notes_index_from_env(vault_dir: str) -> NotesIndex:
+    return NotesIndex(
+        vault_dir,
+        index_path=os.getenv("NOTES_INDEX_PATH", os.path.join(vault_dir, ".notes_index.db")),
+        refresh_interval=float(os.getenv("NOTES_REFRESH_INTERVAL", 30)),
+    )
@@ -0,0 +1,21 @@
+from typing import Sequence
+
+from langchain.schema import BaseMessage, HumanMessage, SystemMessage
+
+
+class ChatPrompt:
+    """A system prompt compiled once into the message every call starts with.
+
+    Calls get a list of messages rather than one formatted string: the same system message object,
+    the chat history messages as they are, then the question. Nothing is re-rendered per turn, the
+    model sees each message with its own role, and the prefix stays byte-identical from turn to
+    turn, so provider-side prompt caching can reuse it.
+    """
+
+    def __init__(self, system: str):
+        self.system_message = SystemMessage(content=system)
+        self.messages = (self.system_message,)  # fixed messages, counted by prompt_overhead
+
+    # Messages for one model call. The list is new, the messages in it are not: only the question is built here.
+    def messages_for(self, chat_history: Sequence[BaseMessage], human_input: str) -> list[BaseMessage]:
+        return [self.system_message, *chat_history, HumanMessage(content=human_input)]
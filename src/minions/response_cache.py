@@ -0,0 +1,179 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional
+
+from langchain.schema import BaseMessage
+
+from orchestrator.routing_cache import normalize_question
+from orchestrator.similarity import VectorIndex
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedResponse:
+    content: str
+    latency: float  # seconds the upstream call took when the answer was produced
+    expires_at: float
+
+
+@dataclass
+class CacheHit:
+    content: str
+    match: str  # "exact" or "similar"
+    score: float
+    latency_saved: float
+
+
+class ResponseCache:
+    """Per-minion cache of answers: exact hits on the normalized question, then a similarity tier for near-duplicates.
+
+    Entries are also keyed on a digest of the last `history_turns` messages, so an answer is only
+    reused in the same conversational context (0 keys on the question alone).
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        maxsize: int = 256,
+        ttl: float = 3600.0,
+        similarity_threshold: float = 0.9,
+        history_turns: int = 2,
+        disabled_minions: Iterable[str] = (),
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.enabled = enabled
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.history_turns = history_turns
+        self.disabled_minions = set(disabled_minions)
+        self._clock = clock
+        self._entries: dict[str, OrderedDict[tuple[str, str], CachedResponse]] = {}
+        self._indexes: dict[str, VectorIndex] = {}
+        self._stats: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def enabled_for(self, minion: str) -> bool:
+        return self.enabled and self.maxsize > 0 and minion not in self.disabled_minions
+
+    def set_enabled(self, minion: str, enabled: bool) -> None:
+        if enabled:
+            self.disabled_minions.discard(minion)
+        else:
+            self.disabled_minions.add(minion)
+
+    def _history_digest(self, history: list[BaseMessage]) -> str:
+        if self.history_turns <= 0:
+            return ""
+        recent = history[-self.history_turns:]
+        digest = hashlib.sha1()
+        for message in recent:
+            digest.update(f"{message.type}\0{message.content}\0".encode())
+        return digest.hexdigest()
+
+    def _minion_stats(self, minion: str) -> dict:
+        stats = self._stats.get(minion)
+        if stats is None:
+            stats = self._stats[minion] = {"exact_hits": 0, "similar_hits": 0, "misses": 0, "evictions": 0, "latency_saved": 0.0}
+        return stats
+
+    def _remove(self, minion: str, key: tuple[str, str]) -> None:
+        del self._entries[minion][key]
+        self._indexes[minion].discard(key)
+
+    # Cached answer for a question, or None; `history` is the conversation before the question
+    def get(self, minion: str, question: str, history: list[BaseMessage] = ()) -> Optional[CacheHit]:
+        if not self.enabled_for(minion):
+            return None
+        started = time.perf_counter()
+        key = (self._history_digest(list(history)), normalize_question(question))
+        now = self._clock()
+        with self._lock:
+            stats = self._minion_stats(minion)
+            entries = self._entries.get(minion)
+            if not entries:
+                stats["misses"] += 1
+                return None
+
+            match, score, found = "exact", 1.0, entries.get(key)
+            if found is None:
+                # Near-duplicates: best similar question asked in the same conversational context
+                for label, label_score in self._indexes[minion].query(key[1]):
+                    if label_score < self.similarity_threshold:
+                        break
+                    if label[0] == key[0]:
+                        match, score, key, found = "similar", label_score, label, entries[label]
+                        break
+
+            if found is not None and found.expires_at <= now:
+                self._remove(minion, key)
+                found = None
+            if found is None:
+                stats["misses"] += 1
+                return None
+
+            entries.move_to_end(key)
+            saved = max(0.0, found.latency - (time.perf_counter() - started))
+            stats["exact_hits" if match == "exact" else "similar_hits"] += 1
+            stats["latency_saved"] += saved
+            return CacheHit(found.content, match, round(score, 4), saved)
+
+    def put(self, minion: str, question: str, content: str, latency: float, history: list[BaseMessage] = ()) -> None:
+        if not self.enabled_for(minion):
+            return
+        key = (self._history_digest(list(history)), normalize_question(question))
+        with self._lock:
+            entries = self._entries.setdefault(minion, OrderedDict())
+            index = self._indexes.setdefault(minion, VectorIndex())
+            if key not in entries:
+                index.add(key[1], key)
+            entries[key] = CachedResponse(content, latency, self._clock() + self.ttl)
+            entries.move_to_end(key)
+            while len(entries) > self.maxsize:
+                oldest = next(iter(entries))
+                self._remove(minion, oldest)
+                self._minion_stats(minion)["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._indexes.clear()
+
+    # Hit rate and latency saved per minion
+    def stats(self) -> dict:
+        with self._lock:
+            minions = {}
+            for minion, stats in self._stats.items():
+                hits = stats["exact_hits"] + stats["similar_hits"]
+                lookups = hits + stats["misses"]
+                minions[minion] = {
+                    **stats,
+                    "size": len(self._entries.get(minion, ())),
+                    "hit_ratio": hits / lookups if lookups else 0.0,
+                    "latency_saved": round(stats["latency_saved"], 3),
+                }
+            return {
+                "enabled": self.enabled,
+                "disabled_minions": sorted(self.disabled_minions),
+                "minions": minions,
+            }
+
+
+# Build the response cache described by the RESPONSE_CACHE_* environment variables.
+# Minions with side effects should be passed as disabled_minions.
+def response_cache_from_env(disabled_minions: Iterable[str] = ()) -> ResponseCache:
+    extra = [name.strip() for name in os.getenv("RESPONSE_CACHE_DISABLED_MINIONS", "").split(",") if name.strip()]
+    return ResponseCache(
+        enabled=os.getenv("RESPONSE_CACHE", "0") == "1",
+        maxsize=int(os.getenv("RESPONSE_CACHE_SIZE", 256)),
+        ttl=float(os.getenv("RESPONSE_CACHE_TTL", 3600)),
+        similarity_threshold=float(os.getenv("RESPONSE_CACHE_SIMILARITY", 0.9)),
+        history_turns=int(os.getenv("RESPONSE_CACHE_HISTORY_TURNS", 2)),
+        disabled_minions=[*disabled_minions, *extra],
+    )
@@ -0,0 +1,116 @@
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+from typing import Iterator, Optional
+
+from langchain.schema import AIMessage, BaseMessage, HumanMessage
+from langsmith import trace
+
+from config.gateway import RateLimitExceeded
+from config.resilience import ModelUnavailable
+from orchestrator.logs import clip
+
+from .history import HistoryManager, HistoryWindow
+from .prompts import ChatPrompt
+from .response_cache import CacheHit, ResponseCache
+
+logger = logging.getLogger(__name__)
+
+EMPTY_REPLY = "I'm sorry, I couldn't generate a response. Could you try asking something else?"
+
+# What the user sees when a minion's model call fails; a full rate limit queue and an unreachable model are told apart
+def error_reply(error: Exception) -> str:
+    if isinstance(error, RateLimitExceeded):
+        return "I'm handling a lot of questions right now. Please try again in a minute."
+    if isinstance(error, ModelUnavailable):
+        return "I can't reach my language model right now, so I can't answer that properly. Please try again in a little while."
+    return "I apologize, but I encountered an error. Can we try again?"
+
+
+class MinionTurns:
+    """The history manager, response cache and model call metrics that a module's minion agents share.
+
+    `label` follows the minion's name in log lines ("[cat minion agent]"); `model_seconds` and
+    `trace_name`, when given, time and trace each model call.
+    """
+
+    def __init__(self, history_manager: HistoryManager, response_cache: ResponseCache, model_seconds=None,
+                 trace_name: Optional[str] = None, label: str = "agent"):
+        self.history_manager = history_manager
+        self.response_cache = response_cache
+        self.model_seconds = model_seconds
+        self.trace_name = trace_name
+        self.label = label
+
+    def begin(self, state: dict, model, prompt: ChatPrompt, name: str, context: str = "") -> "MinionTurn":
+        return MinionTurn(self, state, model, prompt, name, context)
+
+
+class MinionTurn:
+    """One minion's answer to the last message: everything around the model call, whichever way it is made.
+
+    Before the call: the question, a response cache lookup and the windowed history. After it: logging,
+    a fallback for an empty answer or an error, caching the answer and the graph state update. Context
+    (e.g. retrieved notes) is sent to the model after the question but is not part of the cache key.
+    """
+
+    def __init__(self, turns: MinionTurns, state: dict, model, prompt: ChatPrompt, name: str, context: str = ""):
+        self.turns = turns
+        self.state = state
+        self.model = model
+        self.prompt = prompt
+        self.name = name
+        messages = state['messages']
+        self.human_input = messages[-1].content if isinstance(messages[-1], HumanMessage) else ""
+        self.context = context
+        self.tag = f"[{name} {turns.label}]" if turns.label else f"[{name}]"
+        self.window: Optional[HistoryWindow] = None
+        self.started = time.perf_counter()
+        logger.info(f"\033[94m{self.tag} Received input: {clip(self.human_input)}\033[0m")
+
+    # The answer this minion gave to the same question in the same context, if the response cache has it
+    def cached(self) -> Optional[CacheHit]:
+        hit = self.turns.response_cache.get(self.name, self.human_input, self.state['messages'][:-1])
+        if hit is not None:
+            logger.info(f"\033[96m{self.tag} Cached response ({hit.match} match, {hit.score:.2f}); saved {hit.latency_saved:.2f}s\033[0m")
+        return hit
+
+    # The model's input: the prompt, the history fitted into the model's token budget and the question
+    def model_input(self) -> list[BaseMessage]:
+        question = f"{self.human_input}\n\n{self.context}" if self.context else self.human_input
+        self.window = window = self.turns.history_manager.for_turn(self.state, self.model, self.prompt, question)
+        logger.info(f"{self.tag} History: {window.tokens_sent}/{window.tokens_full} tokens sent ({window.tokens_saved} saved, {window.summarized} messages summarized)")
+        return self.prompt.messages_for(window.chat_history, question)
+
+    # Wraps the model call; the time it takes is what a cached answer saves
+    @contextmanager
+    def timed(self) -> Iterator[None]:
+        with ExitStack() as stack:
+            if self.turns.trace_name:
+                stack.enter_context(trace(self.turns.trace_name))
+            if self.turns.model_seconds is not None:
+                stack.enter_context(self.turns.model_seconds.time(minion=self.name))
+            self.started = time.perf_counter()
+            yield
+
+    # The reply for the model's answer, which is cached unless it is empty
+    def answered(self, content: str, cache: bool = True) -> str:
+        logger.info(f"\033[92m{self.tag} Response: {clip(content)}\033[0m")
+        if not content.strip():
+            logger.warning(f"\033[93m{self.tag} Empty response from the model\033[0m")
+            return EMPTY_REPLY
+        if cache:
+            self.turns.response_cache.put(self.name, self.human_input, content, time.perf_counter() - self.started, self.state['messages'][:-1])
+        return content
+
+    # The reply when the model call fails; `function` names the agent function in the log
+    def failed(self, error: Exception, function: str) -> str:
+        logger.error(f"\033[91m{self.tag} Error in {function} function: {str(error)}\033[0m", exc_info=not isinstance(error, ModelUnavailable))
+        return error_reply(error)
+
+    # The graph state update that adds `content` as the minion's reply
+    def update(self, content: str) -> dict:
+        update = {"messages": self.state['messages'] + [AIMessage(content=content)]}
+        if self.window is not None:
+            update.update(self.window.state_update())
+        return update
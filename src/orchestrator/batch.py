@@ -0,0 +1,156 @@
+import asyncio
+import contextvars
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from .routing_cache import normalize_question
+from .sessions import resolve_session_id
+
+logger = logging.getLogger(__name__)
+
+
+# Validate a batch request body: {"items": [{"userquestion": ..., "session_id": ...}, ...]}.
+# Returns the items (malformed ones carry an "error") or an error message for the whole batch.
+def parse_batch_items(data: Any, max_items: int) -> tuple[list[dict], Optional[str]]:
+    raw_items = data.get("items") if isinstance(data, dict) else None
+    if not isinstance(raw_items, list):
+        return [], "Request body must be a JSON object with an 'items' list."
+    if len(raw_items) > max_items:
+        return [], f"A batch may contain at most {max_items} items."
+
+    items = []
+    for index, raw in enumerate(raw_items):
+        if not isinstance(raw, dict) or not isinstance(raw.get("userquestion"), str):
+            items.append({"index": index, "error": "Each item needs a 'userquestion' string."})
+            continue
+        session_id, _ = resolve_session_id(raw.get("session_id"), None)
+        items.append({"index": index, "session_id": session_id, "question": raw["userquestion"]})
+    return items, None
+
+# Items that share a session run one after another in request order; other sessions run in parallel.
+# Chains are ordered by the route of their first item so each minion's work is dispatched together.
+def _session_chains(items: list[dict], routes: dict[str, Any], route_name: Callable[[Any], str]) -> list[list[dict]]:
+    chains: OrderedDict[str, list[dict]] = OrderedDict()
+    for item in items:
+        chains.setdefault(item["session_id"], []).append(item)
+    return sorted(chains.values(), key=lambda chain: route_name(routes[normalize_question(chain[0]["question"])]))
+
+def _group_counts(items: list[dict], routes: dict[str, Any], route_name: Callable[[Any], str]) -> dict[str, int]:
+    groups: dict[str, int] = {}
+    for item in items:
+        name = route_name(routes[normalize_question(item["question"])])
+        groups[name] = groups.get(name, 0) + 1
+    return groups
+
+def _error_result(item: dict, message: str) -> dict:
+    result = {"index": item["index"], "error": message}
+    if "session_id" in item:
+        result["session_id"] = item["session_id"]
+    return result
+
+
+class _RouteFailed:
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+# Answer a batch on a bounded thread pool: each distinct question is routed once, then every session's
+# items are answered in order. Returns per-item results in request order and the item count per route.
+def run_batch(
+    items: list[dict],
+    route: Callable[[str], Hashable],
+    answer: Callable[[dict, Hashable], str],
+    route_name: Callable[[Hashable], str],
+    max_workers: int = 8,
+) -> tuple[list[dict], dict[str, int]]:
+    results: list[Optional[dict]] = [None] * len(items)
+    valid = []
+    for item in items:
+        if "error" in item:
+            results[item["index"]] = _error_result(item, item["error"])
+        else:
+            valid.append(item)
+
+    def route_safely(question: str):
+        try:
+            return route(question)
+        except Exception as e:
+            logger.error(f"\033[91mError routing batch item: {str(e)}\033[0m", exc_info=True)
+            return _RouteFailed(e)
+
+    def name_of(decision) -> str:
+        return "unrouted" if isinstance(decision, _RouteFailed) else route_name(decision)
+
+    def run_chain(chain: list[dict]) -> None:
+        for item in chain:
+            decision = routes[normalize_question(item["question"])]
+            if isinstance(decision, _RouteFailed):
+                results[item["index"]] = _error_result(item, "Could not route this question.")
+                continue
+            try:
+                response = answer(item, decision)
+                results[item["index"]] = {"index": item["index"], "session_id": item["session_id"], "response": response}
+            except Exception as e:
+                logger.error(f"\033[91mError answering batch item {item['index']}: {str(e)}\033[0m", exc_info=True)
+                results[item["index"]] = _error_result(item, "An error occurred while processing this item.")
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="batch") as pool:
+        # Each task runs in its own copy of the caller's context so tracing spans nest under the request
+        unique = {normalize_question(item["question"]): item["question"] for item in valid}
+        futures = {key: pool.submit(contextvars.copy_context().run, route_safely, question) for key, question in unique.items()}
+        routes = {key: future.result() for key, future in futures.items()}
+        chains = _session_chains(valid, routes, name_of)
+        for future in [pool.submit(contextvars.copy_context().run, run_chain, chain) for chain in chains]:
+            future.result()
+
+    return results, _group_counts(valid, routes, name_of)
+
+# Async variant of run_batch for the ASGI server; concurrency is bounded by a semaphore
+async def arun_batch(
+    items: list[dict],
+    aroute: Callable[[str], Awaitable[Hashable]],
+    aanswer: Callable[[dict, Hashable], Awaitable[str]],
+    route_name: Callable[[Hashable], str],
+    max_concurrency: int = 8,
+) -> tuple[list[dict], dict[str, int]]:
+    results: list[Optional[dict]] = [None] * len(items)
+    valid = []
+    for item in items:
+        if "error" in item:
+            results[item["index"]] = _error_result(item, item["error"])
+        else:
+            valid.append(item)
+    slots = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def route_safely(question: str):
+        async with slots:
+            try:
+                return await aroute(question)
+            except Exception as e:
+                logger.error(f"\033[91mError routing batch item: {str(e)}\033[0m", exc_info=True)
+                return _RouteFailed(e)
+
+    def name_of(decision) -> str:
+        return "unrouted" if isinstance(decision, _RouteFailed) else route_name(decision)
+
+    async def run_chain(chain: list[dict]) -> None:
+        for item in chain:
+            decision = routes[normalize_question(item["question"])]
+            if isinstance(decision, _RouteFailed):
+                results[item["index"]] = _error_result(item, "Could not route this question.")
+                continue
+            async with slots:
+                try:
+                    response = await aanswer(item, decision)
+                    results[item["index"]] = {"index": item["index"], "session_id": item["session_id"], "response": response}
+                except Exception as e:
+                    logger.error(f"\033[91mError answering batch item {item['index']}: {str(e)}\033[0m", exc_info=True)
+                    results[item["index"]] = _error_result(item, "An error occurred while processing this item.")
+
+    unique = {normalize_question(item["question"]): item["question"] for item in valid}
+    decisions = await asyncio.gather(*(route_safely(question) for question in unique.values()))
+    routes = dict(zip(unique.keys(), decisions))
+    await asyncio.gather(*(run_chain(chain) for chain in _session_chains(valid, routes, name_of)))
+    return results, _group_counts(valid, routes, name_of)
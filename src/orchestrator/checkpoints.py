@@ -0,0 +1,614 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Iterable, Iterator, List, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    copy_checkpoint,
+    empty_checkpoint,
+    get_checkpoint_id,
+)
+from langgraph.checkpoint.serde.types import TASKS
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS threads ("
+    " thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL DEFAULT '',"
+    " checkpoint_id TEXT, parent_id TEXT, first_seq INTEGER NOT NULL, next_seq INTEGER NOT NULL,"
+    " has_messages INTEGER NOT NULL, checkpoint_type TEXT, checkpoint BLOB, metadata_type TEXT, metadata BLOB,"
+    " touched_at REAL NOT NULL, PRIMARY KEY (thread_id, checkpoint_ns))",
+    "CREATE INDEX IF NOT EXISTS threads_touched_at ON threads (touched_at)",
+    "CREATE TABLE IF NOT EXISTS channels ("
+    " thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, channel TEXT NOT NULL, type TEXT, payload BLOB,"
+    " PRIMARY KEY (thread_id, checkpoint_ns, channel)) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS messages ("
+    " thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, seq INTEGER NOT NULL,"
+    " message_key TEXT NOT NULL, type TEXT NOT NULL, payload BLOB NOT NULL,"
+    " PRIMARY KEY (thread_id, checkpoint_ns, seq)) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS writes ("
+    " thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL,"
+    " task_id TEXT NOT NULL, idx INTEGER NOT NULL, channel TEXT NOT NULL, type TEXT, payload BLOB,"
+    " PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx))",
+)
+
+
+# Messages are matched by id; the few without one (e.g. built outside the graph) by type and content
+def message_key(message: Any) -> str:
+    message_id = getattr(message, "id", None)
+    if message_id:
+        return message_id
+    content = f"{getattr(message, 'type', '')}\0{getattr(message, 'content', message)}"
+    return "sha1:" + hashlib.sha1(content.encode()).hexdigest()
+
+
+class _CachedThread:
+    """A thread's decoded messages, valid while the stored sequence range still matches."""
+
+    __slots__ = ("first_seq", "next_seq", "messages", "keys")
+
+    def __init__(self, first_seq: int, next_seq: int, messages: list, keys: list[str]):
+        self.first_seq = first_seq
+        self.next_seq = next_seq
+        self.messages = messages
+        self.keys = keys
+
+
+class SQLiteDeltaSaver(BaseCheckpointSaver):
+    """LangGraph checkpointer that keeps each thread's latest state in a local SQLite file.
+
+    Messages are append-only rows: a turn writes only the messages it added, the other channels whose
+    version changed, and one small row with LangGraph's bookkeeping. Trimming old messages advances
+    the thread's first row and deletes the rows before it. Only the latest checkpoint of a thread is
+    kept, so there is no time travel. Messages are treated as immutable once stored, which holds for
+    add_messages state that only appends and removes.
+
+    Recently used threads keep their decoded messages in memory, so resuming one decodes only the
+    rows written since, including rows written by another process. Use ":memory:" for a
+    process-local store.
+    """
+
+    def __init__(self, path: str = "sessions.db", messages_channel: str = "messages", cache_threads: int = 1000, *, serde=None):
+        super().__init__(serde=serde)
+        self.path = path
+        self.messages_channel = messages_channel
+        self.cache_threads = cache_threads
+        self._local = threading.local()
+        self._shared: Optional[sqlite3.Connection] = None
+        self._shared_lock = threading.RLock()
+        if path == ":memory:":
+            self._shared = sqlite3.connect(":memory:", check_same_thread=False)
+        self._cache: OrderedDict[tuple[str, str], _CachedThread] = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._stats = {"puts": 0, "messages_written": 0, "bytes_written": 0, "rewrites": 0, "loads": 0, "messages_decoded": 0}
+        with self._db() as conn:
+            for statement in _SCHEMA:
+                conn.execute(statement)
+
+    # One connection per thread for a file (WAL lets readers and a writer overlap); a single locked
+    # connection for ":memory:", where each connection would otherwise get its own database. A write
+    # takes the file's write lock up front, so writers in other processes (e.g. the workers of a
+    # pre-fork server) cannot interleave between its reads and writes.
+    @contextmanager
+    def _db(self, write: bool = False) -> Iterator[sqlite3.Connection]:
+        if self._shared is not None:
+            with self._shared_lock, self._shared:
+                yield self._shared
+            return
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        with conn:
+            if write:
+                conn.execute("BEGIN IMMEDIATE")
+            yield conn
+
+    def _count(self, **amounts: int) -> None:
+        with self._cache_lock:
+            for name, amount in amounts.items():
+                self._stats[name] += amount
+
+    def _cached(self, key: tuple[str, str]) -> Optional[_CachedThread]:
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+            return cached
+
+    def _remember(self, key: tuple[str, str], cached: Optional[_CachedThread]) -> None:
+        with self._cache_lock:
+            if cached is None:
+                self._cache.pop(key, None)
+                return
+            self._cache[key] = cached
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_threads:
+                self._cache.popitem(last=False)
+
+    # The thread's stored messages, decoding only rows that are not cached yet
+    def _load_messages(self, conn: sqlite3.Connection, key: tuple[str, str], first_seq: int, next_seq: int) -> _CachedThread:
+        cached = self._cached(key)
+        if cached is not None and cached.first_seq <= first_seq and first_seq <= cached.next_seq <= next_seq:
+            drop = first_seq - cached.first_seq
+            messages, keys = cached.messages[drop:], cached.keys[drop:]
+            start = cached.next_seq
+        else:
+            messages, keys, start = [], [], first_seq
+        if start < next_seq:
+            rows = conn.execute(
+                "SELECT message_key, type, payload FROM messages WHERE thread_id = ? AND checkpoint_ns = ? AND seq >= ? AND seq < ? ORDER BY seq",
+                (*key, start, next_seq),
+            ).fetchall()
+            for stored_key, type_, payload in rows:
+                messages.append(self.serde.loads_typed((type_, payload)))
+                keys.append(stored_key)
+            self._count(messages_decoded=len(rows))
+        loaded = _CachedThread(first_seq, next_seq, messages, keys)
+        self._remember(key, loaded)
+        return loaded
+
+    # Write what changed between the stored messages and `messages`: new rows at the end, and deleted
+    # rows at the start when older messages were trimmed. Anything else rewrites the thread's messages.
+    def _store_messages(self, conn: sqlite3.Connection, key: tuple[str, str], messages: list, first_seq: int, next_seq: int) -> tuple[int, int]:
+        stored = self._load_messages(conn, key, first_seq, next_seq)
+        stored_from = first_seq
+        keys = [message_key(message) for message in messages]
+        kept = 0
+        if keys and stored.keys:
+            try:
+                start = stored.keys.index(keys[0])
+            except ValueError:
+                start = None
+            if start is not None and stored.keys[start:] == keys[:len(stored.keys) - start]:
+                kept = len(stored.keys) - start
+                first_seq += start
+        elif not stored.keys:
+            first_seq = next_seq
+        if kept == 0 and stored.keys:
+            self._count(rewrites=1)
+            first_seq = next_seq
+        added = messages[kept:]
+        rows, written = [], 0
+        for offset, message in enumerate(added):
+            type_, payload = self.serde.dumps_typed(message)
+            rows.append((*key, next_seq + offset, keys[kept + offset], type_, payload))
+            written += len(payload)
+        if rows:
+            conn.executemany("INSERT INTO messages (thread_id, checkpoint_ns, seq, message_key, type, payload) VALUES (?, ?, ?, ?, ?, ?)", rows)
+        if first_seq > stored_from:
+            conn.execute("DELETE FROM messages WHERE thread_id = ? AND checkpoint_ns = ? AND seq < ?", (*key, first_seq))
+        next_seq += len(rows)
+        self._count(messages_written=len(rows), bytes_written=written)
+        self._remember(key, _CachedThread(first_seq, next_seq, list(messages), keys))
+        return first_seq, next_seq
+
+    def _thread_row(self, conn: sqlite3.Connection, key: tuple[str, str]) -> Optional[tuple]:
+        return conn.execute(
+            "SELECT checkpoint_id, parent_id, first_seq, next_seq, has_messages, checkpoint_type, checkpoint, metadata_type, metadata "
+            "FROM threads WHERE thread_id = ? AND checkpoint_ns = ?",
+            key,
+        ).fetchone()
+
+    # Upsert the channels in `changed` (every channel in `values` when None); with `prune`, channels
+    # missing from `values` are deleted, since a checkpoint's values hold every channel that has one
+    def _store_channels(self, conn: sqlite3.Connection, key: tuple[str, str], values: dict, changed: Optional[Iterable[str]], prune: bool) -> int:
+        rows, written = [], 0
+        for channel in values if changed is None else changed:
+            if channel in values:
+                type_, payload = self.serde.dumps_typed(values[channel])
+                rows.append((*key, channel, type_, payload))
+                written += len(payload)
+        if rows:
+            conn.executemany(
+                "INSERT INTO channels (thread_id, checkpoint_ns, channel, type, payload) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (thread_id, checkpoint_ns, channel) DO UPDATE SET type = excluded.type, payload = excluded.payload",
+                rows,
+            )
+        if prune:
+            conn.execute(
+                "DELETE FROM channels WHERE thread_id = ? AND checkpoint_ns = ? AND channel NOT IN (SELECT value FROM json_each(?))",
+                (*key, json.dumps(list(values))),
+            )
+        return written
+
+    def _load_channels(self, conn: sqlite3.Connection, key: tuple[str, str]) -> dict:
+        rows = conn.execute("SELECT channel, type, payload FROM channels WHERE thread_id = ? AND checkpoint_ns = ?", key).fetchall()
+        return {channel: self.serde.loads_typed((type_, payload)) for channel, type_, payload in rows}
+
+    # Store a checkpoint as the thread's only one. Its channel values are written separately: messages
+    # as a delta, the other channels only when they are in `changed`.
+    def _write_thread(self, conn: sqlite3.Connection, key: tuple[str, str], checkpoint: Checkpoint, metadata: dict, parent_id: Optional[str],
+                      changed: Optional[Iterable[str]], prune: bool, row: Optional[tuple], touched_at: Optional[float] = None) -> None:
+        values = dict(checkpoint["channel_values"])
+        messages = values.pop(self.messages_channel, None)
+        stored = {name: value for name, value in checkpoint.items() if name not in ("channel_values", "pending_sends")}
+        # A new thread numbers its messages from the current time, so a thread deleted and recreated by
+        # another process never reuses sequence numbers this process may still have cached
+        first_seq = next_seq = time.time_ns() // 1000
+        if row:
+            first_seq, next_seq = row[2], row[3]
+        if messages is not None:
+            first_seq, next_seq = self._store_messages(conn, key, messages, first_seq, next_seq)
+        written = self._store_channels(conn, key, values, changed, prune)
+        checkpoint_type, checkpoint_blob = self.serde.dumps_typed(stored)
+        metadata_type, metadata_blob = self.serde.dumps_typed(metadata)
+        conn.execute(
+            "INSERT INTO threads (thread_id, checkpoint_ns, checkpoint_id, parent_id, first_seq, next_seq, has_messages, "
+            "checkpoint_type, checkpoint, metadata_type, metadata, touched_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (thread_id, checkpoint_ns) DO UPDATE SET checkpoint_id = excluded.checkpoint_id, "
+            "parent_id = excluded.parent_id, first_seq = excluded.first_seq, next_seq = excluded.next_seq, "
+            "has_messages = excluded.has_messages, checkpoint_type = excluded.checkpoint_type, checkpoint = excluded.checkpoint, "
+            "metadata_type = excluded.metadata_type, metadata = excluded.metadata, touched_at = excluded.touched_at",
+            (*key, checkpoint["id"], parent_id, first_seq, next_seq, int(messages is not None or bool(row and row[4])),
+             checkpoint_type, checkpoint_blob, metadata_type, metadata_blob, touched_at or time.time()),
+        )
+        self._count(puts=1, bytes_written=written + len(checkpoint_blob) + len(metadata_blob))
+
+    def _tuple(self, conn: sqlite3.Connection, key: tuple[str, str], row: tuple) -> CheckpointTuple:
+        checkpoint_id, parent_id, first_seq, next_seq, has_messages, checkpoint_type, checkpoint_blob, metadata_type, metadata_blob = row
+        checkpoint = self.serde.loads_typed((checkpoint_type, checkpoint_blob))
+        checkpoint["channel_values"] = self._load_channels(conn, key)
+        if has_messages:
+            checkpoint["channel_values"][self.messages_channel] = list(self._load_messages(conn, key, first_seq, next_seq).messages)
+        self._count(loads=1)
+        writes = conn.execute(
+            "SELECT task_id, channel, type, payload FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (*key, checkpoint_id),
+        ).fetchall()
+        sends = []
+        if parent_id:
+            sends = conn.execute(
+                "SELECT type, payload FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? AND channel = ? ORDER BY task_id, idx",
+                (*key, parent_id, TASKS),
+            ).fetchall()
+        checkpoint["pending_sends"] = [self.serde.loads_typed(send) for send in sends]
+        thread_id, checkpoint_ns = key
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            checkpoint=checkpoint,
+            metadata=self.serde.loads_typed((metadata_type, metadata_blob)),
+            parent_config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_id}} if parent_id else None,
+            pending_writes=[(task_id, channel, self.serde.loads_typed((type_, payload))) for task_id, channel, type_, payload in writes],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        key = (config["configurable"]["thread_id"], config["configurable"].get("checkpoint_ns", ""))
+        with self._db() as conn:
+            row = self._thread_row(conn, key)
+            if row is None or row[0] is None:
+                return None
+            checkpoint_id = get_checkpoint_id(config)
+            if checkpoint_id and checkpoint_id != row[0]:
+                return None
+            return self._tuple(conn, key, row)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        if config is not None:
+            found = self.get_tuple(config)
+            candidates = [found] if found else []
+        else:
+            with self._db() as conn:
+                keys = conn.execute("SELECT thread_id, checkpoint_ns FROM threads WHERE checkpoint_id IS NOT NULL ORDER BY touched_at DESC").fetchall()
+            candidates = [self.get_tuple({"configurable": {"thread_id": thread_id, "checkpoint_ns": ns}}) for thread_id, ns in keys]
+        before_id = get_checkpoint_id(before) if before else None
+        for found in candidates:
+            if limit is not None and limit <= 0:
+                return
+            if found is None or (before_id and found.config["configurable"]["checkpoint_id"] >= before_id):
+                continue
+            if filter and any(found.metadata.get(name) != value for name, value in filter.items()):
+                continue
+            if limit is not None:
+                limit -= 1
+            yield found
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata, new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        key = (thread_id, checkpoint_ns)
+        # The node writes in the metadata repeat what the channels hold; only which nodes wrote is kept
+        compact = {**metadata, "writes": sorted(metadata.get("writes") or {})} if "writes" in metadata else dict(metadata)
+        parent_id = config["configurable"].get("checkpoint_id")
+        with self._db(write=True) as conn:
+            row = self._thread_row(conn, key)
+            self._write_thread(conn, key, checkpoint, compact, parent_id, new_versions, True, row)
+            # Pending writes matter only for the new checkpoint and, for pending sends, its parent
+            conn.execute(
+                "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN (?, ?)",
+                (*key, checkpoint["id"], parent_id or ""),
+            )
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[tuple[str, Any]], task_id: str) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows, written = [], 0
+        for idx, (channel, value) in enumerate(writes):
+            type_, payload = self.serde.dumps_typed(value)
+            rows.append((thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx), channel, type_, payload))
+            written += len(payload)
+        with self._db(write=True) as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO writes (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, payload) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        self._count(bytes_written=written)
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        for found in await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit))):
+            yield found
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata, new_versions: ChannelVersions) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[tuple[str, Any]], task_id: str) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id)
+
+    # Session-style access for the code paths that answer outside the graph (streaming, batches): the
+    # thread's channel values as a plain state dict
+    def load_state(self, thread_id: str) -> Optional[dict]:
+        key = (thread_id, "")
+        with self._db() as conn:
+            row = self._thread_row(conn, key)
+            if row is None:
+                return None
+            state = self._load_channels(conn, key)
+            state[self.messages_channel] = list(self._load_messages(conn, key, row[2], row[3]).messages)
+        self._count(loads=1)
+        return state
+
+    # Store a state dict as the thread's channel values. The graph's bookkeeping is kept, so the next
+    # graph run on the thread starts from this state.
+    def save_state(self, thread_id: str, state: dict, touched_at: Optional[float] = None) -> None:
+        key = (thread_id, "")
+        with self._db(write=True) as conn:
+            row = self._thread_row(conn, key)
+            checkpoint = self.serde.loads_typed((row[5], row[6])) if row else empty_checkpoint()
+            checkpoint["channel_values"] = {self.messages_channel: [], **state}
+            metadata = self.serde.loads_typed((row[7], row[8])) if row else {"source": "update", "step": -1}
+            self._write_thread(conn, key, checkpoint, metadata, row[1] if row else None, None, False, row, touched_at)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._db(write=True) as conn:
+            for table in ("threads", "channels", "messages", "writes"):
+                conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+        with self._cache_lock:
+            for key in [key for key in self._cache if key[0] == thread_id]:
+                del self._cache[key]
+
+    def thread_count(self) -> int:
+        with self._db() as conn:
+            return conn.execute("SELECT COUNT(*) FROM threads WHERE checkpoint_ns = ''").fetchone()[0]
+
+    def idle_threads(self, cutoff: float) -> List[str]:
+        with self._db() as conn:
+            rows = conn.execute("SELECT thread_id FROM threads WHERE checkpoint_ns = '' AND touched_at < ?", (cutoff,)).fetchall()
+        return [row[0] for row in rows]
+
+    # Threads beyond the `keep` most recently used
+    def overflow_threads(self, keep: int) -> List[str]:
+        with self._db() as conn:
+            rows = conn.execute(
+                "SELECT thread_id FROM threads WHERE checkpoint_ns = '' ORDER BY touched_at DESC LIMIT -1 OFFSET ?", (keep,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def stats(self) -> dict:
+        with self._cache_lock:
+            return {**self._stats, "cached_threads": len(self._cache), "path": self.path}
+
+
+class _DictThread:
+    """A thread's latest checkpoint as live objects, with the pending writes that still matter."""
+
+    __slots__ = ("checkpoint", "metadata", "parent_id", "writes", "touched_at")
+
+    def __init__(self, checkpoint: dict, metadata: dict, parent_id: Optional[str], touched_at: float):
+        self.checkpoint = checkpoint
+        self.metadata = metadata
+        self.parent_id = parent_id
+        self.writes: dict[str, dict[tuple[str, int], tuple[str, str, Any]]] = {}
+        self.touched_at = touched_at
+
+
+# Channel values are stored and handed out as-is; lists are copied so neither side can append to the other's
+def _copy_values(values: dict) -> dict:
+    return {channel: list(value) if isinstance(value, list) else value for channel, value in values.items()}
+
+
+class DictSaver(BaseCheckpointSaver):
+    """LangGraph checkpointer that keeps each thread's latest state in a dict, for a process-local store.
+
+    Nothing is serialized: a turn stores the channel values it was given and the next turn resumes from
+    the same objects, so saving and resuming cost the same however long the conversation is. Like
+    SQLiteDeltaSaver it keeps only the latest checkpoint of a thread and treats stored messages as
+    immutable. Conversations are lost with the process and are not shared between workers.
+    """
+
+    def __init__(self, messages_channel: str = "messages", *, serde=None):
+        super().__init__(serde=serde)
+        self.messages_channel = messages_channel
+        self._threads: dict[tuple[str, str], _DictThread] = {}
+        self._lock = threading.RLock()
+        self._stats = {"puts": 0, "loads": 0}
+
+    def _tuple(self, key: tuple[str, str], thread: _DictThread) -> CheckpointTuple:
+        # The graph updates the versions of the checkpoint it resumed from in place, so it gets a copy
+        checkpoint = copy_checkpoint(thread.checkpoint)
+        checkpoint["channel_values"] = _copy_values(checkpoint["channel_values"])
+        checkpoint_id = checkpoint["id"]
+        parent_writes = thread.writes.get(thread.parent_id, {}) if thread.parent_id else {}
+        checkpoint["pending_sends"] = [parent_writes[index][2] for index in sorted(parent_writes) if parent_writes[index][1] == TASKS]
+        self._stats["loads"] += 1
+        thread_id, checkpoint_ns = key
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            checkpoint=checkpoint,
+            metadata=dict(thread.metadata),
+            parent_config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": thread.parent_id}} if thread.parent_id else None,
+            pending_writes=[thread.writes[checkpoint_id][index] for index in sorted(thread.writes.get(checkpoint_id, {}))],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        key = (config["configurable"]["thread_id"], config["configurable"].get("checkpoint_ns", ""))
+        with self._lock:
+            thread = self._threads.get(key)
+            if thread is None or thread.checkpoint.get("id") is None:
+                return None
+            checkpoint_id = get_checkpoint_id(config)
+            if checkpoint_id and checkpoint_id != thread.checkpoint["id"]:
+                return None
+            return self._tuple(key, thread)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        if config is not None:
+            found = self.get_tuple(config)
+            candidates = [found] if found else []
+        else:
+            with self._lock:
+                keys = [key for key, thread in sorted(self._threads.items(), key=lambda item: -item[1].touched_at) if thread.checkpoint.get("id")]
+            candidates = [self.get_tuple({"configurable": {"thread_id": thread_id, "checkpoint_ns": ns}}) for thread_id, ns in keys]
+        before_id = get_checkpoint_id(before) if before else None
+        for found in candidates:
+            if limit is not None and limit <= 0:
+                return
+            if found is None or (before_id and found.config["configurable"]["checkpoint_id"] >= before_id):
+                continue
+            if filter and any(found.metadata.get(name) != value for name, value in filter.items()):
+                continue
+            if limit is not None:
+                limit -= 1
+            yield found
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata, new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        key = (thread_id, checkpoint_ns)
+        # As in SQLiteDeltaSaver, only which nodes wrote is kept from the metadata's node writes
+        compact = {**metadata, "writes": sorted(metadata.get("writes") or {})} if "writes" in metadata else dict(metadata)
+        parent_id = config["configurable"].get("checkpoint_id")
+        stored = {name: value for name, value in checkpoint.items() if name != "pending_sends"}
+        stored["channel_values"] = _copy_values(checkpoint["channel_values"])
+        with self._lock:
+            previous = self._threads.get(key)
+            thread = self._threads[key] = _DictThread(stored, compact, parent_id, time.time())
+            # Pending writes matter only for the new checkpoint and, for pending sends, its parent
+            if previous is not None:
+                thread.writes = {checkpoint_id: writes for checkpoint_id, writes in previous.writes.items() if checkpoint_id in (checkpoint["id"], parent_id)}
+            self._stats["puts"] += 1
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[tuple[str, Any]], task_id: str) -> None:
+        key = (config["configurable"]["thread_id"], config["configurable"].get("checkpoint_ns", ""))
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        with self._lock:
+            thread = self._threads.get(key)
+            if thread is None:
+                return
+            stored = thread.writes.setdefault(checkpoint_id, {})
+            for idx, (channel, value) in enumerate(writes):
+                stored[(task_id, WRITES_IDX_MAP.get(channel, idx))] = (task_id, channel, value)
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return self.get_tuple(config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        for found in self.list(config, filter=filter, before=before, limit=limit):
+            yield found
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata, new_versions: ChannelVersions) -> RunnableConfig:
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[tuple[str, Any]], task_id: str) -> None:
+        self.put_writes(config, writes, task_id)
+
+    # Session-style access, as on SQLiteDeltaSaver
+    def load_state(self, thread_id: str) -> Optional[dict]:
+        with self._lock:
+            thread = self._threads.get((thread_id, ""))
+            if thread is None:
+                return None
+            self._stats["loads"] += 1
+            return {self.messages_channel: [], **_copy_values(thread.checkpoint["channel_values"])}
+
+    def save_state(self, thread_id: str, state: dict, touched_at: Optional[float] = None) -> None:
+        key = (thread_id, "")
+        with self._lock:
+            thread = self._threads.get(key)
+            if thread is None:
+                thread = self._threads[key] = _DictThread(empty_checkpoint(), {"source": "update", "step": -1}, None, 0.0)
+            thread.checkpoint = {**thread.checkpoint, "channel_values": _copy_values({self.messages_channel: [], **state})}
+            thread.touched_at = touched_at or time.time()
+            self._stats["puts"] += 1
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            for key in [key for key in self._threads if key[0] == thread_id]:
+                del self._threads[key]
+
+    def thread_count(self) -> int:
+        with self._lock:
+            return sum(1 for key in self._threads if key[1] == "")
+
+    def idle_threads(self, cutoff: float) -> List[str]:
+        with self._lock:
+            return [key[0] for key, thread in self._threads.items() if key[1] == "" and thread.touched_at < cutoff]
+
+    # Threads beyond the `keep` most recently used
+    def overflow_threads(self, keep: int) -> List[str]:
+        with self._lock:
+            threads = sorted(((thread.touched_at, key[0]) for key, thread in self._threads.items() if key[1] == ""), reverse=True)
+        return [thread_id for _, thread_id in threads[keep:]]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "threads": len(self._threads), "path": None}
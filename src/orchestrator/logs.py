@@ -0,0 +1,206 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import re
+import uuid
+import zlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Iterator, Optional
+
+LOG_FORMAT = '%(asctime)s [%(levelname)s] %(message)s'
+REQUEST_ID_HEADER = "X-Request-ID"
+
+_ANSI_RE = re.compile(r"\x1b\[[0-9;]*m")
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9_.:-]{1,64}$")
+
+# Fields attached to every record logged while handling a request: request_id, minion
+_context: ContextVar[dict] = ContextVar("log_context", default={})
+_listener: Optional[QueueListener] = None
+_content_chars = 300
+_worker_pid: Optional[int] = None  # set in processes forked from the one that configured logging
+
+
+# Attach fields to the records logged inside the block; the previous fields come back when it exits
+@contextmanager
+def log_context(**fields) -> Iterator[None]:
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+# Add fields for the rest of the enclosing log_context block, e.g. the minion once the question is routed
+def bind_log_context(**fields) -> None:
+    _context.set({**_context.get(), **fields})
+
+# The caller's X-Request-ID when it is usable, otherwise a new one
+def request_id_from(header_value: Optional[str]) -> str:
+    if header_value and _REQUEST_ID_RE.match(header_value):
+        return header_value
+    return uuid.uuid4().hex[:16]
+
+# User questions and model answers can be long; log at most LOG_CONTENT_CHARS of them
+def clip(text: str) -> str:
+    if _content_chars <= 0 or len(text) <= _content_chars:
+        return text
+    return f"{text[:_content_chars]}… [{len(text) - _content_chars} more chars]"
+
+
+class ContextFilter(logging.Filter):
+    """Copies the request's log context onto each record, on the thread that logged it."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _context.get()
+        record.request_id = context.get("request_id", "")
+        record.minion = context.get("minion", "")
+        return True
+
+
+class RequestSampler(logging.Filter):
+    """Keeps a fraction of the INFO and DEBUG records of requests, decided once per request id.
+
+    A sampled request keeps all of its lines, so its log still reads end to end. Warnings, errors and
+    records logged outside a request are always kept.
+    """
+
+    def __init__(self, rate: float = 1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1.0 or record.levelno >= logging.WARNING:
+            return True
+        request_id = getattr(record, "request_id", "")
+        if not request_id:
+            return True
+        return zlib.crc32(request_id.encode()) / 0xFFFFFFFF < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, without the ANSI colors used on the console."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": _ANSI_RE.sub("", record.getMessage()),
+        }
+        for field in ("request_id", "minion"):
+            value = getattr(record, field, "")
+            if value:
+                entry[field] = value
+        if _worker_pid is not None:
+            entry["worker"] = _worker_pid
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """Hands records to the writer thread. Past `max_pending` queued records, new INFO and DEBUG records are
+    dropped rather than waited on; warnings and errors are always queued."""
+
+    def __init__(self, log_queue: queue.SimpleQueue, max_pending: int):
+        super().__init__(log_queue)
+        self.max_pending = max_pending
+        self.dropped = 0
+        self._traceback = logging.Formatter()
+
+    # The message is rendered here, since its arguments may change once the caller moves on; the traceback
+    # travels as text so each writer can place it in its own format. This is the root logger's only handler,
+    # so the record is changed in place instead of copied.
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self._traceback.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if record.levelno < logging.WARNING and self.queue.qsize() >= self.max_pending:
+            self.dropped += 1
+            return
+        self.queue.put_nowait(record)
+
+
+# Route all logging through a queue to one background writer thread, so request threads never wait on
+# stderr or the disk. The file gets JSON lines and rotates by size; the console keeps the colored text
+# format unless json_console is set. Calling it again (e.g. on a Streamlit rerun) keeps the running pipeline.
+def configure_logging(
+    log_file: str,
+    level: str = "INFO",
+    json_console: bool = False,
+    max_bytes: int = 10 * 1024 * 1024,
+    backup_count: int = 5,
+    sample_rate: float = 1.0,
+    content_chars: int = 300,
+    queue_size: int = 10000,
+) -> QueueListener:
+    global _listener, _content_chars
+    if _listener is not None:
+        return _listener
+    _content_chars = content_chars
+
+    console = logging.StreamHandler()
+    console.setFormatter(JsonFormatter() if json_console else logging.Formatter(LOG_FORMAT))
+    log_file_handler = RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+    log_file_handler.setFormatter(JsonFormatter())
+
+    # None of the formats use the caller's file, line or thread, so skip collecting them per record. The process
+    # id stays: it is cheap, and a pre-fork server's own log format (gunicorn's) prints it.
+    logging._srcfile = None
+    logging.logThreads = False
+    logging.logMultiprocessing = False
+
+    handler = _DroppingQueueHandler(queue.SimpleQueue(), queue_size)
+    handler.addFilter(ContextFilter())
+    handler.addFilter(RequestSampler(sample_rate))
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(handler.queue, console, log_file_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_stop_listener)
+    os.register_at_fork(after_in_child=_restart_after_fork)
+    return _listener
+
+
+def _stop_listener() -> None:
+    if _listener is not None:
+        _listener.stop()
+
+# A forked child (e.g. a pre-fork server worker) inherits the queue but not the writer thread, so it gets a
+# fresh queue and its own writer; records still queued in the parent are written by the parent
+def _restart_after_fork() -> None:
+    global _listener, _worker_pid
+    handler = next((handler for handler in logging.getLogger().handlers if isinstance(handler, _DroppingQueueHandler)), None)
+    if _listener is None or handler is None:
+        return
+    _worker_pid = os.getpid()
+    handler.queue = queue.SimpleQueue()
+    _listener = QueueListener(handler.queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def logging_from_env(log_file: str) -> QueueListener:
+    return configure_logging(
+        os.getenv("LOG_FILE", log_file),
+        level=os.getenv("LOG_LEVEL", "INFO").upper(),
+        json_console=os.getenv("LOG_CONSOLE_FORMAT", "text") == "json",
+        max_bytes=int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024)),
+        backup_count=int(os.getenv("LOG_BACKUP_COUNT", 5)),
+        sample_rate=float(os.getenv("LOG_INFO_SAMPLE_RATE", 1.0)),
+        content_chars=int(os.getenv("LOG_CONTENT_CHARS", 300)),
+    )
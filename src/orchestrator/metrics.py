@@ -0,0 +1,196 @@
+import bisect
+import threading
+import time
+from typing import Callable, Iterable, Optional
+
+# Prometheus text exposition format
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; model calls routinely take several seconds, so the buckets reach further than Prometheus' defaults
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(pairs: Iterable[tuple[str, str]]) -> str:
+    text = ",".join(f'{name}="{_escape(value)}"' for name, value in pairs)
+    return f"{{{text}}}" if text else ""
+
+# What a metric renders: this process's series, or each worker's under a "worker" label
+def _sources(collect: Callable[[], dict], workers: Optional[dict[str, dict]]) -> list[tuple[list[tuple[str, str]], dict]]:
+    if workers is None:
+        return [([], collect())]
+    return [([("worker", worker)], series) for worker, series in sorted(workers.items())]
+
+
+class _Shard:
+    """One thread's series: label values -> per-bucket counts (the last one is +Inf) followed by the sum."""
+
+    __slots__ = ("thread", "series")
+
+    def __init__(self, thread: threading.Thread):
+        self.thread = thread
+        self.series: dict[tuple[str, ...], list] = {}
+
+
+class Timer:
+    """Observes the time spent in a with-block; labels, including the outcome, may be set inside it."""
+
+    __slots__ = ("histogram", "labels", "_started")
+
+    def __init__(self, histogram: "Histogram", labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self) -> "Timer":
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if exc_type is not None:
+            self.labels["outcome"] = "error" if issubclass(exc_type, Exception) else "cancelled"
+        else:
+            self.labels.setdefault("outcome", "ok")
+        self.histogram.observe(time.perf_counter() - self._started, **self.labels)
+        return False
+
+
+class Histogram:
+    """Latency histogram that each thread records into its own shard, so observing takes no lock.
+
+    Shards are summed when the histogram is scraped. Shards of finished threads are folded into one total
+    whenever a thread registers a shard, so thread-per-request servers keep one shard per live thread.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._local = threading.local()
+        self._shards: list[_Shard] = []
+        self._retired: dict[tuple[str, ...], list] = {}
+        self._lock = threading.Lock()  # taken once per thread and on scrape, never per observation
+
+    def _shard(self) -> _Shard:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = _Shard(threading.current_thread())
+            with self._lock:
+                self._retire_finished()
+                self._shards.append(shard)
+            self._local.shard = shard
+            return shard
+
+    def observe(self, seconds: float, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        series = self._shard().series
+        values = series.get(key)
+        if values is None:
+            values = series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        values[bisect.bisect_left(self.buckets, seconds)] += 1
+        values[-1] += seconds
+
+    def time(self, **labels) -> Timer:
+        return Timer(self, labels)
+
+    # Fold the shards of threads that have finished into the retired totals; called with the lock held
+    def _retire_finished(self) -> None:
+        finished = [shard for shard in self._shards if not shard.thread.is_alive()]
+        if not finished:
+            return
+        for shard in finished:
+            for key, values in shard.series.items():
+                retired = self._retired.setdefault(key, [0] * len(values))
+                for i, value in enumerate(values):
+                    retired[i] += value
+        self._shards = [shard for shard in self._shards if shard.thread.is_alive()]
+
+    # Totals per label set, summed over every thread's shard
+    def collect(self) -> dict[tuple[str, ...], list]:
+        totals: dict[tuple[str, ...], list] = {}
+
+        def add(series: dict) -> None:
+            for key, values in list(series.items()):
+                total = totals.setdefault(key, [0] * len(values))
+                for i, value in enumerate(list(values)):
+                    total[i] += value
+
+        with self._lock:
+            self._retire_finished()
+            add(self._retired)
+            for shard in self._shards:
+                add(shard.series)
+        return totals
+
+    # `workers` maps each worker to its collected series, for a server whose workers each keep their own
+    def render(self, workers: Optional[dict[str, dict]] = None) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for worker, series in _sources(self.collect, workers):
+            for key, values in sorted(series.items()):
+                labels = worker + list(zip(self.labelnames, key))
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), values):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', le)])} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {values[-1]!r}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """A current value read from its source when scraped, e.g. how many calls are queued right now.
+
+    `collect` returns the value for each label set: label values (in labelnames order) -> number.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str], collect: Callable[[], dict[tuple[str, ...], float]]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def render(self, workers: Optional[dict[str, dict]] = None) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for worker, series in _sources(self.collect, workers):
+            for key, value in sorted(series.items()):
+                lines.append(f"{self.name}{_format_labels(worker + list(zip(self.labelnames, key)))} {value!r}")
+        return lines
+
+
+class MetricsRegistry:
+    """The histograms and gauges a server exports, rendered together in Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: list = []
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str], collect: Callable[[], dict[tuple[str, ...], float]]) -> Gauge:
+        metric = Gauge(name, documentation, labelnames, collect)
+        self._metrics.append(metric)
+        return metric
+
+    # Every metric's series in a JSON-friendly form, for a worker to share with the others
+    def snapshot(self) -> dict[str, list]:
+        return {metric.name: [[list(key), value] for key, value in metric.collect().items()] for metric in self._metrics}
+
+    # Prometheus text for this process, or, given each worker's snapshot, for all of them with a "worker" label
+    def render(self, workers: Optional[dict[str, dict[str, list]]] = None) -> str:
+        lines = []
+        for metric in self._metrics:
+            if workers is None:
+                lines.extend(metric.render())
+            else:
+                per_worker = {
+                    worker: {tuple(key): value for key, value in snapshot.get(metric.name, [])}
+                    for worker, snapshot in workers.items()
+                }
+                lines.extend(metric.render(per_worker))
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,161 @@
+import functools
+import json
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+from minions.prompts import ChatPrompt
+
+from .router import RouteSpec
+
+logger = logging.getLogger(__name__)
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config")
+
+# Settings a minion may declare in the "minions" section of a registry file, and those it must
+MINION_SETTINGS = ("description", "prompt", "model", "keywords", "examples", "tools", "side_effects", "cacheable")
+REQUIRED_MINION_SETTINGS = ("description", "prompt")
+# Settings of the "orchestrator" section
+ORCHESTRATOR_SETTINGS = ("model", "preamble", "candidates", "prompt_examples")
+
+DEFAULT_PREAMBLE = "You are an orchestrator assistant. You need to determine which specialized minion should handle each user query. Here are the rules:"
+
+
+@dataclass
+class MinionSpec:
+    name: str
+    description: str  # what the minion handles, completing "The '<name>' ..." in the orchestrator prompt
+    prompt: str  # system prompt of the minion's own model
+    model: str  # entry in the "models" section of models.json
+    keywords: list[str] = field(default_factory=list)  # regular expressions for the fast-path router
+    examples: list[str] = field(default_factory=list)  # example questions, for the router and the orchestrator prompt
+    tools: list[str] = field(default_factory=list)  # tools run, in order, before the minion's model
+    side_effects: bool = False  # sends or changes something, so it never runs speculatively
+    cacheable: bool = True  # its answers may be served from the response cache
+
+
+@dataclass
+class ToolResult:
+    reply: Optional[str] = None  # answers the turn without calling the minion's model
+    context: str = ""  # sent to the model after the question
+
+
+def load_minion_config(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    unknown = set(config.get("orchestrator", {})) - set(ORCHESTRATOR_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown orchestrator settings in {path}: {', '.join(sorted(unknown))}")
+    if not config.get("minions"):
+        raise ValueError(f"No minions declared in {path}")
+    for name, settings in config["minions"].items():
+        unknown = set(settings) - set(MINION_SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown settings for minion '{name}' in {path}: {', '.join(sorted(unknown))}")
+        missing = set(REQUIRED_MINION_SETTINGS) - set(settings)
+        if missing:
+            raise ValueError(f"Missing settings for minion '{name}' in {path}: {', '.join(sorted(missing))}")
+    if config.get("fallback") not in config["minions"]:
+        raise ValueError(f"The fallback minion of {path} must be one of its minions, not {config.get('fallback')!r}")
+    return config
+
+
+class MinionRegistry:
+    """Minions declared in config: what each handles, its prompt, model and tools.
+
+    Dispatch is a dict lookup by name, and each minion's prompt is compiled once. The orchestrator
+    prompt lists only the candidates it is given, so it stays the same size however many minions
+    are declared; one is built per distinct shortlist and reused.
+    """
+
+    def __init__(self, config: dict, tools: Iterable[str] = ()):
+        orchestrator = config.get("orchestrator", {})
+        self.orchestrator_model = orchestrator.get("model", "orchestrator")
+        self.preamble = orchestrator.get("preamble", DEFAULT_PREAMBLE)
+        self.candidate_count = int(os.getenv("ORCHESTRATOR_CANDIDATES", orchestrator.get("candidates", 8)))
+        self.prompt_examples = orchestrator.get("prompt_examples", 3)
+        self.fallback = config["fallback"]
+        self.minions = {name: MinionSpec(name=name, **{"model": name, **settings}) for name, settings in config["minions"].items()}
+
+        tools = set(tools)
+        for minion in self.minions.values():
+            unknown = set(minion.tools) - tools
+            if unknown:
+                raise ValueError(f"Minion '{minion.name}' uses tools this server does not provide: {', '.join(sorted(unknown))}")
+
+        self._order = {name: position for position, name in enumerate(self.minions)}
+        self._prompts = {name: ChatPrompt(minion.prompt) for name, minion in self.minions.items()}
+        # Names the orchestrator LLM may answer with: the minion's name, or the name without "minion"/"agent"
+        self._answers = {}
+        for name in reversed(self.minions):
+            self._answers[re.sub(r"\s+(minion|agent)$", "", name.lower())] = name
+        self._answers.update({name.lower(): name for name in self.minions})
+        self._orchestrator_prompt = functools.lru_cache(maxsize=256)(self._build_orchestrator_prompt)
+
+    def __len__(self) -> int:
+        return len(self.minions)
+
+    def get(self, name: str) -> MinionSpec:
+        return self.minions[name]
+
+    # The minion's chat prompt: its system prompt, then the chat history, then the question
+    def prompt(self, name: str) -> ChatPrompt:
+        return self._prompts[name]
+
+    # Keywords, examples and description of every minion, for the fast-path router
+    def route_specs(self) -> dict[str, RouteSpec]:
+        return {
+            name: RouteSpec(keywords=minion.keywords, examples=minion.examples, description=minion.description)
+            for name, minion in self.minions.items()
+        }
+
+    # (example question, minion) pairs, to check the fast-path router against
+    def examples(self) -> list[tuple[str, str]]:
+        return [(example, name) for name, minion in self.minions.items() for example in minion.examples]
+
+    # Orchestrator prompt offering these minions. They are listed in declaration order, so the same shortlist
+    # always gives the same prompt text.
+    def orchestrator_prompt(self, candidates: Iterable[str]) -> ChatPrompt:
+        return self._orchestrator_prompt(tuple(sorted(set(candidates), key=self._order.__getitem__)))
+
+    def _build_orchestrator_prompt(self, names: tuple[str, ...]) -> ChatPrompt:
+        return ChatPrompt(self.orchestrator_instructions(names))
+
+    def orchestrator_instructions(self, names: Iterable[str]) -> str:
+        lines = [self.preamble]
+        choices = []
+        for name in names:
+            minion = self.minions[name]
+            line = f"- The '{name}' {minion.description}"
+            examples = [f"'{example}'" for example in minion.examples[:self.prompt_examples]]
+            if examples:
+                line += f" Example queries include: {', '.join(examples)}."
+            lines.append(line)
+            choices.append(f"'{name}'")
+        options = " or ".join(choices) if len(choices) <= 2 else f"{', '.join(choices[:-1])}, or {choices[-1]}"
+        lines.append(f"Based on the user query, output the name of the minion that should handle the query: {options}.")
+        return "\n".join(lines)
+
+    # Minion named by the orchestrator LLM's answer: a minion's name, else the longest candidate name the
+    # answer mentions, else the fallback
+    def resolve(self, answer: str, candidates: Iterable[str] = ()) -> str:
+        text = answer.strip().strip("'\".").lower()
+        name = self._answers.get(text)
+        if name is not None:
+            return name
+        for name in sorted(candidates, key=len, reverse=True):
+            if name.lower() in text:
+                return name
+        logger.info(f"Orchestrator answer {answer[:80]!r} names no minion; using {self.fallback}.")
+        return self.fallback
+
+
+# Build the minion registry from a JSON file in src/config, or the file at MINION_CONFIG_PATH. `tools` names the
+# tools the server provides; a minion that lists any other is a configuration error.
+def minion_registry_from_env(filename: str, tools: Iterable[str] = ()) -> MinionRegistry:
+    path = os.getenv("MINION_CONFIG_PATH") or os.path.join(CONFIG_DIR, filename)
+    registry = MinionRegistry(load_minion_config(path), tools=tools)
+    logger.info(f"Loaded {len(registry)} minions from {path}.")
+    return registry
@@ -0,0 +1,232 @@
+import heapq
+import logging
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+from .similarity import VectorIndex
+
+logger = logging.getLogger(__name__)
+
+# Base confidence for a question that matches the keyword rules of exactly one route
+RULE_CONFIDENCE = 0.85
+
+_WORD_RE = re.compile(r"\w+")
+
+
+# Split a regular expression at its top-level "|", or None when it has unbalanced brackets
+def _alternatives(pattern: str) -> Optional[list[str]]:
+    alternatives, start, depth, in_class, escaped = [], 0, 0, False, False
+    for i, char in enumerate(pattern):
+        if escaped:
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif in_class:
+            in_class = char != "]"
+        elif char == "[":
+            in_class = True
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth < 0:
+                return None
+        elif char == "|" and depth == 0:
+            alternatives.append(pattern[start:i])
+            start = i + 1
+    if depth or in_class or escaped:
+        return None
+    return alternatives + [pattern[start:]]
+
+# Leading literal word characters of a regular expression, up to the first one that is optional or repeated
+def _literal_prefix(pattern: str) -> str:
+    prefix = []
+    for i, char in enumerate(pattern):
+        if not (char.isalnum() or char == "_") or pattern[i + 1:i + 2] in ("?", "*", "+", "{"):
+            break
+        prefix.append(char)
+    return "".join(prefix).casefold()
+
+# Words a keyword rule's matches must start with, for rules shaped like r"\b(cats?|kittens?)\b" or r"\bweather":
+# a word boundary, then alternatives that each begin with a literal. None for a rule of any other shape.
+def keyword_prefixes(pattern: str) -> Optional[list[str]]:
+    if not pattern.startswith("\\b"):
+        return None
+    rest = pattern[2:]
+    group = 3 if rest.startswith("(?:") else 1 if rest.startswith("(") and not rest.startswith("(?") else 0
+    if group:
+        # The group runs to the first ")" that leaves it balanced
+        for end in range(group, len(rest) + 1):
+            alternatives = _alternatives(rest[group:end])
+            if alternatives is not None and rest[end:end + 1] == ")":
+                break
+        else:
+            return None
+    else:
+        alternatives = _alternatives(rest)
+        if alternatives is None or len(alternatives) > 1:
+            return None
+    prefixes = [_literal_prefix(alternative) for alternative in alternatives]
+    return prefixes if all(prefixes) else None
+
+
+@dataclass
+class RouteSpec:
+    keywords: list[str] = field(default_factory=list)  # regular expressions, matched case-insensitively
+    examples: list[str] = field(default_factory=list)  # example queries for the similarity model
+    description: str = ""  # what the route handles; only used to shortlist candidates for the LLM router
+
+
+@dataclass
+class RouteDecision:
+    route: str
+    confidence: float
+    source: str  # "rules", "similarity" or "none"
+
+
+class DegradedRoute(str):
+    """A route picked without the orchestrator LLM while it is failing; it is not cached, so routing recovers with it."""
+
+
+class FastPathRouter:
+    """In-process routing tier that only defers to the orchestrator LLM when it is not confident."""
+
+    def __init__(self, routes: dict[str, RouteSpec], fallback: str, threshold: float = 0.8):
+        self.routes = list(routes)
+        self.fallback = fallback
+        self.threshold = threshold
+        self._rules = {
+            name: [re.compile(pattern, re.IGNORECASE) for pattern in spec.keywords]
+            for name, spec in routes.items()
+        }
+        # Rules indexed by the words their matches start with; rules of another shape are tried on every question
+        self._order = {name: position for position, name in enumerate(routes)}
+        self._rule_prefixes: dict[str, set[str]] = {}
+        self._unindexed_rules: set[str] = set()
+        for name, spec in routes.items():
+            for pattern in spec.keywords:
+                prefixes = keyword_prefixes(pattern)
+                if prefixes is None:
+                    self._unindexed_rules.add(name)
+                for prefix in prefixes or ():
+                    self._rule_prefixes.setdefault(prefix, set()).add(name)
+        self._longest_prefix = max(map(len, self._rule_prefixes), default=0)
+        self._index = VectorIndex()
+        for name, spec in routes.items():
+            for example in spec.examples:
+                self._index.add(example, name)
+        self._descriptions = VectorIndex()
+        for name, spec in routes.items():
+            if spec.description:
+                self._descriptions.add(f"{name} {spec.description}", name)
+        self._lock = threading.Lock()
+        self._fast_path_hits = 0
+        self._llm_path_hits = 0
+
+    # Routes whose keyword rules match, in declaration order. Only the routes indexed under the start of one of the
+    # question's words are tried, so the cost follows the question rather than the number of routes.
+    def _rule_hits(self, question: str) -> list[str]:
+        routes = set(self._unindexed_rules)
+        for word in _WORD_RE.findall(question.casefold()):
+            for length in range(1, min(len(word), self._longest_prefix) + 1):
+                routes.update(self._rule_prefixes.get(word[:length], ()))
+        return [
+            name for name in sorted(routes, key=self._order.__getitem__)
+            if any(pattern.search(question) for pattern in self._rules[name])
+        ]
+
+    # Decide a route locally, without calling any model
+    def classify(self, question: str) -> RouteDecision:
+        rule_hits = self._rule_hits(question)
+        scores = dict(self._index.query(question))
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+        if len(rule_hits) == 1:
+            route = rule_hits[0]
+            route_score = scores.get(route, 0.0)
+            confidence = RULE_CONFIDENCE + (1 - RULE_CONFIDENCE) * route_score
+            # Penalize when the example model clearly prefers another route
+            if ranked and ranked[0][0] != route:
+                confidence -= max(0.0, ranked[0][1] - route_score)
+            return RouteDecision(route, round(min(confidence, 1.0), 4), "rules")
+
+        if len(rule_hits) > 1:
+            # Conflicting keywords (e.g. "cats or dogs?") are left to the LLM
+            route = max(rule_hits, key=lambda name: scores.get(name, 0.0))
+            return RouteDecision(route, round(0.5 * scores.get(route, 0.0), 4), "rules")
+
+        if not ranked:
+            return RouteDecision(self.fallback, 0.0, "none")
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        return RouteDecision(ranked[0][0], round(max(0.0, ranked[0][1] - runner_up), 4), "similarity")
+
+    # Shortlist of routes for the orchestrator LLM to choose from: all of them when there are at most k, otherwise
+    # those whose keywords match first, then by similarity to their examples and description. The fallback is
+    # always on the list, and alone when nothing else resembles the question.
+    def candidates(self, question: str, k: int) -> list[str]:
+        if len(self.routes) <= k:
+            return list(self.routes)
+        scores = dict(self._index.query(question))
+        for route, score in self._descriptions.query(question):
+            scores[route] = max(score, scores.get(route, 0.0))
+        for route in self._rule_hits(question):
+            scores[route] = scores.get(route, 0.0) + 1.0
+        scores.pop(self.fallback, None)
+        return heapq.nlargest(k - 1, scores, key=scores.get) + [self.fallback]
+
+    # Local decision when confident, otherwise None; counts which path the question takes
+    def _fast_path(self, question: str) -> Optional[str]:
+        decision = self.classify(question)
+        if decision.confidence >= self.threshold:
+            with self._lock:
+                self._fast_path_hits += 1
+            logger.info(f"Fast-path routing to {decision.route} ({decision.source}, confidence {decision.confidence:.2f}).")
+            return decision.route
+
+        with self._lock:
+            self._llm_path_hits += 1
+        logger.info(f"Fast-path router not confident ({decision.route}, {decision.confidence:.2f}); asking the orchestrator LLM.")
+        return None
+
+    # Route a question, falling back to the LLM router for ambiguous questions
+    def route(self, question: str, llm_route: Callable[[str], str]) -> str:
+        route = self._fast_path(question)
+        return route if route is not None else llm_route(question)
+
+    async def aroute(self, question: str, llm_route: Callable[[str], Awaitable[str]]) -> str:
+        route = self._fast_path(question)
+        return route if route is not None else await llm_route(question)
+
+    def stats(self) -> dict:
+        with self._lock:
+            fast, llm = self._fast_path_hits, self._llm_path_hits
+        total = fast + llm
+        return {
+            "fast_path_hits": fast,
+            "llm_path_hits": llm,
+            "fast_path_ratio": fast / total if total else 0.0,
+        }
+
+    # Check local decisions against labelled examples; only confident decisions count towards accuracy
+    def evaluate(self, examples: list[tuple[str, str]]) -> dict:
+        confident = correct = 0
+        misroutes = []
+        for question, expected in examples:
+            decision = self.classify(question)
+            if decision.confidence < self.threshold:
+                continue
+            confident += 1
+            if decision.route == expected:
+                correct += 1
+            else:
+                misroutes.append((question, expected, decision.route))
+        return {
+            "examples": len(examples),
+            "fast_path": confident,
+            "coverage": confident / len(examples) if examples else 0.0,
+            "accuracy": correct / confident if confident else 0.0,
+            "misroutes": misroutes,
+        }
+
@@ -0,0 +1,267 @@
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Callable, Iterator, Optional, Union
+
+from langchain_core.messages import RemoveMessage
+from langchain_core.runnables import RunnableConfig
+
+from .checkpoints import DictSaver, SQLiteDeltaSaver
+
+logger = logging.getLogger(__name__)
+
+SESSION_HEADER = "X-Session-ID"
+SESSION_COOKIE = "session_id"
+
+_SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_.:-]{1,128}$")
+
+# Pick the session id from the header, then the cookie; mint a new one when neither is usable
+def resolve_session_id(header_value: Optional[str], cookie_value: Optional[str]) -> tuple[str, bool]:
+    for candidate in (header_value, cookie_value):
+        if candidate and _SESSION_ID_RE.match(candidate):
+            return candidate, False
+    return uuid.uuid4().hex, True
+
+def new_state() -> dict:
+    return {"messages": []}
+
+# Graph config that runs (and checkpoints) a turn in the session's thread
+def thread_config(session_id: str) -> RunnableConfig:
+    return {"configurable": {"thread_id": session_id}}
+
+
+class CheckpointSessionBackend:
+    """Session states kept as LangGraph checkpoint threads, so the graph and the session code share them.
+
+    The saver is a DictSaver, which keeps the states as they are, or a SQLiteDeltaSaver, where each
+    save writes only the messages added since the previous one. Messages get an id before they are
+    stored, which is what lets the next save tell old messages from new ones.
+    """
+
+    def __init__(self, saver: Union[DictSaver, SQLiteDeltaSaver]):
+        self.saver = saver
+
+    def __len__(self) -> int:
+        return self.saver.thread_count()
+
+    def load(self, session_id: str) -> Optional[dict]:
+        return self.saver.load_state(session_id)
+
+    def save(self, session_id: str, state: dict, touched_at: float) -> None:
+        for message in state.get("messages", []):
+            if not message.id:
+                message.id = str(uuid.uuid4())
+        self.saver.save_state(session_id, state, touched_at)
+
+    def delete(self, session_id: str) -> None:
+        self.saver.delete_thread(session_id)
+
+    def idle_sessions(self, cutoff: float) -> list[str]:
+        return self.saver.idle_threads(cutoff)
+
+    def overflow_sessions(self, max_sessions: int) -> list[str]:
+        return self.saver.overflow_threads(max_sessions)
+
+
+class SessionStore:
+    """Session-keyed conversation state with per-session locking, idle eviction and memory caps."""
+
+    def __init__(
+        self,
+        backend=None,
+        idle_ttl: float = 1800.0,
+        max_sessions: int = 1000,
+        max_messages: int = 200,
+        sweep_interval: float = 60.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.backend = backend if backend is not None else CheckpointSessionBackend(DictSaver())
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self.sweep_interval = sweep_interval
+        self._clock = clock
+        self._locks: dict[str, threading.Lock] = {}
+        self._async_locks: dict[str, asyncio.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._last_sweep = 0.0
+        self._evictions = 0
+
+    def _lock_for(self, session_id: str) -> threading.Lock:
+        with self._locks_guard:
+            lock = self._locks.get(session_id)
+            if lock is None:
+                lock = self._locks[session_id] = threading.Lock()
+            return lock
+
+    def _async_lock_for(self, session_id: str) -> asyncio.Lock:
+        with self._locks_guard:
+            lock = self._async_locks.get(session_id)
+            if lock is None:
+                lock = self._async_locks[session_id] = asyncio.Lock()
+            return lock
+
+    # Hold the session's lock from the event loop. Async turns of a session queue on an asyncio lock, so at most one
+    # of them waits in a worker thread for the session's lock, and only while a sync caller (e.g. eviction) holds it.
+    @asynccontextmanager
+    async def _alocked(self, session_id: str) -> AsyncIterator[None]:
+        async with self._async_lock_for(session_id):
+            lock = self._lock_for(session_id)
+            if not lock.acquire(blocking=False):
+                acquiring = asyncio.ensure_future(asyncio.to_thread(lock.acquire))
+                try:
+                    await asyncio.shield(acquiring)
+                except asyncio.CancelledError:
+                    # The worker thread still takes the lock; hand it back once it does
+                    acquiring.add_done_callback(lambda _: lock.release())
+                    raise
+            try:
+                yield
+            finally:
+                lock.release()
+
+    # Evict the least recently active sessions beyond max_sessions
+    def _enforce_cap(self) -> None:
+        if len(self.backend) > self.max_sessions:
+            self._evict(self.backend.overflow_sessions(self.max_sessions), reason="session cap")
+
+    # Hold the session's lock for the duration of a turn; the state is saved only if the block succeeds
+    @contextmanager
+    def session(self, session_id: str) -> Iterator[dict]:
+        self._maybe_sweep()
+        with self._lock_for(session_id):
+            state = self.backend.load(session_id) or new_state()
+            yield state
+            self._trim(state)
+            self.backend.save(session_id, state, self._clock())
+        self._enforce_cap()
+
+    # Async variant for the ASGI server: waits for the session lock without blocking the event loop
+    # and runs backend I/O in a worker thread
+    @asynccontextmanager
+    async def asession(self, session_id: str) -> AsyncIterator[dict]:
+        await asyncio.to_thread(self._maybe_sweep)
+        async with self._alocked(session_id):
+            state = await asyncio.to_thread(self.backend.load, session_id) or new_state()
+            yield state
+            self._trim(state)
+            await asyncio.to_thread(self.backend.save, session_id, state, self._clock())
+        await asyncio.to_thread(self._enforce_cap)
+
+    # Hold the session's lock while the graph runs a turn in the session's thread; the graph's
+    # checkpointer loads and saves the state itself
+    @contextmanager
+    def thread(self, session_id: str) -> Iterator[RunnableConfig]:
+        self._maybe_sweep()
+        with self._lock_for(session_id):
+            yield thread_config(session_id)
+        self._enforce_cap()
+
+    @asynccontextmanager
+    async def athread(self, session_id: str) -> AsyncIterator[RunnableConfig]:
+        await asyncio.to_thread(self._maybe_sweep)
+        async with self._alocked(session_id):
+            yield thread_config(session_id)
+        await asyncio.to_thread(self._enforce_cap)
+
+    # The saver graphs compile with, so graph runs and sessions share threads
+    @property
+    def checkpointer(self) -> Union[DictSaver, SQLiteDeltaSaver]:
+        return self.backend.saver
+
+    def get(self, session_id: str) -> dict:
+        return self.backend.load(session_id) or new_state()
+
+    def delete(self, session_id: str) -> None:
+        with self._lock_for(session_id):
+            self.backend.delete(session_id)
+        with self._locks_guard:
+            self._locks.pop(session_id, None)
+            self._async_locks.pop(session_id, None)
+
+    # Cap the per-session history; older messages are dropped first
+    def _trim(self, state: dict) -> None:
+        messages = state.get("messages", [])
+        if self.max_messages and len(messages) > self.max_messages:
+            dropped = len(messages) - self.max_messages
+            state["messages"] = messages[dropped:]
+            # Dropped messages were the oldest, so they leave the summarized prefix first
+            if state.get("summarized"):
+                state["summarized"] = max(0, state["summarized"] - dropped)
+
+    # A graph node's update in the form the add_messages channel merges cheaply: only the messages the turn
+    # added (agents return the whole history), plus removals for the oldest beyond max_messages
+    def turn_update(self, state: dict, update: dict) -> dict:
+        history = state.get("messages", [])
+        messages = update.get("messages", [])
+        if len(messages) >= len(history) and all(a is b for a, b in zip(messages, history)):
+            added = messages[len(history):]
+        else:
+            added, history = messages, []
+        dropped = len(history) + len(added) - self.max_messages
+        if not self.max_messages or dropped <= 0:
+            return {**update, "messages": added}
+        removed = [RemoveMessage(id=message.id) for message in (history + added)[:dropped]]
+        trimmed = {**update, "messages": added + removed}
+        summarized = update.get("summarized", state.get("summarized"))
+        if summarized:
+            trimmed["summarized"] = max(0, summarized - dropped)
+        return trimmed
+
+    def _maybe_sweep(self) -> None:
+        now = self._clock()
+        if now - self._last_sweep < self.sweep_interval:
+            return
+        self._last_sweep = now
+        self._evict(self.backend.idle_sessions(now - self.idle_ttl), reason="idle")
+
+    def _evict(self, session_ids: list[str], reason: str) -> None:
+        evicted = 0
+        for session_id in session_ids:
+            lock = self._lock_for(session_id)
+            # Skip sessions that are mid-turn; they will be reconsidered on the next sweep
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                self.backend.delete(session_id)
+                evicted += 1
+            finally:
+                lock.release()
+            with self._locks_guard:
+                self._locks.pop(session_id, None)
+                self._async_locks.pop(session_id, None)
+        if evicted:
+            self._evictions += evicted
+            logger.info(f"Evicted {evicted} session(s) ({reason}).")
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self.backend),
+            "max_sessions": self.max_sessions,
+            "evictions": self._evictions,
+            "backend": type(self.backend).__name__,
+            "checkpoints": self.checkpointer.stats(),
+        }
+
+
+# Build the session store described by the SESSION_* environment variables. "sqlite" keeps conversations
+# across restarts and shares them between processes; "memory" keeps them in a dict for the life of the process.
+def session_store_from_env() -> SessionStore:
+    backend_name = os.getenv("SESSION_BACKEND", "memory").lower()
+    if backend_name == "sqlite":
+        saver = SQLiteDeltaSaver(os.getenv("SESSION_DB_PATH", "sessions.db"))
+    elif backend_name == "memory":
+        saver = DictSaver()
+    else:
+        raise ValueError(f"Unknown SESSION_BACKEND: {backend_name}")
+    return SessionStore(
+        CheckpointSessionBackend(saver),
+        idle_ttl=float(os.getenv("SESSION_IDLE_TTL", 1800)),
+        max_sessions=int(os.getenv("SESSION_MAX_SESSIONS", 1000)),
+        max_messages=int(os.getenv("SESSION_MAX_MESSAGES", 200)),
+    )
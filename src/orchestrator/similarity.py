@@ -0,0 +1,101 @@
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Hashable, Optional
+
+# Words that carry no routing signal and would otherwise dominate short queries
+STOPWORDS = frozenset({
+    "a", "an", "and", "are", "about", "as", "at", "be", "can", "could", "do", "does", "for", "from",
+    "i", "id", "i'd", "i'm", "im", "in", "is", "it", "me", "my", "of", "on", "or", "please", "some",
+    "that", "the", "this", "to", "what", "with", "would", "you", "your",
+})
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+# Lowercase word tokens with a crude plural fold so "cats" and "cat" share a feature
+def tokenize(text: str) -> list[str]:
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        token = token.strip("'")
+        if not token or token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+# Cosine similarity between two sparse vectors that are already L2-normalized
+def cosine(a: dict[str, float], b: dict[str, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(weight * b.get(token, 0.0) for token, weight in a.items())
+
+def _normalize(weights: dict[str, float]) -> dict[str, float]:
+    norm = math.sqrt(sum(w * w for w in weights.values()))
+    if not norm:
+        return {}
+    return {token: w / norm for token, w in weights.items()}
+
+
+class VectorIndex:
+    """Tiny TF-IDF nearest-neighbour index over labelled example texts."""
+
+    def __init__(self):
+        self._documents: list[tuple[Counter, Hashable]] = []
+        self._vectors: list[dict[str, float]] = []
+        self._postings: dict[str, list[int]] = {}
+        self._idf: dict[str, float] = {}
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def add(self, text: str, label: Hashable) -> None:
+        self._documents.append((Counter(tokenize(text)), label))
+        self._dirty = True
+
+    # Drop every example carrying the label; the index is refitted on the next query
+    def discard(self, label: Hashable) -> None:
+        remaining = [document for document in self._documents if document[1] != label]
+        if len(remaining) != len(self._documents):
+            self._documents = remaining
+            self._dirty = True
+
+    def _fit(self) -> None:
+        doc_freq = Counter()
+        for counts, _ in self._documents:
+            doc_freq.update(counts.keys())
+        total = len(self._documents)
+        self._idf = {token: math.log((1 + total) / (1 + df)) + 1.0 for token, df in doc_freq.items()}
+        self._vectors = []
+        postings = defaultdict(list)
+        for doc_id, (counts, _) in enumerate(self._documents):
+            self._vectors.append(_normalize({t: c * self._idf[t] for t, c in counts.items()}))
+            for token in counts:
+                postings[token].append(doc_id)
+        self._postings = dict(postings)
+        self._dirty = False
+
+    # Vectorize a query against the index vocabulary; unknown words get the maximum IDF
+    # so that off-topic words dilute the similarity instead of being ignored
+    def vectorize(self, text: str) -> dict[str, float]:
+        if self._dirty:
+            self._fit()
+        unknown_idf = math.log(1 + len(self._documents)) + 1.0
+        counts = Counter(tokenize(text))
+        return _normalize({t: c * self._idf.get(t, unknown_idf) for t, c in counts.items()})
+
+    # Best similarity per label, highest first
+    def query(self, text: str, k: Optional[int] = None) -> list[tuple[Hashable, float]]:
+        vector = self.vectorize(text)
+        if not vector:
+            return []
+        candidates = {doc_id for token in vector for doc_id in self._postings.get(token, ())}
+        best: dict[Hashable, float] = {}
+        for doc_id in candidates:
+            label = self._documents[doc_id][1]
+            score = cosine(vector, self._vectors[doc_id])
+            if score > best.get(label, 0.0):
+                best[label] = score
+        ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:k] if k else ranked
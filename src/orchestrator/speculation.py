@@ -0,0 +1,125 @@
+import asyncio
+import contextvars
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _name(route: Any) -> str:
+    return getattr(route, "__name__", str(route))
+
+
+class Speculator:
+    """Starts the most likely agent while the orchestrator LLM is still deciding.
+
+    Routes are whatever the caller dispatches on (agent functions here); the speculative
+    answer is kept when the chosen route matches and discarded otherwise. Routes with side
+    effects (sending email, creating events) are never speculated on.
+    """
+
+    def __init__(self, enabled: bool = False, max_workers: int = 8, unsafe_routes: Iterable[Any] = ()):
+        self.enabled = enabled
+        self.unsafe_routes = frozenset(unsafe_routes)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculation") if enabled else None
+        self._lock = threading.Lock()
+        self._started = 0
+        self._hits = 0
+        self._misses = 0
+        self._wasted_calls = 0
+
+    def begin(self, predicted: Optional[Any], run: Callable[[Any], dict]) -> "Speculation":
+        return Speculation(self, predicted if self._allowed(predicted) else None, run)
+
+    def abegin(self, predicted: Optional[Any], run: Callable[[Any], Awaitable[dict]]) -> "AsyncSpeculation":
+        return AsyncSpeculation(self, predicted if self._allowed(predicted) else None, run)
+
+    def _allowed(self, route: Optional[Any]) -> bool:
+        return self.enabled and route is not None and route not in self.unsafe_routes
+
+    def _record(self, hit: bool, wasted: bool = False) -> None:
+        with self._lock:
+            if hit:
+                self._hits += 1
+            else:
+                self._misses += 1
+                self._wasted_calls += wasted
+
+    def stats(self) -> dict:
+        with self._lock:
+            settled = self._hits + self._misses
+            return {
+                "enabled": self.enabled,
+                "speculations": self._started,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / settled if settled else 0.0,
+                "wasted_upstream_calls": self._wasted_calls,
+            }
+
+
+class Speculation:
+    """One turn's speculative run on a worker thread."""
+
+    def __init__(self, speculator: Speculator, predicted: Optional[Any], run: Callable[[Any], dict]):
+        self._speculator = speculator
+        self.predicted = predicted
+        self._run = run
+        self._future: Optional[Future] = None
+
+    # Called right before the orchestrator LLM is asked; cached and fast-path routes never speculate
+    def start(self) -> None:
+        if self.predicted is None or self._future is not None:
+            return
+        context = contextvars.copy_context()
+        self._future = self._speculator._executor.submit(context.run, self._run, self.predicted)
+        with self._speculator._lock:
+            self._speculator._started += 1
+        logger.info(f"Speculatively running {_name(self.predicted)} while the orchestrator decides.")
+
+    # Answer for the route the orchestrator picked, reusing the speculative run when it matches
+    def finish(self, route: Any) -> dict:
+        if self._future is None:
+            return self._run(route)
+        if route == self.predicted:
+            self._speculator._record(hit=True)
+            logger.info(f"Speculation hit: {_name(route)}.")
+            return self._future.result()
+        # A run that could not be cancelled has already called (or is calling) the upstream model
+        wasted = not self._future.cancel()
+        self._speculator._record(hit=False, wasted=wasted)
+        logger.info(f"Speculation miss: predicted {_name(self.predicted)}, routed to {_name(route)}.")
+        return self._run(route)
+
+
+class AsyncSpeculation:
+    """One turn's speculative run as an asyncio task."""
+
+    def __init__(self, speculator: Speculator, predicted: Optional[Any], run: Callable[[Any], Awaitable[dict]]):
+        self._speculator = speculator
+        self.predicted = predicted
+        self._run = run
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self.predicted is None or self._task is not None:
+            return
+        self._task = asyncio.ensure_future(self._run(self.predicted))
+        with self._speculator._lock:
+            self._speculator._started += 1
+        logger.info(f"Speculatively running {_name(self.predicted)} while the orchestrator decides.")
+
+    async def finish(self, route: Any) -> dict:
+        if self._task is None:
+            return await self._run(route)
+        if route == self.predicted:
+            self._speculator._record(hit=True)
+            logger.info(f"Speculation hit: {_name(route)}.")
+            return await self._task
+        # The task has been running since start(), so its upstream call is wasted even if cancelled now
+        self._task.cancel()
+        self._speculator._record(hit=False, wasted=True)
+        logger.info(f"Speculation miss: predicted {_name(self.predicted)}, routed to {_name(route)}.")
+        return await self._run(route)
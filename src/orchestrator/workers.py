@@ -0,0 +1,191 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Iterable, Optional
+
+from werkzeug.wsgi import ClosingIterator
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerHealth:
+    """Request counters for this server process, shared with the other workers of a pre-fork server.
+
+    Every worker writes a heartbeat row to a local SQLite file every `interval` seconds from a
+    background thread, so /health on any worker can list them all. A row not refreshed for three
+    intervals is reported as stale. Without a path only this process is reported.
+
+    With `metrics` (a MetricsRegistry snapshot function), each heartbeat also records this worker's
+    metric series, so /metrics on any worker can export every live worker's, at most one interval old.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        interval: float = 5.0,
+        clock: Callable[[], float] = time.time,
+        metrics: Optional[Callable[[], dict]] = None,
+    ):
+        self.path = path
+        self.interval = interval
+        self.metrics = metrics
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._started_pid: Optional[int] = None
+        self._local = threading.local()
+        self._reset()
+        if path:
+            with self._db() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS workers ("
+                    "pid INTEGER PRIMARY KEY, started_at REAL NOT NULL, heartbeat_at REAL NOT NULL, snapshot TEXT NOT NULL)"
+                )
+                conn.execute("CREATE TABLE IF NOT EXISTS worker_metrics (pid INTEGER PRIMARY KEY, metrics TEXT NOT NULL)")
+
+    def _reset(self) -> None:
+        self._started_at = self._clock()
+        self._requests = 0
+        self._in_flight = 0
+        self._errors = 0
+        self._last_request_at: Optional[float] = None
+
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    # Start counting for this process and, with a path, its heartbeat thread. Counters inherited from the
+    # process that forked this one (e.g. a pre-fork server's master) are discarded.
+    def ensure_started(self) -> None:
+        if self._started_pid == os.getpid():
+            return
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            self._reset()
+            self._stopping = threading.Event()
+            self._local = threading.local()
+            self._started_pid = os.getpid()
+        if self.path:
+            self._beat()
+            threading.Thread(target=self._heartbeat, name="worker-heartbeat", daemon=True).start()
+
+    def _heartbeat(self) -> None:
+        stopping = self._stopping
+        while not stopping.wait(self.interval):
+            self._beat()
+
+    def _beat(self) -> None:
+        snapshot = self.snapshot()
+        try:
+            with self._db() as conn:
+                conn.execute(
+                    "INSERT INTO workers (pid, started_at, heartbeat_at, snapshot) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(pid) DO UPDATE SET started_at = excluded.started_at, heartbeat_at = excluded.heartbeat_at, snapshot = excluded.snapshot",
+                    (snapshot["pid"], self._started_at, self._clock(), json.dumps(snapshot)),
+                )
+                if self.metrics is not None:
+                    conn.execute(
+                        "INSERT INTO worker_metrics (pid, metrics) VALUES (?, ?) "
+                        "ON CONFLICT(pid) DO UPDATE SET metrics = excluded.metrics",
+                        (snapshot["pid"], json.dumps(self.metrics())),
+                    )
+        except sqlite3.Error as e:
+            logger.warning(f"\033[93mCould not record the worker heartbeat: {str(e)}\033[0m")
+
+    # Stop reporting this process, e.g. when a worker exits after draining its requests
+    def stop(self) -> None:
+        self._stopping.set()
+        if self.path and self._started_pid == os.getpid():
+            self.forget(os.getpid())
+        self._started_pid = None
+
+    # Drop a worker's row; the server's master does this for workers that died without stopping
+    def forget(self, pid: int) -> None:
+        if self.path:
+            with self._db() as conn:
+                conn.execute("DELETE FROM workers WHERE pid = ?", (pid,))
+                conn.execute("DELETE FROM worker_metrics WHERE pid = ?", (pid,))
+
+    def request_started(self) -> None:
+        self.ensure_started()
+        with self._lock:
+            self._requests += 1
+            self._in_flight += 1
+            self._last_request_at = self._clock()
+
+    def request_finished(self, status: int) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            if status >= 500:
+                self._errors += 1
+
+    # WSGI middleware that counts requests; a streamed response counts as in flight until its body is closed
+    def wsgi(self, app: Callable) -> Callable:
+        def counted(environ: dict, start_response: Callable) -> Iterable[bytes]:
+            status = [500]
+
+            def recording_start_response(status_line: str, headers: list, exc_info=None):
+                status[0] = int(status_line[:3])
+                return start_response(status_line, headers, exc_info)
+
+            self.request_started()
+            try:
+                body = app(environ, recording_start_response)
+            except BaseException:
+                self.request_finished(500)
+                raise
+            return ClosingIterator(body, lambda: self.request_finished(status[0]))
+
+        return counted
+
+    def snapshot(self) -> dict:
+        now = self._clock()
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "uptime_seconds": round(now - self._started_at, 1),
+                "requests": self._requests,
+                "in_flight": self._in_flight,
+                "errors": self._errors,
+                "idle_seconds": round(now - self._last_request_at, 1) if self._last_request_at is not None else None,
+            }
+
+    # Every worker's last heartbeat; this process's entry is always current
+    def workers(self) -> list[dict]:
+        if not self.path:
+            return [self.snapshot()]
+        now = self._clock()
+        rows = self._db().execute("SELECT pid, heartbeat_at, snapshot FROM workers ORDER BY pid").fetchall()
+        workers = []
+        for pid, heartbeat_at, snapshot in rows:
+            entry = self.snapshot() if pid == os.getpid() else json.loads(snapshot)
+            entry["heartbeat_age_seconds"] = 0.0 if pid == os.getpid() else round(now - heartbeat_at, 1)
+            entry["stale"] = entry["heartbeat_age_seconds"] > 3 * self.interval
+            workers.append(entry)
+        return workers
+
+    # Metric snapshots of every worker whose heartbeat is current, by pid; this process's is taken now.
+    # None without a path or metrics, when only this process is reported.
+    def worker_metrics(self) -> Optional[dict[str, dict]]:
+        if not self.path or self.metrics is None:
+            return None
+        cutoff = self._clock() - 3 * self.interval
+        rows = self._db().execute(
+            "SELECT m.pid, m.metrics FROM worker_metrics m JOIN workers w ON w.pid = m.pid WHERE w.heartbeat_at >= ?", (cutoff,)
+        ).fetchall()
+        workers = {str(pid): json.loads(metrics) for pid, metrics in rows if pid != os.getpid()}
+        workers[str(os.getpid())] = self.metrics()
+        return workers
+
+
+# SERVER_HEALTH_PATH names the file the workers of a pre-fork server share their health through (serve.py sets it)
+def worker_health_from_env(metrics: Optional[Callable[[], dict]] = None) -> WorkerHealth:
+    return WorkerHealth(os.getenv("SERVER_HEALTH_PATH") or None, interval=float(os.getenv("SERVER_HEALTH_INTERVAL", 5)), metrics=metrics)
@@ -0,0 +1,111 @@
+import logging
+import multiprocessing
+import os
+from importlib import import_module
+
+from gunicorn.app.base import BaseApplication
+
+from orchestrator.workers import worker_health_from_env
+
+logger = logging.getLogger(__name__)
+
+# Production server for the Flask app of app.py (SERVER_APP=develop serves develop.py's): a gunicorn master
+# imports the app once, then forks SERVER_WORKERS workers that each serve up to SERVER_THREADS requests at a time.
+#
+#   python src/serve.py
+#   kill -HUP <master pid>    # start fresh workers; the old ones finish their requests first
+#   kill -TERM <master pid>   # stop accepting, drain for up to SERVER_GRACEFUL_TIMEOUT seconds, exit
+#
+# Prompts, router tables and the compiled graph are built before the fork and shared by every worker. For the
+# same reason HUP restarts workers without reloading code; deploy new code with USR2 (a new master starts next
+# to the old one) followed by TERM to the old master, or set SERVER_PRELOAD=0 to have every worker import the
+# app itself and HUP reload it.
+#
+# Everything else is per worker process. Each worker has its own model gateway, so each gets 1/SERVER_WORKERS of
+# every requests- and tokens-per-minute budget in models.json, which keeps the server as a whole within the upstream
+# account's limits (a worker cannot borrow an idle worker's share). The gateway and circuit figures at /health
+# describe the worker that answered. /metrics exports every live worker's series, labelled with its pid as
+# "worker" and at most one SERVER_HEALTH_INTERVAL old for the other workers; sum by the other labels to aggregate.
+
+
+class ChatServer(BaseApplication):
+    """Gunicorn application serving `flask_app` from the module named by SERVER_APP."""
+
+    def __init__(self, module_name: str, options: dict):
+        self.module_name = module_name
+        self.module = None
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for name, value in self.options.items():
+            self.cfg.set(name, value)
+
+    def load(self):
+        self.module = import_module(self.module_name)
+        if os.getenv("SESSION_BACKEND", "").lower() == "memory" and self.cfg.workers > 1:
+            logger.warning("\033[93mSESSION_BACKEND=memory keeps each conversation in one worker; "
+                           "use sqlite so a session can land on any worker.\033[0m")
+        return self.module.flask_app
+
+
+# Gunicorn server hooks; `server` is the master (arbiter), `worker` the worker process. The worker hooks run
+# once the worker has the app, preloaded or not.
+def when_ready(server) -> None:
+    logger.info(f"Serving {server.app.module_name} on {', '.join(str(listener) for listener in server.LISTENERS)} "
+                f"with {server.cfg.workers} workers x {server.cfg.threads} threads.")
+
+def post_worker_init(worker) -> None:
+    module = worker.app.module
+    if worker.cfg.workers > 1:
+        module.model_registry.gateway.split_limits(worker.cfg.workers)
+    module.worker_health.ensure_started()
+    logger.info(f"Worker {worker.pid} started with 1/{worker.cfg.workers} of each model's rate limits.")
+
+def worker_exit(server, worker) -> None:
+    if worker.app.module is None:
+        return
+    health = worker.app.module.worker_health
+    logger.info(f"Worker {worker.pid} exiting after {health.snapshot()['requests']} requests.")
+    health.stop()
+
+# Runs in the master when a worker is gone, including one killed before it could clean up. The master may not
+# have imported the app, so it reaches the shared health file on its own.
+def child_exit(server, worker) -> None:
+    worker_health_from_env().forget(worker.pid)
+
+
+def server_options_from_env() -> dict:
+    return {
+        "bind": os.getenv("SERVER_BIND", f"{os.getenv('HOST', '127.0.0.1')}:{os.getenv('PORT', 5000)}"),
+        "workers": int(os.getenv("SERVER_WORKERS", multiprocessing.cpu_count() * 2 + 1)),
+        # Threads, because a worker spends most of a request waiting on the model
+        "worker_class": "gthread",
+        "threads": int(os.getenv("SERVER_THREADS", 8)),
+        "preload_app": os.getenv("SERVER_PRELOAD", "1") == "1",
+        # gthread workers keep notifying the master during long requests, so this only catches a stuck worker
+        "timeout": int(os.getenv("SERVER_TIMEOUT", 120)),
+        "graceful_timeout": int(os.getenv("SERVER_GRACEFUL_TIMEOUT", 30)),
+        "keepalive": int(os.getenv("SERVER_KEEPALIVE", 5)),
+        # Recycle a worker after this many requests (0 never does), with jitter so they do not all restart at once
+        "max_requests": int(os.getenv("SERVER_MAX_REQUESTS", 0)),
+        "max_requests_jitter": int(os.getenv("SERVER_MAX_REQUESTS_JITTER", 0)),
+        "proc_name": "minion-chat",
+        "when_ready": when_ready,
+        "post_worker_init": post_worker_init,
+        "worker_exit": worker_exit,
+        "child_exit": child_exit,
+    }
+
+
+def main():
+    # Workers share conversations and health through local SQLite files, and leave log rotation to an outside
+    # tool (e.g. logrotate with copytruncate), since several processes cannot safely rotate one file
+    os.environ.setdefault("SESSION_BACKEND", "sqlite")
+    os.environ.setdefault("SERVER_HEALTH_PATH", "server_health.db")
+    os.environ.setdefault("LOG_MAX_BYTES", "0")
+    ChatServer(os.getenv("SERVER_APP", "app"), server_options_from_env()).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+from orchestrator.batch import parse_batch_items
+
+
+def test_items_keep_their_index_and_session():
+    items, error = parse_batch_items({"items": [{"userquestion": "hi", "session_id": "s-1"}, {"userquestion": "yo"}]}, 10)
+    assert error is None
+    assert items[0] == {"index": 0, "session_id": "s-1", "question": "hi"}
+    assert items[1]["index"] == 1 and items[1]["question"] == "yo"
+    assert items[1]["session_id"] and items[1]["session_id"] != "s-1"
+
+
+def test_malformed_items_carry_an_error():
+    items, error = parse_batch_items({"items": ["hi", {"userquestion": 3}, {"userquestion": "ok"}]}, 10)
+    assert error is None
+    assert [item.get("error") is not None for item in items] == [True, True, False]
+    assert [item["index"] for item in items] == [0, 1, 2]
+
+
+def test_invalid_session_ids_are_replaced():
+    items, _ = parse_batch_items({"items": [{"userquestion": "hi", "session_id": "not valid!"}]}, 10)
+    assert items[0]["session_id"] != "not valid!"
+
+
+def test_body_without_an_items_list_is_rejected():
+    for body in (None, [], {"items": "hi"}, {"questions": []}):
+        items, error = parse_batch_items(body, 10)
+        assert items == [] and "items" in error
+
+
+def test_too_many_items_are_rejected():
+    items, error = parse_batch_items({"items": [{"userquestion": "q"}] * 3}, 2)
+    assert items == [] and "at most 2" in error
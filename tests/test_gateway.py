@@ -0,0 +1,71 @@
+import pytest
+
+from config.gateway import ModelGateway, RateLimitExceeded, TokenBucket
+
+
+def test_token_bucket_starts_full_and_waits_out_a_deficit(clock):
+    bucket = TokenBucket(60, clock)  # one per second
+    assert bucket.reserve(60) == 0.0
+    assert bucket.reserve(2) == pytest.approx(2.0)
+    assert bucket.available == pytest.approx(-2.0)
+
+
+def test_token_bucket_refills_up_to_one_minute(clock):
+    bucket = TokenBucket(60, clock)
+    bucket.reserve(30)
+    clock.advance(10)
+    assert bucket.available == pytest.approx(40.0)
+    clock.advance(600)
+    assert bucket.available == pytest.approx(60.0)
+
+
+def test_token_bucket_refund_is_capped(clock):
+    bucket = TokenBucket(60, clock)
+    bucket.reserve(5)
+    bucket.refund(10)
+    assert bucket.available == pytest.approx(60.0)
+
+
+def test_reserve_admits_within_the_budget(clock):
+    gateway = ModelGateway({"m": {"requests_per_minute": 2}}, clock=clock)
+    for _ in range(2):
+        budget, wait = gateway._reserve("m", 10)
+        assert wait == 0.0
+    assert budget.admitted == 2
+    assert budget.delayed == 0
+
+
+def test_reserve_queues_past_the_budget(clock):
+    gateway = ModelGateway({"m": {"requests_per_minute": 60, "tokens_per_minute": 600}}, max_wait=30, clock=clock)
+    gateway._reserve("m", 600)
+    budget, wait = gateway._reserve("m", 100)
+    assert wait == pytest.approx(10.0)  # the token budget is the one that runs out
+    assert budget.delayed == 1
+    assert budget.waiting == 1
+
+
+def test_reserve_rejects_a_wait_over_max_wait_and_refunds(clock):
+    gateway = ModelGateway({"m": {"tokens_per_minute": 60}}, max_wait=5, clock=clock)
+    gateway._reserve("m", 60)
+    with pytest.raises(RateLimitExceeded):
+        gateway._reserve("m", 10)
+    budget = gateway._budget("m")
+    assert budget.rejected == 1
+    assert budget.tokens.available == pytest.approx(0.0)
+
+
+def test_reserve_uses_the_default_limit_and_ignores_unlimited_models(clock):
+    gateway = ModelGateway({"default": {"requests_per_minute": 1}}, max_wait=0, clock=clock)
+    gateway._reserve("any", 1)
+    with pytest.raises(RateLimitExceeded):
+        gateway._reserve("any", 1)
+    assert ModelGateway({}, clock=clock)._reserve("free", 10**6)[1] == 0.0
+
+
+def test_split_limits_divides_every_budget(clock):
+    gateway = ModelGateway({"m": {"requests_per_minute": 90}}, max_wait=0, clock=clock)
+    gateway.split_limits(3)
+    for _ in range(30):
+        gateway._reserve("m", 1)
+    with pytest.raises(RateLimitExceeded):
+        gateway._reserve("m", 1)
@@ -0,0 +1,51 @@
+from langchain.schema import AIMessage, HumanMessage, SystemMessage
+
+from minions.history import HistoryManager, message_tokens
+
+
+def conversation(turns: int, words: int = 40) -> list:
+    text = " ".join(["word"] * words)
+    messages = []
+    for n in range(turns):
+        messages += [HumanMessage(content=f"question {n} {text}"), AIMessage(content=f"answer {n} {text}")]
+    return messages
+
+
+def test_short_history_is_sent_verbatim():
+    history = conversation(2)
+    window = HistoryManager(default_budget=4096).window(history, "model")
+    assert window.chat_history == history
+    assert window.summarized == 0 and window.summary == ""
+    assert window.tokens_sent == window.tokens_full
+
+
+def test_long_history_folds_older_turns_into_a_summary():
+    history = conversation(20)
+    manager = HistoryManager(default_budget=600, keep_recent=4, summary_tokens=100)
+    window = manager.window(history, "model")
+    assert window.summarized > 0
+    assert isinstance(window.chat_history[0], SystemMessage)
+    assert window.chat_history[1:] == history[window.summarized:]
+    assert len(window.chat_history) - 1 >= 4
+    assert window.tokens_sent <= 600
+    assert window.folded == history[:window.summarized]
+
+
+def test_next_turn_continues_from_the_previous_summary():
+    manager = HistoryManager(default_budget=600, keep_recent=4, summary_tokens=100)
+    history = conversation(20)
+    first = manager.window(history, "model")
+    second = manager.window(history + conversation(1), "model", summary=first.summary, summarized=first.summarized)
+    assert second.summarized >= first.summarized
+    assert second.tokens_sent <= 600
+
+
+def test_recent_turns_are_dropped_when_they_alone_exceed_the_budget():
+    history = conversation(3, words=400)
+    window = HistoryManager(default_budget=300, keep_recent=6).window(history, "model")
+    assert sum(message_tokens(message) for message in window.chat_history) <= 300
+
+
+def test_budget_is_capped_by_the_context_window():
+    manager = HistoryManager(default_budget=100_000, reserve_tokens=1024)
+    assert manager.budget_for("llama3-groq-70b-8192-tool-use-preview", fixed_tokens=100) == 8192 - 1024 - 100
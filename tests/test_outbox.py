@@ -0,0 +1,87 @@
+import pytest
+
+from integrations.lazy import IntegrationUnavailable
+from integrations.outbox import DONE, FAILED, PENDING, Outbox
+
+
+class Handler:
+    """Answers each batch with the next list of results, or raises the next exception."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.batches = []
+
+    def __call__(self, payloads):
+        self.batches.append(payloads)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+
+class HttpError(Exception):
+    def __init__(self, status: int):
+        super().__init__(f"HTTP {status}")
+        self.resp = type("Response", (), {"status": status})()
+
+
+@pytest.fixture
+def make_outbox(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr("integrations.outbox.random.uniform", lambda low, high: high)
+
+    def make(handler, **kwargs) -> Outbox:
+        return Outbox(str(tmp_path / "outbox.db"), {"send": handler}, clock=clock, **kwargs)
+    return make
+
+
+def test_delivers_due_jobs_in_one_batch(make_outbox):
+    handler = Handler([{"id": 1}, {"id": 2}])
+    outbox = make_outbox(handler)
+    jobs = [outbox.enqueue("send", {"to": name}) for name in ("a", "b")]
+    assert outbox.run_once("send") == 2
+    assert handler.batches == [[{"to": "a"}, {"to": "b"}]]
+    assert [outbox.status(job.id)["status"] for job in jobs] == [DONE, DONE]
+    assert outbox.run_once("send") == 0
+
+
+def test_retryable_failure_backs_off_exponentially(make_outbox, clock):
+    handler = Handler(IntegrationUnavailable("down"), [HttpError(503)], ["ok"])
+    outbox = make_outbox(handler, backoff=2.0)
+    job = outbox.enqueue("send", {"to": "a"})
+
+    outbox.run_once("send")
+    assert outbox.status(job.id)["status"] == PENDING
+    clock.advance(1.9)
+    assert outbox.run_once("send") == 0  # first retry is due after 2s
+    clock.advance(0.1)
+    assert outbox.run_once("send") == 1
+    clock.advance(3.9)
+    assert outbox.run_once("send") == 0  # second retry is due after 4s
+    clock.advance(0.1)
+    assert outbox.run_once("send") == 1
+    status = outbox.status(job.id)
+    assert (status["status"], status["attempts"]) == (DONE, 3)
+
+
+def test_gives_up_after_max_attempts(make_outbox, clock):
+    outbox = make_outbox(Handler(*[[HttpError(500)]] * 2), max_attempts=2, backoff=1.0)
+    job = outbox.enqueue("send", {"to": "a"})
+    outbox.run_once("send")
+    clock.advance(1)
+    outbox.run_once("send")
+    status = outbox.status(job.id)
+    assert (status["status"], status["attempts"]) == (FAILED, 2)
+
+
+def test_client_errors_are_not_retried(make_outbox):
+    outbox = make_outbox(Handler([HttpError(400)]))
+    job = outbox.enqueue("send", {"to": "a"})
+    outbox.run_once("send")
+    assert outbox.status(job.id)["status"] == FAILED
+
+
+def test_enqueueing_an_idempotency_key_twice_returns_the_first_job(make_outbox):
+    outbox = make_outbox(Handler())
+    first = outbox.enqueue("send", {"to": "a"}, idempotency_key="k")
+    second = outbox.enqueue("send", {"to": "a"}, idempotency_key="k")
+    assert second.id == first.id and second.duplicate
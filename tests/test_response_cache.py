@@ -0,0 +1,59 @@
+from langchain.schema import AIMessage, HumanMessage
+
+from minions.response_cache import ResponseCache
+
+
+def make_cache(clock, **kwargs) -> ResponseCache:
+    return ResponseCache(clock=clock, **kwargs)
+
+
+def test_miss_then_exact_hit_on_the_normalized_question(clock):
+    cache = make_cache(clock)
+    assert cache.get("cat", "Why do cats purr?") is None
+    cache.put("cat", "Why do cats purr?", "Contentment.", 1.5)
+    hit = cache.get("cat", "why do cats purr")
+    assert (hit.content, hit.match, hit.score) == ("Contentment.", "exact", 1.0)
+    assert cache.stats()["minions"]["cat"]["exact_hits"] == 1
+
+
+def test_similar_hit_for_a_near_duplicate(clock):
+    cache = make_cache(clock, similarity_threshold=0.5)
+    cache.put("cat", "why do cats purr so much", "Contentment.", 1.0)
+    hit = cache.get("cat", "why do cats purr")
+    assert hit is not None and hit.match == "similar"
+
+
+def test_answers_are_kept_per_minion_and_per_context(clock):
+    cache = make_cache(clock)
+    history = [HumanMessage(content="hi"), AIMessage(content="hello")]
+    cache.put("cat", "tell me more", "About cats.", 1.0, history)
+    assert cache.get("dog", "tell me more", history) is None
+    assert cache.get("cat", "tell me more") is None
+    assert cache.get("cat", "tell me more", history).content == "About cats."
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = make_cache(clock, ttl=60)
+    cache.put("cat", "q", "a", 1.0)
+    clock.advance(61)
+    assert cache.get("cat", "q") is None
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = make_cache(clock, maxsize=2)
+    cache.put("cat", "first question", "1", 1.0)
+    cache.put("cat", "second question", "2", 1.0)
+    cache.get("cat", "first question")
+    cache.put("cat", "third question", "3", 1.0)
+    assert cache.get("cat", "second question") is None
+    assert cache.get("cat", "first question").content == "1"
+    assert cache.stats()["minions"]["cat"]["evictions"] == 1
+
+
+def test_disabled_cache_and_minions_store_nothing(clock):
+    cache = make_cache(clock, disabled_minions=["email"])
+    cache.put("email", "q", "a", 1.0)
+    assert cache.get("email", "q") is None
+    off = make_cache(clock, enabled=False)
+    off.put("cat", "q", "a", 1.0)
+    assert off.get("cat", "q") is None
@@ -0,0 +1,41 @@
+from orchestrator.routing_cache import RoutingCache
+
+
+def test_hit_on_the_normalized_question(clock):
+    cache = RoutingCache(clock=clock)
+    cache.put("Tell me about DOGS!", "dog minion")
+    assert cache.get("tell me about dogs") == "dog minion"
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = RoutingCache(ttl=60, clock=clock)
+    cache.put("q", "cat minion")
+    clock.advance(59)
+    assert cache.get("q") == "cat minion"
+    clock.advance(1)
+    assert cache.get("q") is None
+
+
+def test_put_restarts_the_ttl(clock):
+    cache = RoutingCache(ttl=60, clock=clock)
+    cache.put("q", "cat minion")
+    clock.advance(50)
+    cache.put("q", "dog minion")
+    clock.advance(50)
+    assert cache.get("q") == "dog minion"
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = RoutingCache(maxsize=2, clock=clock)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+
+def test_zero_size_cache_stores_nothing(clock):
+    cache = RoutingCache(maxsize=0, clock=clock)
+    cache.put("q", "cat minion")
+    assert cache.get("q") is None